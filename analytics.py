@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+# analytics.py
+# วิเคราะห์ trade journal ทั้งหมด (NumPy, ไม่วน Python ต่อ trade)
+# - rolling ต่อ N trade ล่าสุด: win rate, expectancy, Sharpe, drawdown (cumsum / maximum.accumulate)
+# - ต่อ trade: MAE / MFE จากแท่งใน HistoryStore ช่วงถือ position (reduceat)
+# - แยก PnL ตาม reason (TP_upper / TP_lower / BE / SL / TP_mid_trend_flip / ...) และตาม volatility regime ตอนเข้า
+# - walk-forward: สรุปต่อเดือน (ดูว่า edge คงที่หรือเสื่อม)
+#
+# usage:
+#   python analytics.py [journal.db] [--window 50] [--out report.txt] [--tg]
+#                       [--data data --symbol BTC/USDT:USDT --tf 30m]
+
+import time, argparse, logging
+from datetime import datetime, timezone
+import numpy as np
+
+from candles import tf_seconds
+
+log = logging.getLogger("main")
+
+WINDOW = 50                   # rolling window (จำนวน trade)
+VOL_BARS = 48                 # realized vol ก่อนเข้า = std ของ log return N แท่ง
+REGIMES = ("low", "mid", "high")
+REASON_ORDER = ("TP_upper", "TP_lower", "TP_mid_trend_flip", "BE", "SL")
+
+# ============================================================
+# Load
+# ============================================================
+def load(journal, start=0, end=None):
+    """trade ทั้งหมดเป็น array ต่อคอลัมน์ (เรียงตามเวลาปิด)"""
+    _, rows = journal.trade_rows(start, end)
+    c = list(zip(*rows)) if rows else [()] * 9
+    t = {
+        "ts": np.array(c[0], dtype=np.float64),
+        "opened": np.array(c[1], dtype=np.float64),        # None -> NaN (trade เก่าก่อนมีคอลัมน์)
+        "symbol": np.array([s or "" for s in c[2]], dtype=object),
+        "side": np.array([1 if s == "LONG" else -1 for s in c[3]], dtype=np.int8),
+        "entry": np.array(c[4], dtype=np.float64),
+        "exit": np.array(c[5], dtype=np.float64),
+        "qty": np.array(c[6], dtype=np.float64),
+        "pnl": np.array(c[7], dtype=np.float64),
+        "reason": np.array(c[8], dtype=object),
+    }
+    notional = t["entry"] * t["qty"]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        t["ret"] = np.where(notional > 0, t["pnl"] / notional, 0.0)
+    return t
+
+# ============================================================
+# Metrics
+# ============================================================
+def _rolling_sum(x, w):
+    cs = np.concatenate(([0.0], np.cumsum(x)))
+    i = np.arange(1, len(x) + 1)
+    lo = np.maximum(0, i - w)
+    return cs[i] - cs[lo], i - lo
+
+def per_year(ts):
+    # จำนวน trade ต่อปี (ใช้ annualize Sharpe)
+    if len(ts) < 2 or ts[-1] <= ts[0]:
+        return float(len(ts))
+    return len(ts) / ((ts[-1] - ts[0]) / (365 * 86400))
+
+def sharpe(ret, n_year):
+    if len(ret) < 2:
+        return 0.0
+    sd = ret.std(ddof=1)
+    return float(ret.mean() / sd * np.sqrt(n_year)) if sd > 0 else 0.0
+
+def drawdown(pnl):
+    # equity (USDT สะสม) -> drawdown ณ แต่ละ trade (<= 0)
+    eq = np.cumsum(pnl)
+    peak = np.maximum.accumulate(np.concatenate(([0.0], eq)))[1:]
+    return eq - peak
+
+def rolling(t, window=WINDOW):
+    """ค่า ณ แต่ละ trade จาก window trade ล่าสุด"""
+    pnl, ret = t["pnl"], t["ret"]
+    wins, n = _rolling_sum((pnl > 0).astype(np.float64), window)
+    s, _ = _rolling_sum(pnl, window)
+    r1, _ = _rolling_sum(ret, window)
+    r2, _ = _rolling_sum(ret * ret, window)
+    mean = r1 / n
+    with np.errstate(invalid="ignore", divide="ignore"):
+        var = np.maximum(r2 - n * mean * mean, 0.0) / np.maximum(n - 1, 1)
+        sr = np.where((n > 1) & (var > 0), mean / np.sqrt(var), 0.0) * np.sqrt(per_year(t["ts"]))
+    # drawdown ภายใน window: equity เทียบ peak ของ window (sliding max ผ่าน stride)
+    eq = np.concatenate(([0.0], np.cumsum(pnl)))
+    dd = np.zeros(len(pnl))
+    if len(pnl):
+        w = min(window, len(pnl)) + 1
+        pad = np.concatenate((np.full(w - 1, eq[0]), eq))
+        peak = np.lib.stride_tricks.sliding_window_view(pad, w).max(axis=1)[1:]
+        dd = eq[1:] - peak
+    return {"win_rate": wins / n, "expectancy": s / n, "sharpe": sr, "drawdown": dd}
+
+def summary(t):
+    pnl = t["pnl"]
+    n = len(pnl)
+    if not n:
+        return {"trades": 0}
+    win, loss = pnl[pnl > 0], pnl[pnl < 0]
+    dd = drawdown(pnl)
+    i_dd = int(np.argmin(dd))
+    # แพ้ติดกันนานสุด: ความยาว run ของ pnl <= 0
+    lose = np.concatenate(([0], (pnl <= 0).astype(np.int8), [0]))
+    edges = np.flatnonzero(np.diff(lose))
+    streak = int((edges[1::2] - edges[::2]).max()) if len(edges) else 0
+    return {
+        "trades": n,
+        "win_rate": float(len(win) / n),
+        "pnl": float(pnl.sum()),
+        "expectancy": float(pnl.mean()),
+        "avg_win": float(win.mean()) if len(win) else 0.0,
+        "avg_loss": float(loss.mean()) if len(loss) else 0.0,
+        "profit_factor": float(win.sum() / -loss.sum()) if len(loss) else float("inf"),
+        "sharpe": sharpe(t["ret"], per_year(t["ts"])),
+        "max_drawdown": float(dd[i_dd]),
+        "max_drawdown_ts": float(t["ts"][i_dd]),
+        "max_losing_streak": streak,
+    }
+
+def group(t, keys, labels=None):
+    # สรุปต่อกลุ่ม (bincount): trades / wins / pnl / expectancy
+    pnl = t["pnl"]
+    uniq, inv = np.unique(keys, return_inverse=True)
+    cnt = np.bincount(inv, minlength=len(uniq))
+    tot = np.bincount(inv, weights=pnl, minlength=len(uniq))
+    wins = np.bincount(inv, weights=(pnl > 0), minlength=len(uniq))
+    out = {}
+    for k, c, p, w in zip(uniq.tolist(), cnt.tolist(), tot.tolist(), wins.tolist()):
+        name = labels[k] if labels is not None else k
+        out[name] = {"trades": c, "pnl": p, "win_rate": w / c, "expectancy": p / c}
+    return out
+
+def by_reason(t):
+    g = group(t, t["reason"].astype(str)) if len(t["pnl"]) else {}
+    order = [r for r in REASON_ORDER if r in g] + sorted(r for r in g if r not in REASON_ORDER)
+    return {r: g[r] for r in order}
+
+def walk_forward(t):
+    # ต่อเดือน (UTC): trades / pnl / win rate / Sharpe ภายในเดือน
+    if not len(t["pnl"]):
+        return {}
+    m = t["ts"].astype(np.int64).astype("datetime64[s]").astype("datetime64[M]")
+    uniq, inv = np.unique(m, return_inverse=True)
+    k = len(uniq)
+    cnt = np.bincount(inv, minlength=k)
+    r1 = np.bincount(inv, weights=t["ret"], minlength=k)
+    r2 = np.bincount(inv, weights=t["ret"] ** 2, minlength=k)
+    g = group(t, inv, [str(u) for u in uniq])
+    mean = r1 / cnt
+    var = np.maximum(r2 - cnt * mean * mean, 0.0) / np.maximum(cnt - 1, 1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sr = np.where((cnt > 1) & (var > 0), mean / np.sqrt(var), 0.0) * np.sqrt(per_year(t["ts"]))
+    for name, s in zip(g, sr.tolist()):
+        g[name]["sharpe"] = s
+    return g
+
+# ============================================================
+# Market context (HistoryStore)
+# ============================================================
+def _symbols(t, symbol):
+    return np.where(t["symbol"] == "", symbol or "", t["symbol"])
+
+def excursions(t, hist, tf, symbol=None):
+    """MAE / MFE ต่อ trade (สัดส่วนของราคาเข้า, >= 0) จาก high/low ของแท่ง tf ที่คาบช่วงถือ position
+    trade ที่ไม่มีเวลาเปิดหรือไม่มี history -> NaN"""
+    n = len(t["pnl"])
+    mae, mfe = np.full(n, np.nan), np.full(n, np.nan)
+    if hist is None or not n:
+        return mae, mfe
+    tf_ms = tf_seconds(tf) * 1000
+    syms = _symbols(t, symbol)
+    for sym in np.unique(syms):
+        cols = hist.columns(sym, tf) if sym else None
+        sel = np.flatnonzero((syms == sym) & ~np.isnan(t["opened"]))
+        if cols is None or not len(sel):
+            continue
+        ts = cols["ts"]
+        a = np.searchsorted(ts, t["opened"][sel] * 1000 - tf_ms, side="right")
+        b = np.searchsorted(ts, t["ts"][sel] * 1000, side="right")
+        ok = b > a
+        sel, a, b = sel[ok], a[ok], b[ok]
+        if not len(sel):
+            continue
+        # reduceat บนคู่ [a, b) สลับกัน: ผลตำแหน่งคู่ = min/max ของช่วง (ต่อ sentinel ท้ายให้ b == len ได้)
+        lo = np.append(np.asarray(cols["low"]), np.inf)
+        hi = np.append(np.asarray(cols["high"]), -np.inf)
+        idx = np.column_stack((a, b)).ravel()
+        low, high = np.minimum.reduceat(lo, idx)[::2], np.maximum.reduceat(hi, idx)[::2]
+        e, side = t["entry"][sel], t["side"][sel]
+        up, down = (high - e) / e, (e - low) / e
+        mae[sel] = np.maximum(np.where(side > 0, down, up), 0.0)
+        mfe[sel] = np.maximum(np.where(side > 0, up, down), 0.0)
+    return mae, mfe
+
+def volatility(t, hist, tf, symbol=None, bars=VOL_BARS):
+    """realized vol (std ของ log return, bars แท่ง) ณ ตอนเปิด position (ไม่รู้เวลาเปิด -> เวลาปิด)"""
+    n = len(t["pnl"])
+    vol = np.full(n, np.nan)
+    if hist is None or not n:
+        return vol
+    tf_ms = tf_seconds(tf) * 1000
+    at = np.where(np.isnan(t["opened"]), t["ts"], t["opened"]) * 1000
+    syms = _symbols(t, symbol)
+    for sym in np.unique(syms):
+        cols = hist.columns(sym, tf) if sym else None
+        if cols is None or len(cols["ts"]) <= bars:
+            continue
+        sel = np.flatnonzero(syms == sym)
+        r = np.diff(np.log(np.asarray(cols["close"])))
+        s1, s2 = (np.concatenate(([0.0], np.cumsum(x))) for x in (r, r * r))
+        # แท่งที่ปิดก่อนเวลาเข้า: open_ts + tf <= at -> return index j = แท่ง j+1
+        k = np.searchsorted(cols["ts"], at[sel] - tf_ms, side="right") - 1
+        ok = k >= bars
+        j = k[ok]
+        m = (s1[j] - s1[j - bars]) / bars
+        vol[sel[ok]] = np.sqrt(np.maximum((s2[j] - s2[j - bars]) / bars - m * m, 0.0))
+    return vol
+
+def regimes(vol):
+    # tercile ของ vol ตอนเข้า -> 0 low / 1 mid / 2 high, -1 = ไม่มีข้อมูล
+    out = np.full(len(vol), -1)
+    ok = ~np.isnan(vol)
+    if ok.sum() >= 3:
+        q = np.quantile(vol[ok], [1 / 3, 2 / 3])
+        out[ok] = np.digitize(vol[ok], q)
+    return out
+
+# ============================================================
+# Report
+# ============================================================
+def analyze(journal, hist=None, tf="30m", symbol=None, window=WINDOW, start=0, end=None):
+    t = load(journal, start, end)
+    out = {"summary": summary(t), "by_reason": by_reason(t), "periods": walk_forward(t)}
+    if not len(t["pnl"]):
+        return out
+    roll = rolling(t, window)
+    out["rolling"] = {k: float(v[-1]) for k, v in roll.items()}
+    out["rolling"]["window"] = min(window, len(t["pnl"]))
+    mae, mfe = excursions(t, hist, tf, symbol)
+    ok = ~np.isnan(mae)
+    if ok.any():
+        w = ok & (t["pnl"] > 0)
+        l = ok & (t["pnl"] <= 0)
+        avg = lambda x, m: float(x[m].mean() * 100) if m.any() else 0.0
+        out["excursion"] = {"trades": int(ok.sum()), "mae_pct": avg(mae, ok), "mfe_pct": avg(mfe, ok),
+                            "mae_pct_win": avg(mae, w), "mae_pct_loss": avg(mae, l),
+                            "mfe_pct_win": avg(mfe, w), "mfe_pct_loss": avg(mfe, l)}
+    reg = regimes(volatility(t, hist, tf, symbol))
+    if (reg >= 0).any():
+        sel = reg >= 0
+        sub = {k: v[sel] for k, v in t.items()}
+        out["by_regime"] = group(sub, reg[sel], REGIMES)
+    return out
+
+def _fmt_group(g):
+    return [f"  {k:<18} n={v['trades']:<5} win={v['win_rate'] * 100:5.1f}% Σ={v['pnl']:+.2f} E={v['expectancy']:+.2f}"
+            for k, v in g.items()]
+
+def render(a, periods=12):
+    s = a["summary"]
+    if not s["trades"]:
+        return "📊 Analytics: ยังไม่มี trade"
+    dd_at = datetime.fromtimestamp(s["max_drawdown_ts"], timezone.utc).strftime("%Y-%m-%d")
+    lines = [
+        f"📊 Analytics ({s['trades']} trades)",
+        f"Σ PnL {s['pnl']:+.2f}  win {s['win_rate'] * 100:.1f}%  E {s['expectancy']:+.2f}  PF {s['profit_factor']:.2f}",
+        f"avg win {s['avg_win']:+.2f}  avg loss {s['avg_loss']:+.2f}  Sharpe {s['sharpe']:.2f}",
+        f"max DD {s['max_drawdown']:.2f} ({dd_at})  losing streak {s['max_losing_streak']}",
+    ]
+    r = a.get("rolling")
+    if r:
+        lines.append(f"last {r['window']}: win {r['win_rate'] * 100:.1f}%  E {r['expectancy']:+.2f}"
+                     f"  Sharpe {r['sharpe']:.2f}  DD {r['drawdown']:.2f}")
+    x = a.get("excursion")
+    if x:
+        lines.append(f"MAE {x['mae_pct']:.2f}% (win {x['mae_pct_win']:.2f} / loss {x['mae_pct_loss']:.2f})"
+                     f"  MFE {x['mfe_pct']:.2f}% (win {x['mfe_pct_win']:.2f} / loss {x['mfe_pct_loss']:.2f})")
+    lines.append("by reason:")
+    lines += _fmt_group(a["by_reason"])
+    if a.get("by_regime"):
+        lines.append("by volatility regime (ตอนเข้า):")
+        lines += _fmt_group(a["by_regime"])
+    if a["periods"]:
+        lines.append("by month:")
+        p = dict(list(a["periods"].items())[-periods:])
+        lines += [l + f" SR={v['sharpe']:.2f}" for l, v in zip(_fmt_group(p), p.values())]
+    return "\n".join(lines)
+
+def write_report(text, path=None, send=None):
+    # ลงไฟล์ (แทนที่ของเดิม) และ/หรือส่งผ่าน send(text) เช่น main.tg
+    if path:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    if send:
+        send(text)
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="trade journal analytics")
+    ap.add_argument("journal", nargs="?", default="journal.db")
+    ap.add_argument("--window", type=int, default=WINDOW)
+    ap.add_argument("--data", help="HistoryStore dir (MAE/MFE + volatility regime)")
+    ap.add_argument("--symbol", default="BTC/USDT:USDT", help="symbol ของ trade ที่ไม่ได้บันทึก symbol")
+    ap.add_argument("--tf", default="30m")
+    ap.add_argument("--out", help="เขียน report ลงไฟล์")
+    ap.add_argument("--tg", action="store_true", help="ส่ง report ทาง Telegram (config ใน main.py)")
+    a = ap.parse_args(argv)
+    from journal import Journal
+    from history import HistoryStore
+    j = Journal(a.journal)
+    t0 = time.perf_counter()
+    res = analyze(j, HistoryStore(a.data) if a.data else None, a.tf, a.symbol, a.window)
+    text = render(res)
+    print(text)
+    print(f"({time.perf_counter() - t0:.3f}s)")
+    send = None
+    if a.tg:
+        import main as bot
+        send = bot.tg
+    write_report(text, a.out, send)
+    if send and bot._notifier:
+        bot._notifier.close()
+    j.close()
+
+if __name__ == "__main__":
+    main()
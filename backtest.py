@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+# backtest.py
+# Deterministic bar-by-bar backtest ของ NW + MACD + EMA โดยใช้ NWStrategy ตัวเดียวกับ live
+# - TF หลัก (30m) + TF ย่อย (5m): decision ทุกครั้งที่แท่ง 5m ปิด (แทน loop 10s)
+# - NW band ณ เวลาใดๆ = แท่ง 30m ที่ปิดแล้ว + แท่งที่กำลังก่อตัว (close = 5m close) แบบเดียวกับ live repaint
+#   -> precompute แบบ vectorized (convolution) ครั้งเดียว
+# - SL/TP เป็น exchange stop: ตรวจด้วย high/low ของแท่ง 5m (ถ้าโดนทั้งคู่ในแท่งเดียว ถือว่า SL ก่อน)
+# - fee + slippage, ledger schema เดียวกับ stats["trades"]
+#
+# usage: python backtest.py data/BTCUSDT_30m data/BTCUSDT_5m   (HistoryStore dir หรือ .npy/.csv)
+
+import os, sys, time, logging
+from datetime import datetime, timezone
+import numpy as np
+
+import nwe
+from candles import tf_seconds
+from indicators import EMA, MACD
+from strategy import NWStrategy
+
+log = logging.getLogger("main")
+
+TAKER_FEE = 0.0004
+SLIPPAGE = 0.0001          # adverse fraction ต่อ fill
+LIVE_BUFFER = 600          # จำนวนแท่ง TF หลักที่ live ถือไว้ (CandleStore) -> window NW
+
+def default_params():
+    # ค่าเริ่มต้นจาก config ใน main.py (single source of truth)
+    import main as cfg
+    return {
+        "timeframe": cfg.TIMEFRAME, "small_tf": cfg.MACD_TF,
+        "nw_bandwidth": cfg.NW_BANDWIDTH, "nw_mult": cfg.NW_MULT, "nw_factor": cfg.NW_FACTOR,
+        "update_fraction": cfg.UPDATE_FRACTION,
+        "tp_buffer": cfg.TP_BUFFER, "sl_distance": cfg.SL_DISTANCE,
+        "breakeven_offset": cfg.BREAKEVEN_OFFSET, "use_breakeven": cfg.USE_BREAKEVEN,
+        "use_breakeven_macd": cfg.USE_BREAKEVEN_MACD,
+        "ema_enabled": cfg.EMA_ENABLED, "ema_fast": cfg.EMA_FAST, "ema_slow": cfg.EMA_SLOW,
+        "macd_enabled": cfg.MACD_ENABLED,
+        "leverage": cfg.LEVERAGE, "margin_fraction": cfg.POSITION_MARGIN_FRACTION,
+        "balance": 1000.0, "fee": TAKER_FEE, "slippage": SLIPPAGE,
+    }
+
+def load_ohlcv(path):
+    if os.path.isdir(path):
+        from history import load_dir     # directory ของ HistoryStore
+        return load_dir(path)
+    if str(path).endswith(".npy"):
+        return np.load(path, mmap_mode="r")
+    return np.loadtxt(path, delimiter=",", ndmin=2, comments="#")
+
+# ============================================================
+# Vectorized precompute
+# ============================================================
+def nw_forming_parts(c_main, h, mult, factor, buffer=LIVE_BUFFER):
+    """ส่วนของ NW ที่ขึ้นกับแท่งที่ปิดแล้วเท่านั้น ต่อ index แท่งที่กำลังก่อตัว j (NWEngine.forming):
+    mid(j, c) = (c * coef0 + S[j]) / den,  mae[j]"""
+    return nwe.NWEngine(h, mult, factor, max_win=min(nwe.MAX_WIN, buffer - 1)).forming(c_main)
+
+def ema_closed(c_main, period):
+    # ema_prev[j] = EMA ของแท่ง 0..j-1 (ปิดแล้ว), None ถ้ายังไม่พอ
+    e = EMA(period)
+    out = [None] * len(c_main)
+    for j in range(1, len(c_main)):
+        out[j] = e.update(c_main[j - 1])
+    return out
+
+def macd_closed(c_small):
+    # macd_at[k] = macd() ของแท่ง 0..k (k ปิดแล้ว)
+    m = MACD()
+    return [m.update(v) for v in c_small]
+
+# ============================================================
+# Engine
+# ============================================================
+def run(main_ohlcv, small_ohlcv, params=None, nw_parts=None, indicators=None):
+    """main_ohlcv / small_ohlcv: array (N, 6) [ts_ms, o, h, l, c, v]
+    คืน {"trades": [...], "equity": np.array, "summary": {...}}"""
+    p = default_params()
+    p.update(params or {})
+    main_ohlcv = np.asarray(main_ohlcv, dtype=np.float64)
+    small_ohlcv = np.asarray(small_ohlcv, dtype=np.float64)
+    tf_small_ms = tf_seconds(p["small_tf"]) * 1000
+
+    ts_main = main_ohlcv[:, 0]
+    c_main = main_ohlcv[:, 4]
+    if nw_parts is None:
+        nw_parts = nw_forming_parts(c_main, p["nw_bandwidth"], p["nw_mult"], p["nw_factor"])
+    S, mae, coef0, den, warm = nw_parts
+    if indicators is None:
+        indicators = {}
+    if p["ema_enabled"] and "ema" not in indicators:
+        indicators["ema"] = (ema_closed(c_main, p["ema_fast"]), ema_closed(c_main, p["ema_slow"]))
+    if (p["macd_enabled"] or p["use_breakeven_macd"]) and "macd" not in indicators:
+        indicators["macd"] = macd_closed(small_ohlcv[:, 4].tolist())
+    ema_f, ema_s = indicators.get("ema", (None, None))
+    macd_at = indicators.get("macd")
+    kf, ks = 2 / (p["ema_fast"] + 1), 2 / (p["ema_slow"] + 1)
+
+    # map แท่งย่อย k -> index แท่งหลักที่กำลังก่อตัว ณ เวลาปิดของ k
+    close_t = small_ohlcv[:, 0] + tf_small_ms
+    jmap = (np.searchsorted(ts_main, close_t, side="right") - 1).tolist()
+    S_l, mae_l = S.tolist(), mae.tolist()
+    ts_l = close_t.tolist()
+    o_l, h_l, l_l, c_l = (small_ohlcv[:, i].tolist() for i in (1, 2, 3, 4))
+
+    strat = NWStrategy(
+        tp_buffer=p["tp_buffer"], sl_distance=p["sl_distance"], breakeven_offset=p["breakeven_offset"],
+        use_breakeven=p["use_breakeven"], use_breakeven_macd=p["use_breakeven_macd"],
+        ema_enabled=p["ema_enabled"], macd_enabled=p["macd_enabled"], client_stops=False,
+        freeze_sec=tf_seconds(p["timeframe"]) * p["update_fraction"],
+    )
+    fee, slip = p["fee"], p["slippage"]
+    lev, frac = p["leverage"], p["margin_fraction"]
+    balance = p["balance"]
+    qty = 0.0
+    entry_fill = 0.0
+    entry_fee = 0.0
+    trades = []
+    equity = np.full(len(c_l), np.nan)
+
+    def close_fill(act, px, t):
+        nonlocal balance, qty
+        pos = act["position"]
+        long = pos["side"] == "long"
+        fill = px * (1 - slip) if long else px * (1 + slip)
+        gross = (fill - entry_fill) * qty if long else (entry_fill - fill) * qty
+        f = fill * qty * fee
+        balance += gross - f
+        trades.append({
+            "time": datetime.fromtimestamp(t / 1000, timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+            "side": pos["side"].upper(), "entry": entry_fill, "exit": fill,
+            "pnl": gross - f - entry_fee, "reason": act["reason"],
+        })
+        qty = 0.0
+
+    for k in range(len(c_l)):
+        j = jmap[k]
+        t = ts_l[k]
+        c = c_l[k]
+
+        # 1) resting SL/TP บน exchange: ตรวจด้วย high/low ของแท่งนี้
+        pos = strat.position
+        if pos is not None and qty > 0:
+            o, hi, lo = o_l[k], h_l[k], l_l[k]
+            sl, tp = pos["sl"], pos["tp"]
+            if pos["side"] == "long":
+                if lo <= sl:
+                    close_fill(strat.on_stop_fill("SL", min(o, sl)), min(o, sl), t)
+                elif tp is not None and hi >= tp:
+                    close_fill(strat.on_stop_fill("TP", max(o, tp)), max(o, tp), t)
+            else:
+                if hi >= sl:
+                    close_fill(strat.on_stop_fill("SL", max(o, sl)), max(o, sl), t)
+                elif tp is not None and lo <= tp:
+                    close_fill(strat.on_stop_fill("TP", min(o, tp)), min(o, tp), t)
+
+        if j < warm:
+            continue
+        now = t / 1000
+
+        # 2) decision ตอนแท่งย่อยปิด
+        trend = None
+        if ema_f is not None:
+            ef, es = ema_f[j], ema_s[j]
+            if ef is None or es is None:
+                continue
+            trend = "BUY" if c * kf + ef * (1 - kf) > c * ks + es * (1 - ks) else "SELL"
+        if strat.band_due(now):
+            m = (c * coef0 + S_l[j]) / den
+            a = mae_l[j]
+            strat.set_band(m + a, m - a, m, now)
+        mac = macd_at[k] if macd_at is not None else None
+
+        for act in strat.step(now, c, qty, c, trend, mac, mac):
+            typ = act["type"]
+            if typ == "open":
+                long = act["side"] == "long"
+                fill = c * (1 + slip) if long else c * (1 - slip)
+                q = int(balance * frac * lev / fill * 1000) / 1000
+                if q <= 0:
+                    strat.position = None
+                    continue
+                qty, entry_fill = q, fill
+                entry_fee = fill * q * fee
+                balance -= entry_fee
+                strat.position["qty"] = q
+            elif typ == "close":
+                close_fill(act, c, t)
+        if qty:
+            pos = strat.position
+            unreal = (c - entry_fill) * qty if pos["side"] == "long" else (entry_fill - c) * qty
+            equity[k] = balance + unreal
+        else:
+            equity[k] = balance
+
+    return {"trades": trades, "equity": equity, "summary": summarize(trades, equity, p["balance"])}
+
+def summarize(trades, equity, start_balance):
+    pnl = np.array([t["pnl"] for t in trades]) if trades else np.zeros(0)
+    eq = equity[~np.isnan(equity)]
+    dd = float((np.maximum.accumulate(eq) - eq).max()) if len(eq) else 0.0
+    return {
+        "trades": len(trades),
+        "win_rate": float((pnl > 0).mean()) if len(pnl) else 0.0,
+        "pnl": float(pnl.sum()),
+        "return": float(pnl.sum() / start_balance),
+        "max_drawdown": dd,
+        "by_reason": {r: sum(1 for t in trades if t["reason"] == r) for r in sorted({t["reason"] for t in trades})},
+    }
+
+if __name__ == "__main__":
+    logging.getLogger("main").setLevel(logging.WARNING)
+    if len(sys.argv) < 3:
+        print("usage: python backtest.py MAIN_TF_OHLCV SMALL_TF_OHLCV")
+        sys.exit(1)
+    t0 = time.time()
+    res = run(load_ohlcv(sys.argv[1]), load_ohlcv(sys.argv[2]))
+    s = res["summary"]
+    print(f"trades={s['trades']} win={s['win_rate']:.1%} pnl={s['pnl']:+.2f} "
+          f"maxDD={s['max_drawdown']:.2f} by_reason={s['by_reason']} ({time.time() - t0:.2f}s)")
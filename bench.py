@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+# bench.py
+# Benchmark indicators + decision loop, เทียบ baseline บน disk (regression gate)
+# - fixture: synthetic random walk (default) หรือ candle จริง (HistoryStore dir / .npy / .csv)
+# - วัด: เวลา/call (median ของ repeat รอบ), throughput ต่อแท่ง, peak memory (tracemalloc, รันแยก)
+# - กัน noise: วัดทุก case สลับกัน runs รอบ (interleaved) แล้วใช้ median, threshold ต่อ case ไม่ต่ำกว่า
+#   spread ที่วัดได้ × NOISE_MULT, ต่างกันไม่ถึง NOISE_FLOOR_US ไม่นับ, case ที่เกินต้องเกินซ้ำอีก
+#   CONFIRM รอบ (วัดใหม่) ถึงจะนับเป็น regression
+# - variant เก่า (main.py (ema), main.py smc fibo✅): ดึงเฉพาะ function + ค่าคงที่ผ่าน ast
+#   (ไม่ import ทั้งไฟล์ -> ไม่มี side effect / ไม่ต้องมี API key)
+# - loop: SymbolBot.tick() 1 รอบ บน FakeExchange
+#
+# usage:
+#   python bench.py                      # เทียบกับ bench_baseline.json, exit 1 ถ้าช้าลงเกิน threshold
+#   python bench.py --save               # บันทึก baseline ใหม่
+#   python bench.py --fixture data/BTCUSDT_30m --only nw macd
+
+import ast, argparse, gc, json, logging, os, sys, time, tracemalloc
+import numpy as np
+
+BASELINE_FILE = "bench_baseline.json"
+THRESHOLD = 0.25             # ช้าลง / ใช้ memory มากขึ้นเกิน 25% = regression
+NOISE_MULT = 3.0             # threshold ต่อ case >= spread (relative) × นี้
+NOISE_FLOOR_US = 2.0         # ต่างกันน้อยกว่านี้ (us/call) ไม่นับ (ระดับ timer / cache)
+RUNS = 3                     # รอบวัดสลับกันทุก case
+CONFIRM = 2                  # case ที่ช้าลงต้องช้าซ้ำในการวัดใหม่ทุกครั้ง
+HERE = os.path.dirname(os.path.abspath(__file__))
+VARIANTS = {"ema": "main.py (ema)", "smc": "main.py smc fibo✅"}
+
+# ============================================================
+# Fixtures
+# ============================================================
+def synthetic(n=5000, seed=0, start=30000.0, tf_ms=1_800_000):
+    rnd = np.random.default_rng(seed)
+    c = start * np.exp(np.cumsum(rnd.normal(0, 0.004, n)))
+    o = np.concatenate(([start], c[:-1]))
+    h = np.maximum(o, c) * (1 + np.abs(rnd.normal(0, 0.002, n)))
+    l = np.minimum(o, c) * (1 - np.abs(rnd.normal(0, 0.002, n)))
+    ts = (np.arange(n) * tf_ms).astype(np.float64)
+    return np.column_stack([ts, o, h, l, c, rnd.uniform(1, 100, n)])
+
+def load_fixture(path=None):
+    if path is None:
+        return synthetic()
+    import backtest
+    return np.asarray(backtest.load_ohlcv(path), dtype=np.float64)
+
+def load_variant(name, names):
+    # ดึง def + ค่าคงที่ (literal) ระดับ module จากไฟล์ variant
+    path = os.path.join(HERE, VARIANTS[name])
+    tree = ast.parse(open(path, encoding="utf-8").read(), path)
+    keep = []
+    for node in tree.body:
+        if isinstance(node, ast.FunctionDef) and node.name in names:
+            keep.append(node)
+        elif isinstance(node, ast.Assign) and all(isinstance(t, ast.Name) and t.id.isupper() for t in node.targets):
+            try:
+                ast.literal_eval(node.value)
+                keep.append(node)
+            except ValueError:
+                pass
+    ns = {}
+    exec(compile(ast.Module(body=keep, type_ignores=[]), path, "exec"), ns)
+    return ns
+
+# ============================================================
+# Cases: name -> (setup(ohlcv) -> (fn, bars_per_call))
+# ============================================================
+def _closes(ohlcv, n):
+    return ohlcv[-n:, 4].tolist()
+
+def case_nw_repaint(ohlcv):
+    import main
+    closes = _closes(ohlcv, 600)
+    return lambda: main.nwe_luxalgo_repaint(closes), 1
+
+def case_nw_reference(ohlcv):
+    import nwe, main
+    closes = _closes(ohlcv, 600)
+    return lambda: nwe.nwe_reference(closes, main.NW_BANDWIDTH, main.NW_MULT, main.NW_FACTOR), 1
+
+def case_nw_batch(ohlcv):
+    import nwe, main
+    c = ohlcv[:, 4]
+    eng = nwe.NWEngine(main.NW_BANDWIDTH, main.NW_MULT, main.NW_FACTOR)
+    return lambda: eng.batch(c), len(c)
+
+def case_macd_main(ohlcv):
+    import main
+    closes = _closes(ohlcv, 200)
+    return lambda: main.macd(closes), 1
+
+def case_macd_stream(ohlcv):
+    from indicators import MACD
+    closes = ohlcv[:, 4].tolist()
+    def run():
+        m = MACD()
+        for v in closes:
+            m.update(v)
+    return run, len(closes)
+
+def case_macd_variant_ema(ohlcv):
+    f = load_variant("ema", {"ema_series", "macd_from_closes"})["macd_from_closes"]
+    closes = _closes(ohlcv, 200)
+    return lambda: f(closes), 1
+
+def case_macd_variant_smc(ohlcv):
+    f = load_variant("smc", {"ema_series", "macd_from_closes"})["macd_from_closes"]
+    closes = _closes(ohlcv, 200)
+    return lambda: f(closes), 1
+
+def case_ema_main(ohlcv):
+    import main
+    closes = _closes(ohlcv, 600)
+    return lambda: main.ema(closes, main.EMA_SLOW), 1
+
+def case_ema_stream(ohlcv):
+    from indicators import EMA
+    closes = ohlcv[:, 4].tolist()
+    def run():
+        e = EMA(100)
+        for v in closes:
+            e.update(v)
+    return run, len(closes)
+
+def case_ema_variant_ema(ohlcv):
+    f = load_variant("ema", {"ema_series"})["ema_series"]
+    closes = _closes(ohlcv, 600)
+    return lambda: f(closes, 100), 1
+
+def case_ema_variant_smc(ohlcv):
+    f = load_variant("smc", {"ema_series"})["ema_series"]
+    closes = _closes(ohlcv, 600)
+    return lambda: f(closes, 100), 1
+
+def case_loop(ohlcv):
+    # 1 รอบ decision เต็ม (candles -> indicators -> NW -> position -> strategy) บน FakeExchange
+    import main
+    from fake_exchange import FakeExchange
+    from candles import CandleStore
+    from feed import RestFeed
+    from journal import Journal
+    sym = main.SYMBOL
+    rows = ohlcv[-700:].tolist()
+    now_ms = int(time.time() * 1000) // 1_800_000 * 1_800_000
+    shift = now_ms - int(rows[-1][0])
+    rows = [[r[0] + shift] + r[1:] for r in rows]
+    ex = FakeExchange()
+    ex.ohlcv[(sym, main.TIMEFRAME)] = rows
+    ex.set_price(sym, rows[-1][4])
+    store = CandleStore(ex)
+    store.backfill(sym, main.TIMEFRAME, 600)
+    bot = main.SymbolBot(ex, sym, store, RestFeed(ex, store, sym), Journal(":memory:"))
+    return bot.tick, 1
+
+CASES = {
+    "nw_repaint": case_nw_repaint, "nw_reference": case_nw_reference, "nw_batch": case_nw_batch,
+    "macd_main": case_macd_main, "macd_stream": case_macd_stream,
+    "macd_variant_ema": case_macd_variant_ema, "macd_variant_smc": case_macd_variant_smc,
+    "ema_main": case_ema_main, "ema_stream": case_ema_stream,
+    "ema_variant_ema": case_ema_variant_ema, "ema_variant_smc": case_ema_variant_smc,
+    "loop": case_loop,
+}
+
+# ============================================================
+# Measure
+# ============================================================
+def _time(fn, min_time, repeat):
+    # เวลา/call ของแต่ละรอบ (repeat รอบ, n call ต่อรอบ ให้รวมได้ราว min_time)
+    fn()                                        # warm-up (cache kernel ฯลฯ)
+    n, t = 1, 0.0
+    while True:                                 # หา n ที่ใช้เวลา >= min_time / repeat
+        t0 = time.perf_counter()
+        for _ in range(n):
+            fn()
+        t = time.perf_counter() - t0
+        if t >= min_time / repeat:
+            break
+        n *= 2
+    samples = [t / n]
+    gc.disable()
+    try:
+        for _ in range(repeat - 1):
+            t0 = time.perf_counter()
+            for _ in range(n):
+                fn()
+            samples.append((time.perf_counter() - t0) / n)
+    finally:
+        gc.enable()
+    return samples
+
+def _summary(samples, bars, peak):
+    med = float(np.median(samples))
+    q1, q3 = np.percentile(samples, [25, 75])
+    return {"us_per_call": med * 1e6, "bars_per_sec": bars / med if med else 0.0, "peak_kb": peak / 1024,
+            "spread": float((q3 - q1) / med) if med else 0.0}
+
+def run_cases(cases, min_time, runs=RUNS, repeat=7):
+    # วัดทุก case สลับกัน runs รอบ -> median ของทุก sample (drift ของเครื่องกระจายไปทุก case เท่าๆ กัน)
+    samples = {name: [] for name in cases}
+    peaks = {}
+    for _ in range(runs):
+        for name, (fn, bars) in cases.items():
+            samples[name] += _time(fn, min_time / runs, repeat)
+    for name, (fn, bars) in cases.items():
+        tracemalloc.start()
+        fn()
+        peaks[name] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return {name: _summary(samples[name], cases[name][1], peaks[name]) for name in cases}
+
+def compare(results, baseline, threshold=THRESHOLD):
+    # คืน list ของ regression: (case, metric, base, now)
+    bad = []
+    for name, r in results.items():
+        b = baseline.get(name)
+        if not b:
+            continue
+        for k in ("us_per_call", "peak_kb"):
+            if k not in b or b[k] <= 0:
+                continue
+            thr = threshold
+            if k == "us_per_call":
+                thr = max(threshold, NOISE_MULT * max(b.get("spread", 0.0), r.get("spread", 0.0)))
+                if r[k] - b[k] < NOISE_FLOOR_US:
+                    continue
+            if r[k] > b[k] * (1 + thr):
+                bad.append((name, k, b[k], r[k]))
+    return bad
+
+def confirm(bad, cases, baseline, threshold, min_time, rounds=CONFIRM):
+    # วัด case ที่เกินใหม่ rounds ครั้ง -> นับเฉพาะที่เกินทุกครั้ง
+    for _ in range(rounds):
+        names = sorted({name for name, k, _, _ in bad})
+        if not names:
+            break
+        again = run_cases({n: cases[n] for n in names}, min_time)
+        still = {(n, k) for n, k, _, _ in compare(again, baseline, threshold)}
+        bad = [(n, k, b, again[n][k]) for n, k, b, _ in bad if (n, k) in still]
+    return bad
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="indicator / loop benchmarks")
+    ap.add_argument("--fixture", help="HistoryStore dir / .npy / .csv (default: synthetic)")
+    ap.add_argument("--only", nargs="*", help=f"cases: {', '.join(CASES)}")
+    ap.add_argument("--baseline", default=BASELINE_FILE)
+    ap.add_argument("--save", action="store_true", help="เขียนผลเป็น baseline ใหม่")
+    ap.add_argument("--threshold", type=float, default=THRESHOLD)
+    ap.add_argument("--min-time", type=float, default=0.5, help="เวลาวัดต่อ case (sec, รวมทุก run)")
+    ap.add_argument("--runs", type=int, default=RUNS, help="รอบวัดสลับกันทุก case")
+    a = ap.parse_args(argv)
+    logging.getLogger("main").setLevel(logging.WARNING)
+
+    ohlcv = load_fixture(a.fixture)
+    names = a.only or list(CASES)
+    cases = {name: CASES[name](ohlcv) for name in names}
+    results = run_cases(cases, a.min_time, a.runs)
+    print(f"{'case':>18} | {'us/call':>12} | {'spread':>7} | {'bars/s':>12} | {'peak KB':>9}")
+    for name, r in results.items():
+        print(f"{name:>18} | {r['us_per_call']:>12.1f} | {r['spread']:>6.1%} | {r['bars_per_sec']:>12.0f} | "
+              f"{r['peak_kb']:>9.1f}")
+
+    if a.save:
+        base = json.load(open(a.baseline)) if os.path.exists(a.baseline) else {}
+        base.update(results)
+        json.dump(base, open(a.baseline, "w"), indent=2)
+        print(f"baseline saved -> {a.baseline}")
+        return 0
+    if not os.path.exists(a.baseline):
+        print(f"no baseline ({a.baseline}); run with --save first")
+        return 0
+    baseline = json.load(open(a.baseline))
+    bad = confirm(compare(results, baseline, a.threshold), cases, baseline, a.threshold, a.min_time)
+    for name, k, b, r in bad:
+        print(f"REGRESSION {name}.{k}: {b:.1f} -> {r:.1f} ({r / b - 1:+.0%})")
+    return 1 if bad else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+# boot.py
+# Cold start เร็ว: restart หลัง crash ต้องกลับมาดูแล position ให้เร็วที่สุด
+# - exchange_class(): import เฉพาะ ccxt.binanceusdm (ccxt/__init__ import ทุก exchange ในครั้งเดียว)
+# - MarketCache: market metadata (precision / limits / contractSize) ของ symbol ที่ใช้ + leverage ที่ตั้งแล้ว -> json
+#     อายุ < refresh_sec       -> ใช้ cache เลย
+#     refresh_sec .. ttl       -> ใช้ cache เลย + refresh เบื้องหลังด้วย client แยก (ไม่แย่ง session ของ loop)
+#     ไม่มี / ไม่ครบ / เกิน ttl -> load_markets() แล้วเขียน cache
+#   leverage ที่ cache ไว้ตรงกับที่ต้องการ (และยังไม่เกิน ttl) -> ข้าม set_leverage
+
+import importlib, importlib.util, json, logging, os, sys, threading, time, types
+
+log = logging.getLogger("main")
+
+def exchange_class(name="binanceusdm"):
+    # ccxt ถูก import เต็มไปแล้ว -> ใช้ของเดิม; ไม่งั้นใช้ package เปล่าชั่วคราวแทน ccxt/__init__ ระหว่าง import
+    mod = sys.modules.get(f"ccxt.{name}")
+    if mod is None and "ccxt" in sys.modules:
+        mod = importlib.import_module(f"ccxt.{name}")
+    if mod is None:
+        spec = importlib.util.find_spec("ccxt")
+        if spec is None:
+            raise ImportError("ccxt is not installed")
+        stub = types.ModuleType("ccxt")
+        stub.__path__ = list(spec.submodule_search_locations)
+        sys.modules["ccxt"] = stub
+        try:
+            mod = importlib.import_module(f"ccxt.{name}")
+        finally:
+            if sys.modules.get("ccxt") is stub:
+                del sys.modules["ccxt"]      # import ccxt ภายหลังได้ package จริง (submodule ที่โหลดแล้วใช้ต่อ)
+    return getattr(mod, name)
+
+class MarketCache:
+    def __init__(self, path, ttl=86400, refresh_sec=3600, clock=time.time):
+        self.path = path
+        self.ttl, self.refresh_sec = ttl, refresh_sec
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.data = self._read()      # {"ts", "markets": {symbol: market}, "leverage": {symbol: {"value", "ts"}}}
+        self.thread = None
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        with self.lock:
+            tmp = self.path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(self.data, f)
+            os.replace(tmp, self.path)
+
+    def age(self):
+        return self.clock() - self.data.get("ts", 0)
+
+    def store(self, markets, symbols):
+        self.data["markets"] = {s: markets[s] for s in symbols if s in markets}
+        self.data["ts"] = self.clock()
+        self.save()
+
+    def load(self, ex, symbols, factory=None):
+        """markets ของ symbols ลง ex -> แหล่งที่ใช้ ("cache" / "cache+refresh" / "network")"""
+        cached = self.data.get("markets") or {}
+        if all(s in cached for s in symbols) and self.age() < self.ttl:
+            ex.set_markets(cached)
+            if factory is None or self.age() < self.refresh_sec:
+                return "cache"
+            self.refresh(ex, symbols, factory)
+            return "cache+refresh"
+        ex.load_markets()
+        self.store(ex.markets, symbols)
+        return "network"
+
+    def refresh(self, ex, symbols, factory):
+        # client ใหม่ (public) โหลด markets แล้วสลับเข้า ex ทีเดียว
+        def run():
+            try:
+                fresh = factory()
+                fresh.load_markets()
+                ex.set_markets(fresh.markets, fresh.currencies)
+                self.store(fresh.markets, symbols)
+                log.info(f"[BOOT] market cache refreshed ({len(fresh.markets)} markets)")
+            except Exception as e:
+                log.warning(f"[BOOT] market cache refresh failed: {e}")
+        self.thread = threading.Thread(target=run, name="markets", daemon=True)
+        self.thread.start()
+
+    # ---------------- leverage ----------------
+    def leverage_ok(self, symbol, leverage):
+        e = (self.data.get("leverage") or {}).get(symbol)
+        return bool(e) and e["value"] == leverage and self.clock() - e["ts"] < self.ttl
+
+    def set_leverage(self, symbol, leverage):
+        self.data.setdefault("leverage", {})[symbol] = {"value": leverage, "ts": self.clock()}
+        self.save()
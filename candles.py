@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+# candles.py
+# Incremental OHLCV cache: ring buffer ต่อ (symbol, timeframe)
+# backfill ครั้งเดียวตอนเริ่ม แล้วดึงเฉพาะแท่งใหม่ (since=) + patch แท่งที่ยังไม่ปิด
+# derive(): TF ใหญ่สร้างจาก base TF (resample.py) แทนการดึงจาก exchange
+
+import time, logging
+from collections import deque
+
+log = logging.getLogger("main")
+
+PAGE = 1500          # Binance futures klines limit สูงสุดต่อ request
+
+def tf_seconds(tf):
+    unit = tf[-1]
+    n = int(tf[:-1])
+    if unit == "m":
+        return n * 60
+    if unit == "h":
+        return n * 3600
+    if unit == "d":
+        return n * 86400
+    if unit == "w":
+        return n * 604800
+    raise ValueError(f"unsupported timeframe: {tf}")
+
+class CandleStore:
+    def __init__(self, ex, maxlen=600):
+        self.ex = ex
+        self.maxlen = maxlen
+        self.buf = {}        # (symbol, tf) -> deque of [ts, o, h, l, c, v]
+        self.limits = {}     # (symbol, tf) -> backfill limit
+        self.last_fetch = {} # (symbol, tf) -> epoch sec of last request
+        self.derived = {}    # (symbol, tf) -> Resampler (สร้างจาก base TF)
+
+    def backfill(self, symbol, tf, limit=None):
+        key = (symbol, tf)
+        limit = limit or self.limits.get(key) or self.maxlen
+        if key in self.derived:
+            return self.update(symbol, tf)
+        if limit <= PAGE:
+            rows = self.ex.fetch_ohlcv(symbol, tf, limit=limit)
+        else:
+            # มากกว่า 1 page -> ดึงเป็นช่วงด้วย since=
+            tf_ms = tf_seconds(tf) * 1000
+            since = (int(time.time() * 1000) // tf_ms - limit + 1) * tf_ms
+            rows = []
+            while True:
+                page = self.ex.fetch_ohlcv(symbol, tf, since=since, limit=PAGE)
+                rows += [r for r in page if not rows or r[0] > rows[-1][0]]
+                if len(page) < PAGE:
+                    break
+                since = page[-1][0] + tf_ms
+        self.buf[key] = deque((list(r) for r in rows), maxlen=limit)
+        self.limits[key] = limit
+        self.last_fetch[key] = time.time()
+        log.info(f"[CANDLES] backfill {symbol} {tf}: {len(rows)} bars")
+        self._rebuild(symbol, tf)
+        return self.buf[key]
+
+    def seed(self, symbol, tf, rows, limit=None):
+        # warm-up จาก history บน disk (ไม่ใช้ network)
+        key = (symbol, tf)
+        limit = limit or self.limits.get(key) or self.maxlen
+        self.buf[key] = deque((list(r) for r in rows), maxlen=limit)
+        self.limits[key] = limit
+        self._rebuild(symbol, tf)
+        return self.buf[key]
+
+    # ---------------- derived TF ----------------
+    def derive(self, symbol, tf, base_tf, limit=None):
+        """tf จะถูกสร้างจาก base_tf (ต้องมี base ใน buffer แล้ว) และอัปเดตตามทุกครั้งที่ base เปลี่ยน"""
+        from resample import Resampler
+        key = (symbol, tf)
+        self.limits[key] = limit or self.limits.get(key) or self.maxlen
+        self.derived[key] = Resampler(base_tf, tf)
+        self._rebuild(symbol, base_tf)
+        return self.buf[key]
+
+    def _rebuild(self, symbol, base_tf):
+        # base ถูกโหลดใหม่ทั้งชุด -> สร้าง TF ที่ derive จาก base ใหม่แบบ batch
+        from resample import resample, Resampler
+        base = self.buf.get((symbol, base_tf))
+        for (sym, tf), r in self.derived.items():
+            if sym != symbol or r.base_tf != base_tf:
+                continue
+            key = (sym, tf)
+            rows = list(base or [])
+            out = resample(rows, base_tf, tf).tolist() if rows else []
+            self.buf[key] = deque(out, maxlen=self.limits.get(key) or self.maxlen)
+            # state ของ incremental resampler ต่อจากแท่งสุดท้าย
+            r2 = self.derived[key] = Resampler(base_tf, tf)
+            if out:
+                for row in rows:
+                    if row[0] >= out[-1][0]:
+                        r2.update(row)
+
+    def _propagate(self, symbol, base_tf, row):
+        for (sym, tf), r in self.derived.items():
+            if sym == symbol and r.base_tf == base_tf:
+                bar = r.update(row)
+                if bar is not None:
+                    self._put((sym, tf), bar)
+
+    def _put(self, key, row):
+        buf = self.buf.get(key)
+        if buf is None:
+            buf = self.buf[key] = deque(maxlen=self.limits.get(key) or self.maxlen)
+        if buf and row[0] == buf[-1][0]:
+            buf[-1] = row
+        elif not buf or row[0] > buf[-1][0]:
+            buf.append(row)
+        return buf
+
+    def update(self, symbol, tf, limit=None):
+        key = (symbol, tf)
+        r = self.derived.get(key)
+        if r is not None:
+            self.update(symbol, r.base_tf)
+            return self.buf[key]
+        buf = self.buf.get(key)
+        if not buf:
+            return self.backfill(symbol, tf, limit)
+
+        # แท่งสุดท้ายใน buffer คือแท่งที่กำลังก่อตัว -> ดึงตั้งแต่ ts ของมัน
+        since = buf[-1][0]
+        tf_ms = tf_seconds(tf) * 1000
+        missing = int((time.time() * 1000 - since) // tf_ms) + 1
+        if missing >= buf.maxlen:
+            # หลุดนานเกิน buffer -> backfill ใหม่ทั้งชุด
+            return self.backfill(symbol, tf)
+
+        rows = self.ex.fetch_ohlcv(symbol, tf, since=since, limit=missing + 1)
+        self.last_fetch[key] = time.time()
+        for r in rows:
+            ts = r[0]
+            if ts == buf[-1][0]:
+                buf[-1] = list(r)            # patch forming bar in place
+            elif ts > buf[-1][0]:
+                if ts - buf[-1][0] > tf_ms:
+                    log.warning(f"[CANDLES] gap {symbol} {tf}: {buf[-1][0]} -> {ts}")
+                buf.append(list(r))
+            else:
+                continue
+            if self.derived:
+                self._propagate(symbol, tf, buf[-1])
+        return buf
+
+    def apply(self, symbol, tf, row, maxlen=None):
+        # แท่งจาก stream (kline): patch แท่งเดิมหรือต่อท้าย
+        key = (symbol, tf)
+        if maxlen and key not in self.buf:
+            self.limits.setdefault(key, maxlen)
+        buf = self._put(key, list(row))
+        if self.derived:
+            self._propagate(symbol, tf, buf[-1])
+        return buf
+
+    def candles(self, symbol, tf):
+        return list(self.buf.get((symbol, tf)) or [])
+
+    def closes(self, symbol, tf, closed_only=False):
+        buf = self.buf.get((symbol, tf)) or []
+        out = [c[4] for c in buf]
+        return out[:-1] if closed_only else out
@@ -0,0 +1,386 @@
+# -*- coding: utf-8 -*-
+# engine.py
+# Strategy engine: หลาย strategy (plugin) ใน process เดียว บน market data + indicator ชุดเดียวกัน
+# - Plugin: on_bar (แท่ง TF ปิด) / on_tick (ทุกรอบ) / on_fill (SL/TP บน exchange ถูก fill) -> list ของ action
+#   action ใช้รูปแบบเดียวกับ strategy.py + {"type": "reduce"} (ปิดบางส่วน) และ {"type": "alert"}
+# - triggers (triggers.py): plugin คืน level ของ position (ladder TP / trailing / alert) ใน triggers()
+#   engine ลงทะเบียนเมื่อมี position ใหม่, ถอดเมื่อปิด, ยิงแล้วส่ง on_trigger() ครั้งเดียว
+# - move_sl ที่วางบน exchange ไม่ผ่าน -> on_move_failed(): position["sl"] กลับไปเท่า SL จริง (OrderManager.sl)
+# - IndicatorCache: EMA/MACD ต่อ (tf, period) สร้างครั้งเดียว ใช้ร่วมกันทุก plugin, ป้อนเฉพาะแท่งที่ปิดใหม่
+# - Engine: ดึง candles ต่อ TF ครั้งเดียวต่อรอบ, ส่งต่อ event ให้ plugin, ทำ action ผ่าน executor (main.execute)
+# - Binance one-way mode: 1 position ต่อ symbol -> plugin ที่เปิดก่อนเป็นเจ้าของ, open ของ plugin อื่นถูก reject
+# - hot standby (watchdog.py): stage ผ่าน watchdog (heartbeat), fence() = ยังถือ lease -> ไม่งั้นไม่ส่ง order / ไม่เขียน checkpoint
+
+import time, logging
+
+from candles import tf_seconds
+from indicators import EMA, MACD, sync_closed
+from orders import OrderManager
+from gateway import invalidate
+from triggers import TriggerBook
+from watchdog import LeaseLost
+import metrics
+
+log = logging.getLogger("main")
+
+class Plugin:
+    name = "plugin"
+    client_stops = True       # False = engine วาง SL/TP เป็น order บน exchange (OrderManager)
+
+    def __init__(self):
+        self.timeframes = {}  # tf -> จำนวนแท่งที่ต้องใช้ (warm-up)
+        self.position = None  # {"side","qty","entry","sl","tp", ...}
+
+    def setup(self, ctx):
+        # ขอ indicator จาก ctx.ind (ก่อน warm-up sync)
+        pass
+
+    def on_bar(self, ctx, tf):
+        pass
+
+    def on_tick(self, ctx):
+        return []
+
+    def on_fill(self, ctx, fill):
+        # fill = {"kind": "SL"/"TP", "price", "qty"}
+        return []
+
+    def levels(self, ctx):
+        # ราคาที่ plugin ตัดสินใจเมื่อข้าม (scheduler.py poll ถี่ขึ้นเมื่อเข้าใกล้); default = SL/TP
+        pos = self.position
+        return [pos.get("sl"), pos.get("tp")] if pos else []
+
+    def triggers(self, ctx):
+        # level ของ position ปัจจุบัน -> [{"level", "dir": "up"/"down", "kind", "data", "trail"}]
+        return []
+
+    def on_trigger(self, ctx, trig):
+        # trigger ของ plugin ถูกราคาข้าม (ครั้งเดียวต่อ trigger) -> list ของ action
+        return []
+
+    def on_reject(self, ctx, act):
+        log.info(f"[ENGINE] {ctx.label}{self.name}: {act['side']} rejected, symbol already has a position")
+        self.position = None
+
+    def on_move_failed(self, ctx, act, sl):
+        # move_sl ไม่ผ่าน, SL บน exchange ยังอยู่ที่ sl -> position ตามของจริง (strategy ขอย้ายใหม่ได้รอบถัดไป)
+        log.warning(f"[ENGINE] {ctx.label}{self.name}: SL move -> {act['sl']:.2f} failed, SL stays @{sl:.2f}")
+        self.position["sl"] = sl
+
+    def adopt(self, side, qty, entry):
+        # position บน exchange ที่ไม่มี state -> รับมาดูแล
+        self.position = {"side": side, "qty": qty, "entry": entry, "sl": None, "tp": None}
+
+    STATE_KEYS = ("position",)
+
+    def snapshot(self):
+        out = {k: getattr(self, k) for k in self.STATE_KEYS}
+        if out.get("position") is not None:
+            out["position"] = dict(out["position"])
+        return out
+
+    def restore(self, state):
+        for k in self.STATE_KEYS:
+            if k in state:
+                setattr(self, k, state[k])
+
+class IndicatorCache:
+    """indicator แบบ streaming ต่อ symbol: key เดียวกันได้ object เดียวกัน (EMA 50 บน 1h คำนวณครั้งเดียว)"""
+    def __init__(self):
+        self.inds = {}        # tf -> {key: indicator}
+        self.last = {}        # tf -> ts ของแท่งปิดล่าสุดที่ป้อนแล้ว
+
+    def get(self, tf, key, factory):
+        d = self.inds.setdefault(tf, {})
+        if key not in d:
+            d[key] = factory()
+        return d[key]
+
+    def ema(self, tf, period):
+        return self.get(tf, ("ema", period), lambda: EMA(period))
+
+    def macd(self, tf, fast=12, slow=26, signal=9):
+        return self.get(tf, ("macd", fast, slow, signal), lambda: MACD(fast, slow, signal))
+
+    def sync(self, candles, timeframes):
+        # candles(tf) -> buffer; คืน TF ที่มีแท่งปิดใหม่ (TF ใหญ่ก่อน)
+        closed = []
+        for tf in timeframes:
+            prev = self.last.get(tf)
+            self.last[tf] = sync_closed(candles(tf), prev, list(self.inds.get(tf, {}).values()))
+            if self.last[tf] != prev:
+                closed.append(tf)
+        return sorted(closed, key=tf_seconds, reverse=True)
+
+class Context:
+    """มุมมองของ plugin ต่อรอบ: candles / ราคา / position ดึงครั้งเดียวต่อรอบแล้วใช้ร่วมกัน"""
+    def __init__(self, engine):
+        self.engine = engine
+        self.symbol = engine.symbol
+        self.label = engine.label
+        self.ind = engine.ind
+        self.triggers = engine.triggers
+        self.begin()
+
+    def begin(self):
+        self.now = self.engine.feed.now()
+        self.fill = None          # SL/TP fill ของรอบนี้ (ถ้ามี)
+        self._bars = {}
+        self._px = None
+        self._pos = None
+
+    def candles(self, tf):
+        if tf not in self._bars:
+            self._bars[tf] = self.engine.feed.candles(tf)
+        return self._bars[tf]
+
+    def closed(self, tf, n=None):
+        # แท่งที่ปิดแล้ว (ไม่รวมแท่งที่กำลังก่อตัว) n แท่งล่าสุด
+        c = list(self.candles(tf))[:-1]
+        return c[-n:] if n else c
+
+    def price(self):
+        if self._px is None:
+            self._px = self.engine.feed.last_price()
+        return self._px
+
+    def position(self, plugin=None):
+        # (amt, side) บน exchange; plugin ที่ไม่ได้เป็นเจ้าของ position เห็นเป็น flat
+        if self._pos is None:
+            self._pos = self.engine.feed.position()
+        owner = self.engine.owner()
+        if plugin is not None and owner is not None and owner is not plugin:
+            return 0.0, None
+        return self._pos
+
+class Engine:
+    """plugins ทั้งหมดของ symbol เดียว; executor(ex, om, plugin, journal, act, size, label, t_signal)"""
+    def __init__(self, ex, symbol, store, feed, journal, plugins, executor, hist=None, size=None, label="",
+                 triggers=None):
+        self.ex, self.symbol, self.store, self.feed = ex, symbol, store, feed
+        self.journal, self.hist, self.size, self.label = journal, hist, size, label
+        self.triggers = triggers or TriggerBook()     # portfolio: book เดียวร่วมทุก symbol
+        self._armed = {}                               # plugin name -> position ที่ลงทะเบียน trigger แล้ว
+        self.plugins = list(plugins)
+        self.executor = executor
+        self.om = OrderManager(ex, symbol)
+        self.ind = IndicatorCache()
+        self.timeframes = sorted({tf for p in self.plugins for tf in p.timeframes}, key=tf_seconds)
+        self.ctx = Context(self)
+        for p in self.plugins:
+            p.setup(self.ctx)
+        # warm-up: seed indicators จาก buffer ที่มีอยู่ (ไม่ดึงใหม่)
+        self.ind.sync(lambda tf: store.candles(symbol, tf), self.timeframes)
+        self._saved = None
+        self._t_tick = None
+        self.watchdog = None      # Watchdog: heartbeat ต่อ stage
+        self.fence = None         # callable -> True = ยังเป็น primary (Lease.held)
+
+    def owner(self):
+        for p in self.plugins:
+            if p.position is not None:
+                return p
+        return None
+
+    def distance(self):
+        # ระยะถึง level ใกล้สุดของทุก plugin / ราคา (None = ไม่มี level) ใช้ราคาของรอบล่าสุด
+        ctx = self.ctx
+        px = ctx._px
+        if px is None and self.timeframes:
+            bars = ctx._bars.get(self.timeframes[0])
+            px = bars[-1][4] if bars else None
+        if not px:
+            return None
+        d = [abs(l - px) for p in self.plugins for l in p.levels(ctx) if l is not None]
+        t = self.triggers.nearest(self.symbol, px)
+        if t is not None:
+            d.append(t)
+        return min(d) / px if d else None
+
+    def plugin(self, name):
+        return next((p for p in self.plugins if p.name == name), None)
+
+    def _stage(self, name):
+        return self.watchdog.stage(name) if self.watchdog else metrics.span("stage", stage=name)
+
+    # ---------------- actions ----------------
+    def execute(self, plugin, act):
+        act.setdefault("ts", self.feed.now())     # เวลาตลาดของ action (replay = เวลาใน feed)
+        if act["type"] == "open":
+            other = next((p for p in self.plugins if p is not plugin and p.position is not None), None)
+            if other is not None:
+                plugin.on_reject(self.ctx, act)
+                return
+        if self.fence is not None and not self.fence():
+            raise LeaseLost(f"{self.label}{plugin.name} {act['type']} dropped: not primary")
+        with self._stage("execute"):
+            self.executor(self.ex, self.om, plugin, self.journal, act, self.size, self.label, self._t_tick)
+        if act["type"] == "move_sl" and plugin.position is not None and self.om.active() \
+                and self.om.pending is None and self.om.sl != act["sl"]:
+            plugin.on_move_failed(self.ctx, act, self.om.sl)
+        if self.om.pending is not None:
+            # วาง SL ไม่ได้ / stop ทะลุ mark -> OrderManager ปิด market แล้ว: plugin รับเหมือน SL fill
+            fill = self.om.reconcile()
+            self.ctx.fill = dict(fill, price=fill["price"] or self.ctx.price())
+            for a in plugin.on_fill(self.ctx, self.ctx.fill):
+                self.execute(plugin, a)
+        if act.get("touch_ts"):
+            metrics.observe("touch_to_fill_seconds", self.feed.now() - act["touch_ts"])
+        with self._stage("checkpoint"):
+            self.checkpoint()
+
+    # ---------------- state checkpoint / warm restart ----------------
+    def state(self):
+        return {"plugins": {p.name: p.snapshot() for p in self.plugins}, "orders": self.om.snapshot()}
+
+    def checkpoint(self):
+        # เขียนเฉพาะเมื่อ state เปลี่ยน (เทียบกับครั้งล่าสุดที่เขียน)
+        snap = self.state()
+        if snap != self._saved:
+            if self.fence is not None and not self.fence():
+                return                # standby / lease หลุด: state ใน journal เป็นของ primary ตัวใหม่
+            self.journal.set(f"state:{self.symbol}", snap)
+            self._saved = snap
+
+    def restore(self):
+        """boot: โหลด state ที่ checkpoint ไว้ แล้ว reconcile กับ position / open orders จริงบน exchange"""
+        saved = self.journal.get(f"state:{self.symbol}") or {}
+        for p in self.plugins:                # trigger จาก state ก่อนหน้า (กลับมาจาก standby)
+            self.triggers.cancel_owner(self.symbol, p.name)
+        self.triggers.drain(self.symbol)
+        self._armed = {}
+        states = saved.get("plugins")
+        if states is None and "strategy" in saved:
+            states = {"nw": saved["strategy"]}          # checkpoint รูปแบบเดิม (NW อย่างเดียว)
+        for p in self.plugins:
+            p.restore((states or {}).get(p.name) or {})
+        self.om.restore(saved.get("orders") or {})
+        self._saved = saved
+        om = self.om
+        amt, side = self.feed.position()
+        owner = self.owner()
+        pos = owner.position if owner else None
+
+        if pos and (amt == 0 or side != pos["side"]):
+            # ปิดไปตอน bot ไม่ทำงาน -> ถ้าเป็น SL/TP บน exchange ให้บันทึก trade
+            fill = None
+            if om.active():
+                try:
+                    fill = om.reconcile()
+                except Exception as e:
+                    log.warning(f"[STATE] {self.label}reconcile saved orders failed: {e}")
+            if fill:
+                self.ctx.begin()
+                for act in owner.on_fill(self.ctx, dict(fill, price=fill["price"] or pos["entry"])):
+                    self.execute(owner, act)
+            else:
+                log.warning(f"[STATE] {self.label}saved {pos['side'].upper()} not on exchange, dropped")
+                owner.position = None
+                om.cancel_all()
+            owner = pos = None
+
+        if amt > 0 and pos is None:
+            # position ที่ไม่มี state (เช่นไฟล์หาย / เปิดมือ) -> plugin แรกรับไปดูแล
+            owner = self.plugins[0]
+            entry = 0.0
+            for p in self.ex.fetch_positions([self.symbol]):
+                if p.get("symbol") == self.symbol:
+                    entry = float(p.get("entryPrice") or 0)
+            owner.adopt(side, amt, entry)
+            pos = owner.position
+            if not owner.client_stops:
+                if om.adopt(side, amt, self.ex.fetch_open_orders(self.symbol)):
+                    pos["sl"], pos["tp"] = om.sl, om.tp
+                elif pos["sl"] is not None:
+                    om.protect(side, amt, pos["sl"])
+            log.warning(f"[STATE] {self.label}{owner.name} adopted {side.upper()} {amt} @ {entry:.2f} SL@{pos['sl']}")
+        elif pos:
+            pos["qty"] = amt
+            if not owner.client_stops:
+                if om.active():
+                    om.qty = amt
+                    om.reconcile()            # วาง SL/TP ที่ถูก cancel ระหว่างปิดเครื่องกลับคืน
+                elif pos["sl"] is not None:
+                    om.protect(side, amt, pos["sl"], pos["tp"])
+            log.info(f"[STATE] {self.label}{owner.name} resumed {side.upper()} {amt} SL@{pos['sl']} TP@{pos['tp']}")
+        self.checkpoint()
+
+    # ---------------- loop ----------------
+    def tick(self):
+        self._t_tick = time.time()
+        try:
+            with metrics.span("loop"):
+                self._decide()
+        finally:
+            self.checkpoint()
+
+    def _decide(self):
+        ctx, om = self.ctx, self.om
+        ctx.begin()
+        with self._stage("candles"):
+            for tf in self.timeframes:
+                ctx.candles(tf)
+        with self._stage("indicators"):
+            closed = self.ind.sync(ctx.candles, self.timeframes)
+        if self.hist:
+            # เก็บแท่งที่เพิ่งปิดลง history
+            for tf in closed:
+                self.hist.append(self.symbol, tf, self.store.candles(self.symbol, tf)[-10:])
+        for tf in closed:
+            for p in self.plugins:
+                if tf in p.timeframes:
+                    p.on_bar(ctx, tf)
+
+        with self._stage("position"):
+            amt, _ = ctx.position()
+
+        # exchange-side SL/TP fill -> เจ้าของ position; รอบนี้ plugin ไม่ตัดสินใจใหม่ (ctx.fill)
+        owner = self.owner()
+        if owner is not None and om.active():
+            with self._stage("reconcile"):
+                fill = om.reconcile(getattr(self.feed, "orders", None))
+            if fill:
+                invalidate(self.ex)
+                ctx.fill = dict(fill, price=fill["price"] or ctx.price())
+                for act in owner.on_fill(ctx, ctx.fill):
+                    self.execute(owner, act)
+        if not ctx.fill and amt == 0 and owner is not None:
+            om.cancel_all()
+
+        with self._stage("triggers"):
+            self._arm()
+            if not ctx.fill:
+                self._fire(ctx)
+        with self._stage("plugins"):
+            for p in self.plugins:
+                for act in p.on_tick(ctx):
+                    self.execute(p, act)
+        self._arm()
+
+    # ---------------- triggers ----------------
+    def _arm(self):
+        # position ใหม่ -> ลงทะเบียน trigger ของ plugin, position หาย -> ถอด
+        book, sym = self.triggers, self.symbol
+        for p in self.plugins:
+            pos = p.position
+            if pos is None:
+                if self._armed.pop(p.name, None) is not None:
+                    book.cancel_owner(sym, p.name)
+            elif self._armed.get(p.name) is not pos:
+                book.cancel_owner(sym, p.name)
+                for spec in p.triggers(self.ctx):
+                    book.add(sym, owner=p.name, **spec)
+                self._armed[p.name] = pos
+
+    def _fire(self, ctx):
+        book = self.triggers
+        if book.count(self.symbol):
+            book.update(self.symbol, ctx.price())
+        for t in book.drain(self.symbol):
+            p = self.plugin(t.owner)
+            if p is None or p.position is None or self._armed.get(p.name) is not p.position:
+                continue                  # position ที่ trigger นี้ผูกอยู่ปิดไปแล้ว
+            for act in p.on_trigger(ctx, t):
+                self.execute(p, act)
+                if self._armed.get(p.name) is not p.position:
+                    break             # position ปิด / re-arm (move_sl ไม่ผ่าน) -> action ที่เหลือของ trigger นี้ไม่ใช้แล้ว
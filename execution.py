@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+# execution.py
+# Sliced execution สำหรับ entry / exit ขนาดใหญ่ (แทน market order ก้อนเดียวที่กินทะลุ book)
+# - algo:
+#   "market":  ก้อนเดียว (แบบเดิม)
+#   "twap":    แบ่งเป็น slices ทุก interval วินาที; slice = IOC limit ภายใน max_bps จาก mid
+#              ขนาดไม่เกิน participation × depth ใน band, ส่วนที่ไม่ fill ทบไป slice ถัดไป, slice สุดท้าย = market
+#   "iceberg": post-only (GTX) ที่ best bid/ask โชว์ทีละ clip (ขนาดจาก depth) fill แล้ววางใหม่, ราคาหนี -> reprice
+#   "post":    post-only ทั้งก้อนแบบเดียวกับ iceberg
+#              iceberg / post ครบ timeout -> cancel แล้ว market ส่วนที่เหลือ
+#   "auto":    qty อยู่ใน clip ของ book (หรือไม่มี book) -> market, ไม่งั้น twap
+#   child ถูก reject / error กลางทาง -> หยุด, คืน Execution ที่ fill ไปแล้ว (e.error) ให้ caller จัดการส่วนที่เหลือ
+# - Execution: parent order, child orders ทุกตัว (id -> สถานะล่าสุด) + implementation shortfall
+#     shortfall = (avg fill - arrival) × filled × sign + fees  (arrival = ราคาที่ strategy ตัดสินใจ / mid ตอนเริ่ม)
+# - ใช้ได้กับ FakeExchange (book จำลอง): sleep / clock ส่งเข้ามาได้ -> test ป้อน book / trade ระหว่างรอ
+#
+#   e = Executor(ex, "twap").run(symbol, "buy", 1.5, ref=price)
+#   e.filled, e.avg, e.report()
+
+import math, time, logging
+
+import metrics
+from gateway import invalidate
+
+log = logging.getLogger("main")
+
+ALGOS = ("auto", "market", "twap", "iceberg", "post")
+EPS = 1e-9
+
+def _mid(book):
+    if not book or not book.get("bids") or not book.get("asks"):
+        return None
+    return (book["bids"][0][0] + book["asks"][0][0]) / 2
+
+def depth(book, side, max_bps):
+    # ปริมาณที่ taker ฝั่ง side กินได้ภายใน max_bps จาก mid (buy -> asks)
+    mid = _mid(book)
+    if mid is None:
+        return 0.0
+    band = mid * max_bps / 1e4
+    levels = book["asks"] if side == "buy" else book["bids"]
+    return sum(q for p, q in levels if abs(p - mid) <= band)
+
+class Execution:
+    """parent order หนึ่งก้อน: child orders + สรุป fill"""
+    def __init__(self, symbol, side, qty, algo, arrival=None, reduce=False, t0=None):
+        self.symbol, self.side, self.qty, self.algo = symbol, side, float(qty), algo
+        self.arrival = arrival
+        self.reduce = reduce
+        self.children = {}        # id -> order ล่าสุด
+        self.error = None         # exception ที่ทำให้หยุดก่อนครบ
+        self.t0 = time.time() if t0 is None else t0
+        self.t1 = None
+
+    def update(self, o):
+        self.children[str(o["id"])] = o
+
+    def live(self):
+        return [o for o in self.children.values() if o.get("status") == "open"]
+
+    @property
+    def filled(self):
+        return sum(float(o.get("filled") or 0) for o in self.children.values())
+
+    @property
+    def cost(self):
+        return sum(float(o.get("cost") or 0) or float(o.get("filled") or 0) * float(o.get("average") or 0)
+                   for o in self.children.values())
+
+    @property
+    def fees(self):
+        return sum(float((o.get("fee") or {}).get("cost") or 0) for o in self.children.values())
+
+    @property
+    def avg(self):
+        f = self.filled
+        return self.cost / f if f > EPS else None
+
+    def remaining(self):
+        return max(0.0, round(self.qty - self.filled, 12))
+
+    def report(self):
+        f, avg, arr = self.filled, self.avg, self.arrival
+        sign = 1 if self.side == "buy" else -1
+        cost = (avg - arr) * f * sign + self.fees if avg and arr else None
+        return {
+            "symbol": self.symbol, "side": self.side, "algo": self.algo, "reduce": self.reduce,
+            "qty": self.qty, "filled": round(f, 12), "children": len(self.children),
+            "passive": sum(1 for o in self.children.values() if o.get("timeInForce") == "GTX" and o.get("filled")),
+            "arrival": arr, "avg": round(avg, 6) if avg else None, "fees": round(self.fees, 6),
+            "shortfall": round(cost, 6) if cost is not None else None,
+            "shortfall_bps": round(cost / (arr * f) * 1e4, 3) if cost is not None else None,
+            "seconds": round((self.t1 or time.time()) - self.t0, 3), "error": self.error,
+        }
+
+class Executor:
+    def __init__(self, ex, algo="auto", slices=4, interval=5.0, timeout=30.0, participation=0.25,
+                 max_bps=10.0, poll=1.0, book_limit=20, sleep=time.sleep, clock=time.time):
+        if algo not in ALGOS:
+            raise ValueError(f"unknown execution algo: {algo}")
+        self.ex, self.algo = ex, algo
+        self.slices, self.interval, self.timeout = max(1, int(slices)), interval, timeout
+        self.participation, self.max_bps = participation, max_bps
+        self.poll, self.book_limit = poll, book_limit
+        self.sleep, self.clock = sleep, clock
+
+    # ---------------- exchange helpers ----------------
+    def _book(self, symbol):
+        try:
+            return self.ex.fetch_order_book(symbol, self.book_limit)
+        except Exception as e:
+            log.warning(f"[EXEC] order book {symbol} error: {e}")
+            return None
+
+    def _amount(self, symbol, qty):
+        try:
+            return float(self.ex.amount_to_precision(symbol, qty))
+        except Exception:
+            return math.floor(qty * 1000) / 1000
+
+    def _price(self, symbol, px):
+        try:
+            return float(self.ex.price_to_precision(symbol, px))
+        except Exception:
+            return px
+
+    def _send(self, e, type, qty, price=None, tif=None):
+        qty = self._amount(e.symbol, round(qty, 12))      # 0.3 / 3 = 0.0999.. -> truncate ไม่ให้เหลือ 0.099
+        if qty <= 0:
+            return None
+        params = {"reduceOnly": True} if e.reduce else {}
+        if tif:
+            params["timeInForce"] = tif
+        o = self.ex.create_order(e.symbol, type, e.side, qty, price, params)
+        e.update(o)
+        return o
+
+    def _refresh(self, e):
+        # สถานะล่าสุดของ child ที่ยังเปิดอยู่ (ไม่ใช้ cache ของ gateway)
+        invalidate(self.ex, "fetch_order")
+        for o in e.live():
+            try:
+                e.update(self.ex.fetch_order(o["id"], e.symbol))
+            except Exception as err:
+                log.warning(f"[EXEC] fetch_order {o['id']} error: {err}")
+
+    def _cancel(self, e, o):
+        try:
+            self.ex.cancel_order(o["id"], e.symbol)
+        except Exception as err:
+            log.warning(f"[EXEC] cancel {o['id']} warn: {err}")
+        try:
+            invalidate(self.ex, "fetch_order")
+            e.update(self.ex.fetch_order(o["id"], e.symbol))     # fill ที่เกิดก่อน cancel
+        except Exception:
+            pass
+
+    def clip(self, book, side):
+        # ขนาด slice จาก depth (None = ไม่รู้ depth)
+        d = depth(book, side, self.max_bps)
+        return self.participation * d if d > 0 else None
+
+    # ---------------- parent ----------------
+    def run(self, symbol, side, qty, reduce=False, ref=None, algo=None):
+        algo = algo or self.algo
+        book = self._book(symbol) if algo != "market" else None
+        e = Execution(symbol, side, qty, algo, ref or _mid(book), reduce, self.clock())
+        if algo == "auto":
+            clip = self.clip(book, side)
+            e.algo = algo = "market" if clip is None or qty <= clip else "twap"
+        try:
+            getattr(self, "_" + algo)(e, book)
+        except Exception as err:
+            e.error = f"{type(err).__name__}: {err}"
+            log.warning(f"[EXEC] {symbol} {side} {algo} stopped at {round(e.filled, 12)}/{qty}: {err}")
+            metrics.inc("errors_total", where="execution")
+        finally:
+            for o in e.live():
+                self._cancel(e, o)
+            e.t1 = self.clock()
+        if e.arrival is None:
+            e.arrival = e.avg
+        r = e.report()
+        if r["shortfall_bps"] is not None:
+            metrics.observe("shortfall_bps", r["shortfall_bps"], metrics.BPS_BUCKETS, algo=algo)
+        metrics.inc("exec_children_total", len(e.children), algo=algo)
+        return e
+
+    # ---------------- algos ----------------
+    def _market(self, e, book=None):
+        o = self._send(e, "market", e.remaining())
+        if o is not None and o.get("status") == "open":
+            self._refresh(e)
+
+    def _twap(self, e, book=None):
+        n = self.slices
+        for i in range(n):
+            if e.remaining() <= EPS:
+                return
+            if i:
+                self.sleep(self.interval)
+                book = self._book(e.symbol)
+            if i == n - 1:
+                return self._market(e)
+            target = e.remaining() / (n - i)
+            clip = self.clip(book, e.side)
+            mid = _mid(book)
+            if mid is None:
+                self._send(e, "market", target)
+            else:
+                sign = 1 if e.side == "buy" else -1
+                px = self._price(e.symbol, mid * (1 + sign * self.max_bps / 1e4))
+                self._send(e, "limit", min(target, clip) if clip else target, px, "IOC")
+            self._refresh(e)
+
+    def _iceberg(self, e, book=None):
+        self._passive(e, book, display=True)
+
+    def _post(self, e, book=None):
+        self._passive(e, book, display=False)
+
+    def _passive(self, e, book, display):
+        # post-only ที่ best ฝั่งตัวเอง; fill -> วาง clip ถัดไป, best หนี -> cancel แล้ววางใหม่
+        deadline = self.clock() + self.timeout
+        buy = e.side == "buy"
+        child = None
+        while e.remaining() > EPS and self.clock() < deadline:
+            if child is None or child.get("status") != "open":
+                own = (book or {}).get("bids" if buy else "asks")
+                if not own:
+                    break
+                q = e.remaining()
+                if display:
+                    q = min(q, self.clip(book, e.side) or q)
+                child = self._send(e, "limit", q, own[0][0], "GTX")
+                if child is None:
+                    break
+            self.sleep(self.poll)
+            self._refresh(e)
+            child = e.children[str(child["id"])]
+            book = self._book(e.symbol)
+            own = (book or {}).get("bids" if buy else "asks")
+            if child["status"] == "open" and own and (own[0][0] > child["price"] if buy else own[0][0] < child["price"]):
+                self._cancel(e, child)            # ราคาหนีไป -> reprice
+                child = e.children[str(child["id"])]
+        for o in e.live():
+            self._cancel(e, o)
+        if e.remaining() > EPS:
+            self._market(e)
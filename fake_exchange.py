@@ -0,0 +1,430 @@
+# -*- coding: utf-8 -*-
+# fake_exchange.py
+# Local in-memory stand-in for ccxt.binance (USDT-M futures, one-way mode)
+# ใช้กับ replay / test / paper trading โดยไม่ต้องส่ง order จริง
+# - balance / margin ตาม leverage, position แบบ one-way, reduceOnly
+# - market / stop: fill โดยกินราคาใน order book (depth) ถ้ามี, ไม่มี book -> fill ที่ราคาล่าสุด
+# - STOP_MARKET / TAKE_PROFIT_MARKET ที่ราคาข้าม stopPrice ไปแล้ว -> reject แบบ Binance (-2021)
+# - limit (GTC / IOC / GTX post-only): ค้างใน book แล้ว fill เมื่อ trade / book วิ่งผ่านราคา (maker)
+# - data=<ccxt client>: paper trading -> market data จาก exchange จริง, order/balance/position จำลองที่นี่
+# - trades: ทุก fill พร้อมราคาอ้างอิง (mid ตอน order เข้า) -> exec_report() = execution quality
+
+import time
+
+class InsufficientFunds(Exception):
+    pass
+
+class OrderNotFound(Exception):
+    pass
+
+class OrderImmediatelyFillable(Exception):
+    pass
+
+BOOK_STALE_MS = 5000          # book เก่ากว่านี้ -> paper ดึงใหม่จาก data (replay ใช้ตามที่มี)
+
+class FakeExchange:
+    def __init__(self, balance=1000.0, leverage=10, taker_fee=0.0004, maker_fee=0.0002, amount_decimals=3, data=None):
+        self.balance_usdt = float(balance)   # wallet balance (realized)
+        self.leverage = {}
+        self.default_leverage = leverage
+        self.taker_fee = taker_fee
+        self.maker_fee = maker_fee
+        self.amount_decimals = amount_decimals
+        self.data = data         # ccxt client สำหรับ market data (paper trading); None = offline
+        self.prices = {}         # symbol -> last price
+        self.books = {}          # symbol -> {"bids": [[px, qty], ...] (สูง->ต่ำ), "asks": (ต่ำ->สูง), "ts"}
+        self.ohlcv = {}          # (symbol, tf) -> [[ts,o,h,l,c,v], ...]
+        self.positions = {}      # symbol -> {"side","contracts","entryPrice"}
+        self.orders = {}         # id -> ccxt-style order dict
+        self.trades = []         # fills
+        self.rejects = {}        # เหตุผล -> จำนวน (post-only, margin, ...)
+        self.calls = []          # (method, args) สำหรับตรวจสอบใน test
+        self._next_id = 1
+        self.now_ms = None       # เวลา simulated (None = wall clock)
+
+    # ---------------- helpers ----------------
+    def milliseconds(self):
+        return self.now_ms if self.now_ms is not None else int(time.time() * 1000)
+
+    def _log(self, name, *args):
+        self.calls.append((name, args))
+
+    def market(self, symbol):
+        if self.data is not None:
+            return self.data.market(symbol)
+        return {
+            "id": symbol.split(":")[0].replace("/", ""),
+            "symbol": symbol,
+            "contractSize": 1.0,
+            "precision": {"amount": 10 ** -self.amount_decimals, "price": 0.1},
+            "limits": {"amount": {"min": 10 ** -self.amount_decimals}, "cost": {"min": 5.0}},
+        }
+
+    def load_markets(self, reload=False):
+        self._log("load_markets")
+        return self.data.load_markets(reload) if self.data is not None else {}
+
+    def set_leverage(self, leverage, symbol=None, params=None):
+        self._log("set_leverage", leverage, symbol)
+        self.leverage[symbol] = leverage
+        return {"leverage": leverage, "symbol": symbol}
+
+    def amount_to_precision(self, symbol, amount):
+        if self.data is not None:
+            return self.data.amount_to_precision(symbol, amount)
+        q = 10 ** self.amount_decimals
+        return str(int(float(amount) * q) / q)
+
+    def set_price(self, symbol, price, ts=None):
+        self.prices[symbol] = float(price)
+        if ts is not None:
+            self.now_ms = int(ts)
+        self._check_triggers(symbol)
+
+    def _check_triggers(self, symbol):
+        # STOP_MARKET / TAKE_PROFIT_MARKET: trigger แล้ว fill แบบ market
+        px = self.prices[symbol]
+        for o in list(self.orders.values()):
+            if o["symbol"] != symbol or o["status"] != "open" or o["stopPrice"] is None:
+                continue
+            sp = o["stopPrice"]
+            stop = o["type"].upper().startswith("STOP")
+            if o["side"] == "sell":
+                hit = px <= sp if stop else px >= sp
+            else:
+                hit = px >= sp if stop else px <= sp
+            if hit:
+                self._take(o)
+
+    # ---------------- order book / trades (replay หรือ stream) ----------------
+    def set_book(self, symbol, bids, asks, ts=None):
+        # depth snapshot (partial book) -> แทนที่ book เดิมทั้งหมด
+        book = {"bids": sorted(([float(p), float(q)] for p, q in bids if float(q) > 0), reverse=True),
+                "asks": sorted([float(p), float(q)] for p, q in asks if float(q) > 0),
+                "ts": int(ts) if ts is not None else self.milliseconds()}
+        self.books[symbol] = book
+        # limit ที่ค้างอยู่ซึ่งถูก book ฝั่งตรงข้ามข้ามมาแล้ว -> fill ที่ราคา limit (maker)
+        for o in self._resting(symbol):
+            opp = book["asks"] if o["side"] == "buy" else book["bids"]
+            if opp and self._crosses(o, opp[0][0]):
+                self._fill(o, o["price"], o["amount"] - o["filled"], maker=True)
+
+    def on_trade(self, symbol, price, qty, ts=None):
+        # trade ในตลาด: limit ที่ราคาถูกวิ่งผ่าน fill ทั้งหมด, ชนราคาพอดี fill ตาม qty ของ trade
+        price, qty = float(price), float(qty)
+        for o in self._resting(symbol):
+            if o["price"] == price:
+                self._fill(o, price, min(qty, o["amount"] - o["filled"]), maker=True)
+            elif self._crosses(o, price):
+                self._fill(o, o["price"], o["amount"] - o["filled"], maker=True)
+        self.set_price(symbol, price, ts)
+
+    def on_stream(self, symbol, data):
+        # message จาก WsFeed / ReplayFeed (depth20 / aggTrade) ของ symbol นี้
+        if data.get("s") != self.market(symbol)["id"]:
+            return
+        e = data.get("e")
+        if e == "depthUpdate":
+            self.set_book(symbol, data.get("b", []), data.get("a", []), data.get("T") or data.get("E"))
+        elif e == "aggTrade":
+            self.on_trade(symbol, data["p"], data["q"], data.get("T") or data.get("E"))
+
+    def _book(self, symbol):
+        b = self.books.get(symbol)
+        if self.data is not None and (b is None or self.milliseconds() - b["ts"] > BOOK_STALE_MS):
+            try:
+                ob = self.data.fetch_order_book(symbol, 20)
+                self.set_book(symbol, ob["bids"], ob["asks"], ob.get("timestamp"))
+                b = self.books[symbol]
+            except Exception:
+                pass
+        return b
+
+    def _mid(self, symbol):
+        b = self.books.get(symbol)
+        if b and b["bids"] and b["asks"]:
+            return (b["bids"][0][0] + b["asks"][0][0]) / 2
+        return self.prices.get(symbol)
+
+    def _resting(self, symbol):
+        return [o for o in list(self.orders.values())
+                if o["symbol"] == symbol and o["status"] == "open" and o["type"] == "limit"]
+
+    @staticmethod
+    def _crosses(order, px):
+        return px < order["price"] if order["side"] == "buy" else px > order["price"]
+
+    # ---------------- market data ----------------
+    def fetch_ticker(self, symbol, params=None):
+        self._log("fetch_ticker", symbol)
+        if self.data is not None:
+            t = self.data.fetch_ticker(symbol)
+            if t.get("last") is not None:
+                self.set_price(symbol, t["last"])
+            return t
+        px = self.prices.get(symbol)
+        b = self.books.get(symbol)
+        bid = b["bids"][0][0] if b and b["bids"] else px
+        ask = b["asks"][0][0] if b and b["asks"] else px
+        return {"symbol": symbol, "last": px, "bid": bid, "ask": ask, "timestamp": self.milliseconds()}
+
+    def fetch_tickers(self, symbols=None, params=None):
+        self._log("fetch_tickers", symbols)
+        if self.data is not None:
+            out = self.data.fetch_tickers(symbols)
+            for s, t in out.items():
+                if t.get("last") is not None:
+                    self.set_price(s, t["last"])
+            return out
+        px = {s: p for s, p in self.prices.items() if not symbols or s in symbols}
+        return {s: {"symbol": s, "last": p, "bid": p, "ask": p, "timestamp": self.milliseconds()} for s, p in px.items()}
+
+    def fetch_last_prices(self, symbols=None, params=None):
+        self._log("fetch_last_prices", symbols)
+        if self.data is not None:
+            out = self.data.fetch_last_prices(symbols)
+            for s, t in out.items():
+                if t.get("price") is not None:
+                    self.set_price(s, t["price"])
+            return out
+        return {s: {"symbol": s, "price": p, "timestamp": self.milliseconds()}
+                for s, p in self.prices.items() if not symbols or s in symbols}
+
+    def fetch_order_book(self, symbol, limit=None, params=None):
+        self._log("fetch_order_book", symbol, limit)
+        b = self._book(symbol) or {"bids": [], "asks": [], "ts": self.milliseconds()}
+        n = limit or len(b["bids"]) + len(b["asks"])
+        return {"symbol": symbol, "bids": [list(l) for l in b["bids"][:n]],
+                "asks": [list(l) for l in b["asks"][:n]], "timestamp": b["ts"]}
+
+    def fetch_ohlcv(self, symbol, timeframe="1m", since=None, limit=None, params=None):
+        self._log("fetch_ohlcv", symbol, timeframe, since, limit)
+        if self.data is not None:
+            return self.data.fetch_ohlcv(symbol, timeframe, since, limit)
+        rows = self.ohlcv.get((symbol, timeframe), [])
+        if since is not None:
+            rows = [r for r in rows if r[0] >= since]
+            return [list(r) for r in rows[:limit]] if limit else [list(r) for r in rows]
+        return [list(r) for r in (rows[-limit:] if limit else rows)]
+
+    # ---------------- account ----------------
+    def _used_margin(self):
+        used = 0.0
+        for sym, p in self.positions.items():
+            used += p["contracts"] * p["entryPrice"] / self.leverage.get(sym, self.default_leverage)
+        return used
+
+    def fetch_balance(self, params=None):
+        self._log("fetch_balance")
+        used = self._used_margin()
+        free = self.balance_usdt - used
+        return {"USDT": {"free": free, "used": used, "total": self.balance_usdt}}
+
+    def fetch_positions(self, symbols=None, params=None):
+        self._log("fetch_positions", symbols)
+        out = []
+        for sym, p in self.positions.items():
+            if symbols and sym not in symbols:
+                continue
+            out.append({"symbol": sym, "side": p["side"], "contracts": p["contracts"],
+                        "entryPrice": p["entryPrice"], "markPrice": self.prices.get(sym),
+                        "leverage": self.leverage.get(sym, self.default_leverage)})
+        return out
+
+    # ---------------- orders ----------------
+    def create_market_order(self, symbol, side, amount, price=None, params=None):
+        # รองรับทั้ง (symbol, side, qty, params=...) และ (symbol, side, qty, None, {...})
+        return self.create_order(symbol, "market", side, amount, price, params)
+
+    def create_limit_order(self, symbol, side, amount, price, params=None):
+        return self.create_order(symbol, "limit", side, amount, price, params)
+
+    def create_order(self, symbol, type, side, amount, price=None, params=None):
+        params = params or {}
+        self._log("create_order", symbol, type, side, amount, price, dict(params))
+        tif = "GTX" if params.get("postOnly") else params.get("timeInForce", "GTC")
+        reduce = bool(params.get("reduceOnly"))
+        sp, px = params.get("stopPrice"), self.prices.get(symbol)
+        if sp is not None and px is not None:
+            stop = type.upper().startswith("STOP")
+            if (px <= sp if stop else px >= sp) if side == "sell" else (px >= sp if stop else px <= sp):
+                self.rejects["would_trigger"] = self.rejects.get("would_trigger", 0) + 1
+                raise OrderImmediatelyFillable('binance {"code":-2021,"msg":"Order would immediately trigger."}')
+        if not reduce and type in ("market", "limit"):
+            self._check_margin(symbol, side, float(amount), float(price or self._mid(symbol) or 0))
+        oid = str(self._next_id); self._next_id += 1
+        order = {"id": oid, "symbol": symbol, "type": type, "side": side,
+                 "amount": float(amount), "price": float(price) if price is not None else None, "status": "open",
+                 "filled": 0.0, "remaining": float(amount), "average": None, "cost": 0.0, "fee": {"cost": 0.0},
+                 "reduceOnly": reduce, "timeInForce": tif, "stopPrice": params.get("stopPrice"),
+                 "ref": self._mid(symbol), "timestamp": self.milliseconds(), "info": {}}
+        self.orders[oid] = order
+        if type == "market":
+            self._take(order)
+        elif type == "limit":
+            self._limit(order)
+        return dict(order)
+
+    def _check_margin(self, symbol, side, qty, px):
+        # initial margin ของส่วนที่เพิ่ม position (ส่วนที่ลด position ไม่ต้องใช้ margin)
+        # flip: margin ของ position เดิมที่ถูกปิดคืนมาก่อน
+        pos = self.positions.get(symbol)
+        want = "long" if side == "buy" else "short"
+        lev = self.leverage.get(symbol, self.default_leverage)
+        freed = 0.0
+        if pos is not None and pos["side"] != want:
+            freed = min(qty, pos["contracts"]) * pos["entryPrice"] / lev
+            qty -= pos["contracts"]
+        if qty <= 0 or px <= 0:
+            return
+        need = qty * px / lev
+        free = self.balance_usdt - self._used_margin() + freed
+        if need > free + 1e-9:
+            self.rejects["margin"] = self.rejects.get("margin", 0) + 1
+            raise InsufficientFunds(f"binance Margin is insufficient: need {need:.2f} free {free:.2f}")
+
+    def _limit(self, order):
+        b = self._book(order["symbol"])
+        opp = (b["asks"] if order["side"] == "buy" else b["bids"]) if b else []
+        px = self.prices.get(order["symbol"])
+        marketable = (opp and self._crosses(order, opp[0][0])) or \
+                     (opp and opp[0][0] == order["price"]) or \
+                     (not opp and px is not None and (self._crosses(order, px) or px == order["price"]))
+        if marketable:
+            if order["timeInForce"] == "GTX":
+                # post-only ที่จะกลายเป็น taker -> Binance ตอบ EXPIRED
+                order["status"] = "expired"
+                self.rejects["post_only"] = self.rejects.get("post_only", 0) + 1
+                return order
+            self._take(order, limit=order["price"])
+        if order["status"] == "open" and order["timeInForce"] in ("IOC", "FOK"):
+            order["status"] = "expired"             # Binance: ส่วนที่เหลือของ IOC -> EXPIRED
+        return order
+
+    def _take(self, order, limit=None):
+        # taker: กินราคาใน book ฝั่งตรงข้ามทีละระดับ (ลด qty ของระดับที่ใช้ไป); ไม่มี book -> ราคาล่าสุด
+        symbol = order["symbol"]
+        if order["stopPrice"] is not None:
+            order["ref"] = self._mid(symbol)          # stop: ราคาอ้างอิง = ตอน trigger
+        rest = order["amount"] - order["filled"]
+        b = self._book(symbol)
+        levels = (b["asks"] if order["side"] == "buy" else b["bids"]) if b else []
+        if not levels:
+            return self._fill(order, self.prices[symbol], rest)
+        used = 0
+        while rest > 1e-12 and levels:
+            px, q = levels[0]
+            if limit is not None and (px > limit if order["side"] == "buy" else px < limit):
+                break
+            take = min(rest, q)
+            if take >= q - 1e-12:
+                levels.pop(0)
+            else:
+                levels[0][1] = q - take
+            self._fill(order, px, take, levels=1)
+            if order["status"] != "open":
+                return order
+            used += 1
+            rest = order["amount"] - order["filled"]
+        if rest > 1e-12 and limit is None:
+            # book หมด (depth จำกัด) -> ส่วนที่เหลือที่ราคาระดับสุดท้าย
+            px = self.trades[-1]["price"] if used else self.prices[symbol]
+            self._fill(order, px, rest, levels=0, exhausted=True)
+        return order
+
+    def _fill(self, order, px, qty, maker=False, levels=0, exhausted=False):
+        symbol, side = order["symbol"], order["side"]
+        pos = self.positions.get(symbol)
+        want = "long" if side == "buy" else "short"
+        if order["reduceOnly"]:
+            if pos is None or pos["side"] == want:
+                order["status"] = "closed" if order["filled"] else "expired"   # reduceOnly ที่ไม่มีอะไรให้ลด
+                return order
+            qty = min(qty, pos["contracts"])
+        if qty <= 0:
+            return order
+        fee = qty * px * (self.maker_fee if maker else self.taker_fee)
+        self.balance_usdt -= fee
+        if pos is None:
+            self.positions[symbol] = {"side": want, "contracts": qty, "entryPrice": px}
+        elif pos["side"] == want:
+            tot = pos["contracts"] + qty
+            pos["entryPrice"] = (pos["entryPrice"] * pos["contracts"] + px * qty) / tot
+            pos["contracts"] = tot
+        else:
+            close = min(qty, pos["contracts"])
+            sign = 1 if pos["side"] == "long" else -1
+            self.balance_usdt += (px - pos["entryPrice"]) * close * sign
+            pos["contracts"] = round(pos["contracts"] - close, 12)
+            rest = qty - close
+            if pos["contracts"] <= 0:
+                del self.positions[symbol]
+                if rest > 0:
+                    self.positions[symbol] = {"side": want, "contracts": rest, "entryPrice": px}
+        filled = order["filled"] + qty
+        order["cost"] += qty * px
+        order["fee"]["cost"] += fee
+        order.update(filled=filled, remaining=max(0.0, order["amount"] - filled), average=order["cost"] / filled)
+        if order["reduceOnly"] and symbol not in self.positions:
+            order["remaining"] = 0.0                 # ปิดหมดแล้ว ส่วนที่เหลือของ reduceOnly ไม่มีผล
+        if order["remaining"] <= 1e-12:
+            order["status"] = "closed"
+        ref = order.get("ref")
+        self.trades.append({"order": order["id"], "symbol": symbol, "side": side, "type": order["type"],
+                            "amount": qty, "price": px, "fee": fee, "maker": maker, "ref": ref,
+                            "levels": levels, "exhausted": exhausted, "timestamp": self.milliseconds()})
+        return order
+
+    def cancel_order(self, id, symbol=None, params=None):
+        self._log("cancel_order", id, symbol)
+        o = self.orders.get(id)
+        if o is None:
+            raise OrderNotFound(f"binance Unknown order sent: {id}")
+        if o["status"] == "open":
+            o["status"] = "canceled"
+        return dict(o)
+
+    def fetch_order(self, id, symbol=None, params=None):
+        self._log("fetch_order", id, symbol)
+        o = self.orders.get(id)
+        if o is None:
+            raise OrderNotFound(f"binance Order does not exist: {id}")
+        return dict(o)
+
+    def fetch_open_orders(self, symbol=None, since=None, limit=None, params=None):
+        self._log("fetch_open_orders", symbol)
+        return [dict(o) for o in self.orders.values()
+                if o["status"] == "open" and (symbol is None or o["symbol"] == symbol)]
+
+    # ---------------- execution quality ----------------
+    def exec_report(self):
+        """สรุปคุณภาพการ fill: slippage เทียบ mid ตอน order เข้า (bps, + = เสียเปรียบ), ค่า fee, maker/taker"""
+        fills = self.trades
+        notional = sum(t["amount"] * t["price"] for t in fills)
+        fees = sum(t["fee"] for t in fills)
+        slips, cost = [], 0.0
+        for t in fills:
+            if not t["ref"]:
+                continue
+            sign = 1 if t["side"] == "buy" else -1
+            slips.append((t["price"] - t["ref"]) / t["ref"] * 1e4 * sign)
+            cost += (t["price"] - t["ref"]) * t["amount"] * sign
+        slips.sort()
+        q = lambda p: slips[min(len(slips) - 1, int(p * len(slips)))] + 0.0 if slips else 0.0
+        orders = [o for o in self.orders.values() if o["type"] in ("market", "limit") or o["filled"]]
+        return {
+            "orders": len(orders),
+            "fills": len(fills),
+            "maker_fills": sum(1 for t in fills if t["maker"]),
+            "partial": sum(1 for o in orders if 0 < o["filled"] < o["amount"]),
+            "book_exhausted": sum(1 for t in fills if t["exhausted"]),
+            "notional": round(notional, 2),
+            "fees": round(fees, 4),
+            "fee_bps": round(fees / notional * 1e4, 3) if notional else 0.0,
+            "slippage_cost": round(cost, 4),
+            "slippage_bps_avg": round(sum(slips) / len(slips), 3) if slips else 0.0,
+            "slippage_bps_p50": round(q(0.5), 3),
+            "slippage_bps_p95": round(q(0.95), 3),
+            "rejects": dict(self.rejects),
+            "balance": round(self.balance_usdt, 4),
+        }
@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+# feed.py
+# Market-data feeds สำหรับ main loop
+# - RestFeed:   poll REST ทุก LOOP_SEC (แบบเดิม)
+# - WsFeed:     asyncio WebSocket (kline + bookTicker + markPrice + user-data, depth/aggTrade ถ้าเปิด)
+#               รัน decision ทุกครั้งที่มี event, REST เป็น fallback เมื่อ stream เงียบ/หลุด
+# - ReplayFeed: ป้อน message ที่อัดไว้ (jsonl) ผ่าน handle() path เดียวกัน (offline)
+
+import asyncio, json, logging, threading, time
+
+import metrics
+from gateway import invalidate
+
+log = logging.getLogger("main")
+
+WS_URL = "wss://fstream.binance.com/stream?streams="
+STALE_SEC = 30            # ไม่มี message นานเกินนี้ -> ใช้ REST แทน
+LISTEN_KEY_KEEPALIVE_SEC = 30 * 60
+BOOK_EVENTS = ("depthUpdate", "aggTrade")    # replay: ไม่นับเป็นรอบ decision
+USER_EVENTS = ("ACCOUNT_UPDATE", "ORDER_TRADE_UPDATE", "TRADE_LITE", "ACCOUNT_CONFIG_UPDATE", "MARGIN_CALL",
+               "listenKeyExpired")
+
+def market_id(ex, symbol):
+    try:
+        return ex.market(symbol)["id"]
+    except Exception:
+        return symbol.split(":")[0].replace("/", "")
+
+def read_position(ex, symbol):
+    try:
+        for p in ex.fetch_positions([symbol]):
+            if p.get("symbol") == symbol and float(p.get("contracts") or 0) != 0:
+                return float(p["contracts"]), p["side"]
+    except Exception:
+        pass
+    return 0.0, None
+
+# ============================================================
+# REST polling
+# ============================================================
+class RestFeed:
+    def __init__(self, ex, store, symbol, loop_sec=10):
+        self.ex = ex
+        self.store = store
+        self.symbol = symbol
+        self.loop_sec = loop_sec
+        self.done = False            # True เมื่อ feed หมด (replay EOF)
+
+    def now(self):
+        return time.time()
+
+    def candles(self, tf):
+        return self.store.update(self.symbol, tf)
+
+    def position(self):
+        return read_position(self.ex, self.symbol)
+
+    def last_price(self):
+        return self.ex.fetch_ticker(self.symbol)["last"]
+
+    def wait(self, sec=None):
+        time.sleep(self.loop_sec if sec is None else sec)
+
+    def close(self):
+        pass
+
+# ============================================================
+# Stream state (ใช้ร่วมกันระหว่าง WsFeed / ReplayFeed)
+# ============================================================
+class StreamFeed(RestFeed):
+    def __init__(self, ex, store, symbol, timeframes, loop_sec=10):
+        super().__init__(ex, store, symbol, loop_sec)
+        self.timeframes = list(timeframes)
+        self.sid = market_id(ex, symbol)
+        self.lock = threading.Lock()
+        self.event = threading.Event()
+        self.last_msg = 0.0           # message ล่าสุดของ market stream (fresh() ดูเฉพาะตัวนี้)
+        self.last_user = 0.0          # message ล่าสุดของ user stream
+        self.event_time = None        # เวลา (sec) ของ event ล่าสุดจาก exchange
+        self.price = None
+        self.bid = self.ask = None
+        self.pos = None               # (amt, side) จาก ACCOUNT_UPDATE; None = ยังไม่รู้
+        self.user_stream = False
+        self.orders = {}              # order id -> ORDER_TRADE_UPDATE ล่าสุด
+        self.depth = False            # subscribe depth20 + aggTrade (อัดไว้ใช้ fill จำลองใน replay / paper)
+        self.listeners = []           # callback(msg) หลัง handle
+
+    def streams(self):
+        s = self.sid.lower()
+        out = [f"{s}@kline_{tf}" for tf in self.timeframes]
+        out += [f"{s}@bookTicker", f"{s}@markPrice@1s"]
+        if self.depth:
+            out += [f"{s}@depth20@100ms", f"{s}@aggTrade"]
+        return out
+
+    def handle(self, msg):
+        data = msg.get("data", msg)
+        e = data.get("e")
+        with self.lock:
+            if e in USER_EVENTS:
+                self.last_user = time.time()
+            else:
+                self.last_msg = time.time()
+            if data.get("E"):
+                self.event_time = data["E"] / 1000
+            if e == "kline" and data.get("s") == self.sid:
+                k = data["k"]
+                row = [k["t"], float(k["o"]), float(k["h"]), float(k["l"]), float(k["c"]), float(k["v"])]
+                self.store.apply(self.symbol, k["i"], row)
+                if self.bid is None:
+                    self.price = row[4]       # ยังไม่มี bookTicker -> ใช้ close ล่าสุด
+            elif e == "bookTicker" and data.get("s") == self.sid:
+                self.bid, self.ask = float(data["b"]), float(data["a"])
+                self.price = (self.bid + self.ask) / 2
+            elif e == "aggTrade" and data.get("s") == self.sid:
+                if self.bid is None:
+                    self.price = float(data["p"])
+            elif e == "markPriceUpdate" and data.get("s") == self.sid:
+                if self.bid is None:
+                    self.price = float(data["p"])
+            elif e == "ACCOUNT_UPDATE":
+                for p in data.get("a", {}).get("P", []):
+                    if p.get("s") == self.sid:
+                        amt = float(p.get("pa") or 0)
+                        self.pos = (abs(amt), "long" if amt > 0 else "short" if amt < 0 else None)
+            elif e == "ORDER_TRADE_UPDATE":
+                o = data.get("o", {})
+                if o.get("s") == self.sid:
+                    self.orders[str(o.get("i"))] = o
+                    if o.get("X") in ("FILLED", "PARTIALLY_FILLED"):
+                        invalidate(self.ex)
+            elif data.get("ohlcv"):
+                # snapshot ที่ recorder เขียนไว้ตอนเริ่ม
+                for row in data["ohlcv"]:
+                    self.store.apply(self.symbol, data["tf"], row)
+                if self.price is None:
+                    self.price = data["ohlcv"][-1][4]
+        for cb in self.listeners:
+            cb(data)
+        self.event.set()
+
+    def fresh(self):
+        return time.time() - self.last_msg < STALE_SEC
+
+    def candles(self, tf):
+        if self.fresh() and self.store.buf.get((self.symbol, tf)):
+            return self.store.buf[(self.symbol, tf)]
+        return super().candles(tf)
+
+    def position(self):
+        if self.user_stream and self.pos is not None:
+            return self.pos
+        amt, side = super().position()
+        with self.lock:
+            self.pos = (amt, side)
+        return amt, side
+
+    def last_price(self):
+        if self.fresh() and self.price is not None:
+            return self.price
+        return super().last_price()
+
+# ============================================================
+# WebSocket (asyncio ใน background thread)
+# ============================================================
+class WsFeed(StreamFeed):
+    def __init__(self, ex, store, symbol, timeframes, loop_sec=10, user_data=True, record_path=None, depth=False):
+        super().__init__(ex, store, symbol, timeframes, loop_sec)
+        self.user_data = user_data
+        self.depth = depth
+        self.record = open(record_path, "a") if record_path else None
+        self.loop = None
+        self._stop = False
+        if self.record:
+            for tf in self.timeframes:
+                self._write({"ohlcv": self.store.candles(symbol, tf), "tf": tf})
+        self.thread = threading.Thread(target=self._run, name="ws-feed", daemon=True)
+        self.thread.start()
+
+    def _write(self, msg):
+        self.record.write(json.dumps({"t": time.time(), "msg": msg}) + "\n")
+        self.record.flush()
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        tasks = [self._market()]
+        if self.user_data:
+            tasks.append(self._user())
+        try:
+            self.loop.run_until_complete(asyncio.gather(*tasks))
+        except Exception as e:
+            log.warning(f"[WS] runtime stopped: {e}")
+
+    async def _consume(self, url, name, once=False):
+        # once: คืนเมื่อหลุด / listenKeyExpired (user stream ต้องขอ listenKey ใหม่ก่อนต่อใหม่)
+        import websockets
+        backoff = 1
+        while not self._stop:
+            try:
+                async with websockets.connect(url, ping_interval=20, max_size=2 ** 22) as ws:
+                    log.info(f"[WS] {name} connected")
+                    backoff = 1
+                    if name == "user":
+                        self.user_stream = True
+                    async for raw in ws:
+                        msg = json.loads(raw)
+                        if self.record:
+                            self._write(msg)
+                        self.handle(msg)
+                        if self._stop:
+                            return
+                        if once and msg.get("data", msg).get("e") == "listenKeyExpired":
+                            log.warning(f"[WS] {name} listenKey expired, renewing")
+                            break
+                if once:
+                    return
+            except Exception as e:
+                log.warning(f"[WS] {name} disconnected: {e} (retry {backoff}s, REST fallback)")
+                metrics.inc("retries_total", component=f"ws_{name}")
+                if once:
+                    return
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+
+    async def _market(self):
+        await self._consume(WS_URL + "/".join(self.streams()), "market")
+
+    async def _user(self):
+        # listenKey ใหม่ทุกครั้งที่ต่อใหม่ (key เดิมอาจหมดอายุแล้ว); REST ของ ccxt เป็น blocking -> executor
+        backoff = 1
+        while not self._stop:
+            try:
+                key = (await self.loop.run_in_executor(None, self.ex.fapiPrivatePostListenKey))["listenKey"]
+            except Exception as e:
+                log.warning(f"[WS] listenKey error: {e} (positions via REST)")
+                await asyncio.sleep(60)
+                continue
+            keepalive = asyncio.ensure_future(self._keepalive())
+            t0 = time.time()
+            try:
+                await self._consume(f"wss://fstream.binance.com/ws/{key}", "user", once=True)
+            finally:
+                keepalive.cancel()
+                self.user_stream = False
+            if self._stop:
+                return
+            backoff = 1 if time.time() - t0 > 60 else min(backoff * 2, 60)
+            await asyncio.sleep(backoff)
+
+    async def _keepalive(self):
+        while True:
+            await asyncio.sleep(LISTEN_KEY_KEEPALIVE_SEC)
+            try:
+                await self.loop.run_in_executor(None, self.ex.fapiPrivatePutListenKey)
+            except Exception as e:
+                log.warning(f"[WS] listenKey keepalive error: {e}")
+
+    def wait(self, sec=None):
+        # ตื่นเมื่อมี event ใหม่ หรือครบ loop_sec (fallback poll)
+        self.event.wait(self.loop_sec if sec is None else sec)
+        self.event.clear()
+
+    def close(self):
+        self._stop = True
+        if self.record:
+            self.record.close()
+
+# ============================================================
+# Offline replay
+# ============================================================
+class ReplayFeed(StreamFeed):
+    def __init__(self, ex, store, symbol, timeframes, path, speed=0.0):
+        super().__init__(ex, store, symbol, timeframes, loop_sec=0)
+        self.f = open(path)
+        self.speed = speed            # 0 = เร็วที่สุด, 1 = real time
+        self.user_stream = True
+        self.pos = (0.0, None)
+        self._t = None
+        # snapshot ต้นไฟล์ (ohlcv) ต้องถูกโหลดก่อน decision แรก
+        self._pending = None
+        for line in self.f:
+            rec = json.loads(line)
+            if not rec["msg"].get("ohlcv"):
+                self._pending = rec
+                break
+            self.handle(rec["msg"])
+
+    def now(self):
+        return self.event_time if self.event_time is not None else (self._t or time.time())
+
+    def fresh(self):
+        return True
+
+    def position(self):
+        # ถ้า exchange (fake) รู้สถานะจริง ให้ใช้ของ exchange
+        if hasattr(self.ex, "positions"):
+            return read_position(self.ex, self.symbol)
+        return self.pos
+
+    def wait(self, sec=None):
+        # ป้อน message ถัดไป; depth / aggTrade ไปถึง listener (fill จำลอง) โดยไม่ปลุก decision loop
+        while True:
+            rec = self._pending
+            if rec is None:
+                line = self.f.readline()
+                if not line:
+                    self.done = True
+                    return
+                rec = json.loads(line)
+            self._pending = None
+            if self.speed and self._t is not None:
+                time.sleep(max(0.0, (rec["t"] - self._t) / self.speed))
+            self._t = rec["t"]
+            self.handle(rec["msg"])
+            if rec["msg"].get("data", rec["msg"]).get("e") not in BOOK_EVENTS:
+                return
+
+    def close(self):
+        self.f.close()
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+# gateway.py
+# Exchange gateway: cache response อายุสั้นต่อ endpoint + รวม request ซ้ำที่กำลังวิ่งอยู่ (coalescing)
+# - read (fetch_*): key = (method, args) -> ใช้ผลเดิมถ้ายังไม่หมด TTL; ถ้ามี call เดียวกันค้างอยู่ รอผลของตัวนั้น
+# - write (create/cancel order): ส่งตรง แล้ว invalidate balance / positions / orders
+# - fill จาก stream / reconcile: เรียก invalidate(ex) เอง
+# - weight / backoff อยู่ชั้นล่าง (ratelimit.LimitedExchange) -> cache hit ไม่กิน weight
+#
+#   ex = Gateway(LimitedExchange(ccxt_client, RateLimiter()))
+
+import threading, time, logging
+from concurrent.futures import Future
+
+import metrics
+
+log = logging.getLogger("main")
+
+# TTL (sec) ต่อ method
+TTL = {
+    "fetch_ticker": 1.0,
+    "fetch_tickers": 1.0,
+    "fetch_last_prices": 1.0,
+    "fetch_ohlcv": 1.0,
+    "fetch_balance": 5.0,
+    "fetch_positions": 2.0,
+    "fetch_open_orders": 2.0,
+    "fetch_order": 1.0,
+}
+WRITES = {"create_order", "create_market_order", "cancel_order", "set_leverage"}
+ACCOUNT = ("fetch_balance", "fetch_positions", "fetch_open_orders", "fetch_order")
+FOLLOW_TIMEOUT_SEC = 60.0     # รอผลของ call ที่ค้างอยู่นานสุดเท่านี้ (leader ค้าง -> follower ไม่ค้างตาม)
+
+class Gateway:
+    def __init__(self, ex, ttl=None, clock=time.monotonic, follow_timeout=FOLLOW_TIMEOUT_SEC):
+        self._ex = ex
+        self._follow_timeout = follow_timeout
+        self._ttl = dict(TTL, **(ttl or {}))
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._cache = {}          # key -> (expire, result)
+        self._inflight = {}       # key -> Future
+        self._gen = {}            # method -> generation (เพิ่มเมื่อ invalidate)
+        self.stats = {"hit": 0, "miss": 0, "coalesced": 0, "invalidate": 0}
+
+    def __getattr__(self, name):
+        attr = getattr(self._ex, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+        if name in self._ttl:
+            return lambda *a, **k: self._read(name, attr, a, k)
+        if name in WRITES:
+            def write(*a, **k):
+                try:
+                    return attr(*a, **k)
+                finally:
+                    self.invalidate(*ACCOUNT)
+            return write
+        return attr
+
+    def _count(self, kind):
+        self.stats[kind] += 1
+        metrics.inc("gateway_requests_total", result=kind)
+
+    def _read(self, name, fn, a, k):
+        key = (name, repr(a), repr(sorted(k.items())))
+        with self._lock:
+            hit = self._cache.get(key)
+            if hit is not None and hit[0] > self._clock():
+                self._count("hit")
+                return hit[1]
+            fut = self._inflight.get(key)
+            leader = fut is None
+            if leader:
+                fut = self._inflight[key] = Future()
+                gen = self._gen.get(name, 0)
+        if not leader:
+            with self._lock:
+                self._count("coalesced")
+            return fut.result(self._follow_timeout)
+
+        with self._lock:
+            self._count("miss")
+        try:
+            res = fn(*a, **k)
+        except Exception as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            fut.set_exception(e)
+            raise
+        with self._lock:
+            self._inflight.pop(key, None)
+            # ถ้าถูก invalidate ระหว่างรอ ผลนี้อาจเก่าแล้ว -> ไม่เก็บ
+            if self._gen.get(name, 0) == gen:
+                self._cache[key] = (self._clock() + self._ttl[name], res)
+        fut.set_result(res)
+        return res
+
+    def invalidate(self, *names):
+        names = set(names or self._ttl)
+        with self._lock:
+            for key in [k for k in self._cache if k[0] in names]:
+                del self._cache[key]
+            for n in names:
+                self._gen[n] = self._gen.get(n, 0) + 1
+            self._count("invalidate")
+
+def invalidate(ex, *names):
+    # ใช้ได้กับ exchange ทุกแบบ (ไม่มี gateway = no-op)
+    inv = getattr(ex, "invalidate", None) if isinstance(ex, Gateway) else None
+    if inv:
+        inv(*(names or ACCOUNT))
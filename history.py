@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+# history.py
+# Local OHLCV history store (columnar, memory-mapped)
+# data/<SYMBOLID>_<tf>/{ts.i8, open.f8, high.f8, low.f8, close.f8, volume.f8}
+# - download(): ดึงเป็น page ด้วย fetch_ohlcv(since=) แบบ resume ต่อจากแท่งสุดท้ายที่มี
+# - append(): ต่อท้ายเฉพาะแท่งที่ปิดแล้วและใหม่กว่าของเดิม
+# - gaps() / repair(): หา/เติมช่วงที่ขาด
+# - columns() / ohlcv(): อ่านแบบ np.memmap (ไม่ copy)
+#
+# usage: python history.py BTC/USDT:USDT 30m 2021-01-01
+
+import os, sys, time, logging
+from datetime import datetime, timezone
+import numpy as np
+
+import metrics
+from candles import tf_seconds
+
+log = logging.getLogger("main")
+
+COLS = (("ts", "<i8"), ("open", "<f8"), ("high", "<f8"), ("low", "<f8"), ("close", "<f8"), ("volume", "<f8"))
+PAGE = 1500            # Binance futures klines limit สูงสุด
+
+class HistoryStore:
+    def __init__(self, root="data"):
+        self.root = root
+
+    def path(self, symbol, tf):
+        sid = symbol.split(":")[0].replace("/", "")
+        return os.path.join(self.root, f"{sid}_{tf}")
+
+    def _file(self, symbol, tf, col):
+        return os.path.join(self.path(symbol, tf), f"{col}.{'i8' if col == 'ts' else 'f8'}")
+
+    # ---------------- read ----------------
+    def count(self, symbol, tf):
+        f = self._file(symbol, tf, "ts")
+        return os.path.getsize(f) // 8 if os.path.exists(f) else 0
+
+    def columns(self, symbol, tf):
+        n = self.count(symbol, tf)
+        if n == 0:
+            return None
+        return {c: np.memmap(self._file(symbol, tf, c), dtype=dt, mode="r", shape=(n,)) for c, dt in COLS}
+
+    def last_ts(self, symbol, tf):
+        n = self.count(symbol, tf)
+        if n == 0:
+            return None
+        return int(np.memmap(self._file(symbol, tf, "ts"), dtype="<i8", mode="r", shape=(n,))[-1])
+
+    def ohlcv(self, symbol, tf, start=None, end=None):
+        # (N, 6) float64 [ts, o, h, l, c, v] ช่วง [start, end) ตามเวลา ms
+        cols = self.columns(symbol, tf)
+        if cols is None:
+            return np.zeros((0, 6))
+        ts = cols["ts"]
+        a = int(np.searchsorted(ts, start)) if start is not None else 0
+        b = int(np.searchsorted(ts, end)) if end is not None else len(ts)
+        return np.column_stack([cols[c][a:b].astype(np.float64) for c, _ in COLS])
+
+    def tail(self, symbol, tf, n):
+        cols = self.columns(symbol, tf)
+        if cols is None:
+            return []
+        k = len(cols["ts"])
+        return np.column_stack([cols[c][max(0, k - n):].astype(np.float64) for c, _ in COLS]).tolist()
+
+    # ---------------- write ----------------
+    def append(self, symbol, tf, rows, now_ms=None):
+        # เฉพาะแท่งที่ปิดแล้ว (ts + tf <= now) และใหม่กว่าแท่งสุดท้าย
+        tf_ms = tf_seconds(tf) * 1000
+        now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+        last = self.last_ts(symbol, tf)
+        new = [r for r in rows if (last is None or r[0] > last) and r[0] + tf_ms <= now_ms]
+        if not new:
+            return 0
+        arr = np.asarray(new, dtype=np.float64)
+        os.makedirs(self.path(symbol, tf), exist_ok=True)
+        n = self.count(symbol, tf)
+        for c, _ in COLS[1:]:
+            # ตัดส่วนเกินจากการเขียนค้าง (crash ระหว่าง append) ให้ยาวเท่า ts
+            f = self._file(symbol, tf, c)
+            if os.path.exists(f) and os.path.getsize(f) != n * 8:
+                os.truncate(f, n * 8)
+        # เขียน column อื่นก่อน ts -> reader ใช้ขนาดของ ts เป็นตัวนับ จึงไม่เห็นแถวที่เขียนไม่ครบ
+        for i, (c, dt) in reversed(list(enumerate(COLS))):
+            with open(self._file(symbol, tf, c), "ab") as f:
+                f.write(arr[:, i].astype(dt).tobytes())
+        return len(new)
+
+    def _rewrite(self, symbol, tf, arr):
+        os.makedirs(self.path(symbol, tf), exist_ok=True)
+        for i, (c, dt) in reversed(list(enumerate(COLS))):
+            tmp = self._file(symbol, tf, c) + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(arr[:, i].astype(dt).tobytes())
+            os.replace(tmp, self._file(symbol, tf, c))
+
+    # ---------------- network ----------------
+    def download(self, ex, symbol, tf, since_ms=None, until_ms=None, page=PAGE, retries=5):
+        """ดึงต่อจากแท่งสุดท้ายที่มี (resume ได้) จนถึง until/ปัจจุบัน; คืนจำนวนแท่งที่เพิ่ม"""
+        tf_ms = tf_seconds(tf) * 1000
+        last = self.last_ts(symbol, tf)
+        since = last + tf_ms if last is not None else since_ms
+        if since is None:
+            since = int(time.time() * 1000) - page * tf_ms
+        added = 0
+        while True:
+            now_ms = int(time.time() * 1000)
+            if since + tf_ms > min(until_ms or now_ms, now_ms):
+                break
+            for attempt in range(retries):
+                try:
+                    rows = ex.fetch_ohlcv(symbol, tf, since=since, limit=page)
+                    break
+                except Exception as e:
+                    log.warning(f"[HIST] fetch {symbol} {tf} since={since} error: {e} (retry {attempt + 1})")
+                    metrics.inc("retries_total", component="history")
+                    time.sleep(min(2 ** attempt, 30))
+            else:
+                raise RuntimeError(f"history download failed at {since}")
+            if until_ms is not None:
+                rows = [r for r in rows if r[0] < until_ms]
+            if not rows:
+                break
+            n = self.append(symbol, tf, rows, now_ms)
+            added += n
+            nxt = rows[-1][0] + tf_ms
+            if nxt <= since or (n == 0 and len(rows) < page):
+                break
+            since = nxt
+        if added:
+            log.info(f"[HIST] {symbol} {tf}: +{added} bars (total {self.count(symbol, tf)})")
+        return added
+
+    def gaps(self, symbol, tf):
+        # [(ts_from, ts_to, missing_bars)] ช่วงที่ ts กระโดดเกิน 1 แท่ง
+        cols = self.columns(symbol, tf)
+        if cols is None:
+            return []
+        tf_ms = tf_seconds(tf) * 1000
+        ts = np.asarray(cols["ts"])
+        d = np.diff(ts)
+        idx = np.nonzero(d != tf_ms)[0]
+        return [(int(ts[i]), int(ts[i + 1]), int(d[i] // tf_ms) - 1) for i in idx]
+
+    def repair(self, ex, symbol, tf):
+        # เติมช่วงที่ขาด (exchange อาจไม่มีข้อมูลจริง เช่นช่วง maintenance -> คงเป็น gap)
+        tf_ms = tf_seconds(tf) * 1000
+        gaps = self.gaps(symbol, tf)
+        if not gaps:
+            return 0
+        extra = []
+        for a, b, _ in gaps:
+            since = a + tf_ms
+            while since < b:
+                rows = [r for r in ex.fetch_ohlcv(symbol, tf, since=since, limit=PAGE) if r[0] < b]
+                if not rows:
+                    break
+                extra += rows
+                since = rows[-1][0] + tf_ms
+        if not extra:
+            return 0
+        before = self.count(symbol, tf)
+        arr = np.vstack([self.ohlcv(symbol, tf), np.asarray(extra, dtype=np.float64)])
+        _, keep = np.unique(arr[:, 0], return_index=True)     # sort + dedupe ตาม ts
+        self._rewrite(symbol, tf, arr[keep])
+        return len(keep) - before
+
+def load_dir(path):
+    # อ่าน directory ของ store ตรงๆ (ใช้กับ backtest / sweep) -> (N, 6)
+    n = os.path.getsize(os.path.join(path, "ts.i8")) // 8
+    cols = [np.memmap(os.path.join(path, f"{c}.{'i8' if c == 'ts' else 'f8'}"), dtype=dt, mode="r", shape=(n,))
+            for c, dt in COLS]
+    return np.column_stack([c.astype(np.float64) for c in cols])
+
+def warm_up(ex, store, hist, symbol, tf, n):
+    """เติม CandleStore จาก history บน disk; network ใช้แค่แท่งที่ยังไม่มี + แท่งที่กำลังก่อตัว"""
+    tf_ms = tf_seconds(tf) * 1000
+    try:
+        hist.download(ex, symbol, tf, since_ms=int(time.time() * 1000) - n * tf_ms)
+    except Exception as e:
+        log.warning(f"[HIST] top-up {symbol} {tf} failed: {e}")
+    rows = hist.tail(symbol, tf, n)
+    if len(rows) < n - 1:
+        store.backfill(symbol, tf, limit=n)
+        hist.append(symbol, tf, store.candles(symbol, tf))
+        return "network"
+    store.seed(symbol, tf, rows, n)
+    store.update(symbol, tf)
+    return "disk"
+
+def main(argv=None):
+    import ccxt
+    argv = argv or sys.argv[1:]
+    if len(argv) < 3:
+        print("usage: python history.py SYMBOL TF START_DATE [END_DATE]")
+        return 1
+    symbol, tf = argv[0], argv[1]
+    parse = lambda s: int(datetime.strptime(s, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp() * 1000)
+    since = parse(argv[2])
+    until = parse(argv[3]) if len(argv) > 3 else None
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    ex = ccxt.binance({"enableRateLimit": True, "options": {"defaultType": "future"}})
+    hs = HistoryStore()
+    hs.download(ex, symbol, tf, since, until)
+    g = hs.gaps(symbol, tf)
+    if g:
+        log.warning(f"[HIST] {len(g)} gaps, trying repair")
+        hs.repair(ex, symbol, tf)
+    print(f"{symbol} {tf}: {hs.count(symbol, tf)} bars in {hs.path(symbol, tf)}, gaps={len(hs.gaps(symbol, tf))}")
+
+if __name__ == "__main__":
+    main()
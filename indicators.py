@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+# indicators.py
+# Streaming indicators (O(1) ต่อแท่งปิด)
+# - update(v): commit แท่งที่ปิดแล้ว
+# - peek(v):   ค่าชั่วคราวของแท่งที่กำลังก่อตัว (ไม่เปลี่ยน state)
+# - seed(arr): warm-up จาก history
+# ค่าตรงกับ ema()/macd() เดิมใน main.py ที่คำนวณจาก bar 0
+
+from collections import deque
+
+class EMA:
+    def __init__(self, period):
+        self.period = period
+        self.k = 2 / (period + 1)
+        self.count = 0
+        self._sum = 0.0
+        self.value = None
+
+    def seed(self, values):
+        for v in values:
+            self.update(v)
+        return self.value
+
+    def update(self, v):
+        self.count += 1
+        if self.value is None:
+            self._sum += v
+            if self.count == self.period:
+                self.value = self._sum / self.period
+        else:
+            self.value = v * self.k + self.value * (1 - self.k)
+        return self.value
+
+    def peek(self, v):
+        if self.value is None:
+            if self.count + 1 == self.period:
+                return (self._sum + v) / self.period
+            return None
+        return v * self.k + self.value * (1 - self.k)
+
+class MACD:
+    def __init__(self, fast=12, slow=26, signal=9):
+        self.fast = EMA(fast)
+        self.slow = EMA(slow)
+        self.sig = EMA(signal)
+        self.min_bars = slow + signal + 5
+        self.count = 0
+        self.dif = self.dea = None
+        self.dif_prev = self.dea_prev = None
+
+    def seed(self, closes):
+        for v in closes:
+            self.update(v)
+        return self.value()
+
+    def update(self, close):
+        self.count += 1
+        f = self.fast.update(close)
+        s = self.slow.update(close)
+        if f is None or s is None:
+            return self.value()
+        self.dif_prev, self.dea_prev = self.dif, self.dea
+        self.dif = f - s
+        self.dea = self.sig.update(self.dif)
+        return self.value()
+
+    def value(self):
+        # (dif_prev, dif, dea_prev, dea) แบบเดียวกับ macd() เดิม
+        if self.count < self.min_bars or self.dea_prev is None:
+            return None
+        return self.dif_prev, self.dif, self.dea_prev, self.dea
+
+    def peek(self, close):
+        if self.count + 1 < self.min_bars or self.dea is None:
+            return None
+        f = self.fast.peek(close)
+        s = self.slow.peek(close)
+        dif = f - s
+        return self.dif, dif, self.dea, self.sig.peek(dif)
+
+class MAE:
+    # mean absolute change |c[i] - c[i-1]| บน window ล่าสุด (rolling sum)
+    def __init__(self, window):
+        self.window = window
+        self.diffs = deque(maxlen=window)
+        self._sum = 0.0
+        self.last = None
+
+    def seed(self, values):
+        for v in values:
+            self.update(v)
+        return self.value()
+
+    def update(self, v):
+        if self.last is not None:
+            d = abs(v - self.last)
+            if len(self.diffs) == self.window:
+                self._sum -= self.diffs[0]
+            self.diffs.append(d)
+            self._sum += d
+        self.last = v
+        return self.value()
+
+    def value(self):
+        return self._sum / len(self.diffs) if self.diffs else None
+
+    def peek(self, v):
+        if self.last is None:
+            return self.value()
+        d = abs(v - self.last)
+        s, n = self._sum + d, len(self.diffs) + 1
+        if len(self.diffs) == self.window:
+            s -= self.diffs[0]; n -= 1
+        return s / n
+
+def sync_closed(candles, last_ts, inds):
+    # ป้อนแท่งที่ปิดใหม่ (ts > last_ts, ไม่รวมแท่งสุดท้ายที่ยังไม่ปิด) เข้า indicators
+    i = len(candles) - 1
+    while i > 0 and (last_ts is None or candles[i - 1][0] > last_ts):
+        i -= 1
+    for k in range(i, len(candles) - 1):   # candles อาจเป็น deque (ไม่รองรับ slice)
+        c = candles[k]
+        for ind in inds:
+            ind.update(c[4])
+        last_ts = c[0]
+    return last_ts
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+# journal.py
+# Trade journal บน SQLite (WAL) แทนการเขียน daily_pnl.json ทั้งไฟล์ทุก loop
+# - เขียนเฉพาะตอนมีเหตุการณ์ (trade / event) ใน transaction เดียวกับ running totals
+#   -> crash กลางทาง = ไม่มีอะไรเปลี่ยน (ไม่มีไฟล์เสีย)
+# - เก็บ history ทั้งหมดข้ามวัน/เดือน, รายงานใช้ aggregate query ตามช่วงเวลา (index บน ts)
+# - kv: ค่าเล็กๆ ที่ต้องจำข้าม restart (เช่น เวลาส่งรายงานล่าสุด)
+
+import sqlite3, json, os, time, threading, logging
+from datetime import datetime
+
+log = logging.getLogger("main")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS trades (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    symbol TEXT,
+    side TEXT NOT NULL,
+    entry REAL NOT NULL,
+    exit REAL NOT NULL,
+    qty REAL NOT NULL,
+    pnl REAL NOT NULL,
+    reason TEXT NOT NULL,
+    opened REAL
+);
+CREATE INDEX IF NOT EXISTS trades_ts ON trades(ts);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    kind TEXT NOT NULL,
+    data TEXT
+);
+CREATE TABLE IF NOT EXISTS totals (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    trades INTEGER NOT NULL,
+    wins INTEGER NOT NULL,
+    pnl REAL NOT NULL,
+    updated REAL NOT NULL
+);
+INSERT OR IGNORE INTO totals VALUES (1, 0, 0, 0.0, 0.0);
+CREATE TABLE IF NOT EXISTS kv (k TEXT PRIMARY KEY, v TEXT);
+"""
+
+class Journal:
+    def __init__(self, path="journal.db"):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")      # WAL + NORMAL: durable เมื่อ checkpoint, ไม่ fsync ทุก commit
+        self.db.executescript(SCHEMA)
+        cols = {r[1] for r in self.db.execute("PRAGMA table_info(trades)")}
+        if "opened" not in cols:
+            # journal เดิม: เพิ่มเวลาเปิด position (ใช้หา MAE/MFE); trade เก่าเป็น NULL
+            self.db.execute("ALTER TABLE trades ADD COLUMN opened REAL")
+
+    def _tx(self, fn):
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                out = fn(self.db)
+                self.db.execute("COMMIT")
+                return out
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+
+    # ---------------- write ----------------
+    def record_trade(self, side, entry, exit_price, qty, reason, symbol=None, ts=None, opened=None):
+        pnl = (exit_price - entry) * qty if side == "long" else (entry - exit_price) * qty
+        ts = ts or time.time()
+        def fn(db):
+            db.execute("INSERT INTO trades (ts, symbol, side, entry, exit, qty, pnl, reason, opened) VALUES (?,?,?,?,?,?,?,?,?)",
+                       (ts, symbol, side.upper(), entry, exit_price, qty, pnl, reason, opened))
+            db.execute("UPDATE totals SET trades = trades + 1, wins = wins + ?, pnl = pnl + ?, updated = ? WHERE id = 1",
+                       (int(pnl > 0), pnl, ts))
+        self._tx(fn)
+        return pnl
+
+    def event(self, kind, **data):
+        self._tx(lambda db: db.execute("INSERT INTO events (ts, kind, data) VALUES (?,?,?)",
+                                       (time.time(), kind, json.dumps(data, default=str))))
+
+    def set(self, k, v):
+        self._tx(lambda db: db.execute("INSERT OR REPLACE INTO kv VALUES (?,?)", (k, json.dumps(v))))
+
+    def get(self, k, default=None):
+        with self.lock:
+            row = self.db.execute("SELECT v FROM kv WHERE k = ?", (k,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    # ---------------- read ----------------
+    def totals(self):
+        with self.lock:
+            t, w, p, u = self.db.execute("SELECT trades, wins, pnl, updated FROM totals WHERE id = 1").fetchone()
+        return {"trades": t, "wins": w, "pnl": p, "updated": u}
+
+    def summary(self, start, end=None):
+        # aggregate ช่วง [start, end) (epoch sec)
+        end = end or time.time()
+        with self.lock:
+            n, pnl, tp, sl, be = self.db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(pnl), 0),"
+                " SUM(reason LIKE 'TP%'), SUM(reason = 'SL'), SUM(reason = 'BE')"
+                " FROM trades WHERE ts >= ? AND ts < ?", (start, end)).fetchone()
+        return {"trades": n, "pnl": pnl, "tp": tp or 0, "sl": sl or 0, "be": be or 0}
+
+    def trades(self, start=0, end=None):
+        cols, rows = self.trade_rows(start, end)
+        return [dict(zip(cols, r)) for r in rows]
+
+    def trade_rows(self, start=0, end=None):
+        # (columns, [tuple, ...]) เรียงตามเวลา -> analytics แปลงเป็น array ต่อคอลัมน์
+        end = end or time.time()
+        with self.lock:
+            cur = self.db.execute("SELECT ts, opened, symbol, side, entry, exit, qty, pnl, reason FROM trades"
+                                  " WHERE ts >= ? AND ts < ? ORDER BY ts", (start, end))
+            return [d[0] for d in cur.description], cur.fetchall()
+
+    # ---------------- migration ----------------
+    def import_stats(self, path):
+        # daily_pnl.json แบบเดิม -> trades (ครั้งเดียว ตอน journal ยังว่าง)
+        if not os.path.exists(path) or self.totals()["trades"]:
+            return 0
+        try:
+            s = json.load(open(path))
+        except Exception as e:
+            log.warning(f"[JOURNAL] skip import {path}: {e}")
+            return 0
+        n = 0
+        for t in s.get("trades", []):
+            try:
+                ts = datetime.strptime(f"{s['date']} {t['time']}", "%Y-%m-%d %H:%M:%S").timestamp()
+                entry, exit_price = float(t["entry"]), float(t["exit"])
+                qty = abs(t["pnl"] / (exit_price - entry)) if exit_price != entry else 0.0
+                self.record_trade(t["side"].lower(), entry, exit_price, qty, t["reason"], t.get("symbol"), ts)
+                n += 1
+            except (KeyError, ValueError, TypeError):
+                continue
+        log.info(f"[JOURNAL] imported {n} trades from {path}")
+        return n
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -3,8 +3,30 @@
 # Binance Futures – Nadaraya-Watson Envelope + MACD Confirm (TF ย่อย)
 # ปรับ: TP buffer, BE reason, BE via MACD option, EMA on/off, simplified daily report
 
-import ccxt, time, json, math, logging, os, requests
+import time
+T_START = time.time()                  # startup breakdown (report_boot) นับตั้งแต่ import
+import logging, os
 from datetime import datetime
+from candles import CandleStore, tf_seconds
+import nwe
+from feed import RestFeed, WsFeed, ReplayFeed
+from engine import Engine
+from plugins import NWPlugin, EMATrendPlugin, SMCFiboPlugin
+from history import HistoryStore, warm_up
+from portfolio import PortfolioFeed, Allocator
+from ratelimit import RateLimiter, LimitedExchange
+from notifier import Notifier
+from journal import Journal
+import metrics
+from gateway import Gateway, invalidate
+from resample import ratio
+from fake_exchange import FakeExchange
+from scheduler import Scheduler
+from execution import Executor
+from triggers import TriggerBook
+from boot import exchange_class, MarketCache
+from watchdog import Watchdog, Lease
+import analytics
 
 # ============================================================
 # CONFIG (ปรับได้)
@@ -31,6 +53,20 @@ USE_REPAINT = True
 LEVERAGE = 10
 POSITION_MARGIN_FRACTION = 0.7
 
+# Portfolio: มากกว่า 1 symbol -> process เดียว ใช้ exchange session + rate limiter ร่วมกัน
+# margin รวม = POSITION_MARGIN_FRACTION ของ wallet แบ่งตาม PORTFOLIO_WEIGHTS (ไม่ระบุ = เท่ากัน)
+SYMBOLS = [s for s in os.getenv("SYMBOLS", SYMBOL).split(",") if s]
+PORTFOLIO_WEIGHTS = {}                 # เช่น {"BTC/USDT:USDT": 2, "ETH/USDT:USDT": 1}
+
+# Strategy plugins (engine.py / plugins.py): หลาย strategy ใน process เดียว ใช้ market data ชุดเดียวกัน
+# "nw" = NW envelope (main.py), "ema" = EMA trend H1->M5 ("main.py (ema)"), "smc" = SMC + Fibo ("main.py smc fibo✅")
+# 1 position ต่อ symbol (one-way mode): strategy ที่เปิดก่อนถือ, ที่เหลือรอจนปิด
+STRATEGIES = [s for s in os.getenv("STRATEGIES", "nw").split(",") if s]
+
+# "ema": ladder TP / trailing stop เป็น trigger (triggers.py) ร่วมกับขั้น SL / alert / auto close
+EMA_TP_LADDER = ()                     # (กำไร pts, สัดส่วนของ qty ที่เหลือ) เช่น ((800, 0.3), (1100, 0.5))
+EMA_TRAIL = None                       # pts จากราคาดีสุด (None = ไม่ใช้)
+
 # Nadaraya params
 NW_BANDWIDTH = 8.0
 NW_MULT = 4
@@ -42,16 +78,86 @@ TP_BUFFER = 300                        # Q2: ค่านี้ปรับไ
 SL_DISTANCE = 2000                     # Q1: ปรับได้ (default 2000)
 USE_BREAKEVEN = True      #True,False  ยังคงมีเป็นออฟชัน (mid-based) ถ้า USE_BREAKEVEN_MACD False
 BREAKEVEN_OFFSET = 250
+USE_EXCHANGE_STOPS = True              # SL/TP เป็น STOP_MARKET / TAKE_PROFIT_MARKET บน exchange (ไม่พึ่ง loop)
+
+# Execution (execution.py): entry / exit แบ่งเป็น child orders ตาม depth ของ order book
+# "auto" = market ถ้า qty อยู่ใน EXEC_PARTICIPATION ของ depth (หรือไม่มี book) ไม่งั้น twap
+EXEC_ALGO = os.getenv("EXEC_ALGO", "auto")   # auto / market / twap / iceberg / post
+EXEC_SLICES = 4                        # twap: จำนวน slice (slice สุดท้าย = market ส่วนที่เหลือ)
+EXEC_INTERVAL_SEC = 5.0                # twap: ระยะห่างระหว่าง slice
+EXEC_TIMEOUT_SEC = 30.0                # iceberg / post: ไม่ fill ภายในนี้ -> market ส่วนที่เหลือ
+EXEC_PARTICIPATION = 0.25              # slice ไม่เกินสัดส่วนนี้ของ depth ภายใน EXEC_MAX_BPS จาก mid
+EXEC_MAX_BPS = 10.0
 
 # Daily report (ครั้งเดียว/วัน)
 DAILY_REPORT_HH = 23
 DAILY_REPORT_MM = 59
-STATS_FILE = "daily_pnl.json"
-REPORT_SENT_FILE = "daily_report_sent.txt"
-
-LOOP_SEC = 10
+JOURNAL_FILE = "journal.db"            # SQLite (WAL) trade journal
+STATS_FILE = "daily_pnl.json"          # รูปแบบเดิม: import เข้า journal ครั้งแรกเท่านั้น
+ANALYTICS_FILE = "analytics.txt"       # รายงานเดือน: + analytics ทั้ง history (analytics.py) ลงไฟล์นี้และ Telegram
+ANALYTICS_WINDOW = 50                  # rolling window (trade)
+
+# Cold start (boot.py): market metadata + leverage ที่ตั้งแล้ว cache ลง disk
+MARKET_CACHE_FILE = "markets.json"
+MARKET_CACHE_TTL = 24 * 3600           # เกินนี้ -> load_markets ก่อนเริ่ม (และตั้ง leverage ใหม่)
+MARKET_REFRESH_SEC = 3600              # เกินนี้ (ยังไม่เกิน TTL) -> ใช้ cache แล้ว refresh เบื้องหลัง
+
+LOOP_SEC = 10                          # ws: รอ event นานสุดก่อน REST fallback
+
+# Adaptive loop (scheduler.py): ตื่นตอนแท่งทุก TF ปิด + poll ถี่ขึ้นเมื่อราคาเข้าใกล้ band / SL / TP
+LOOP_MIN_SEC = 1.0                     # ราคาห่าง level ใกล้สุด <= LOOP_NEAR
+LOOP_MAX_SEC = 30.0                    # ห่างทุก level >= LOOP_FAR (หรือไม่มี level)
+LOOP_NEAR = 0.0015                     # สัดส่วนของราคา (0.15%)
+LOOP_FAR = 0.02
+LOOP_WEIGHT_BUDGET = 600               # REQUEST_WEIGHT/นาที ที่ loop ใช้ได้ (limit 2400)
+CLOSE_LAG_SEC = 1.0                    # ตื่นหลังขอบแท่งเท่านี้ (รอ exchange เปิดแท่งใหม่)
+
+# Multi-timeframe: ดึงจาก exchange แค่ BASE_TF แล้ว resample เป็น TF ที่ใหญ่กว่า (เช่น 5m -> 30m)
+# None = ใช้ TF เล็กสุดที่เปิดใช้อยู่; TF ที่ไม่ใช่จำนวนเท่าของ base จะดึงแยกตามเดิม
+BASE_TF = os.getenv("BASE_TF") or None
+
+# Local candle history (warm-up จาก disk แทน network, เก็บแท่งที่ปิดแล้วต่อเนื่อง)
+USE_HISTORY = True
+HISTORY_DIR = "data"
+
+# Market data: "rest" = poll ตาม scheduler, "ws" = WebSocket event-driven (REST fallback),
+# "replay" = เล่น message ที่อัดไว้แบบ offline (ใช้ fake exchange)
+MARKET_DATA_MODE = os.getenv("MARKET_DATA_MODE", "rest")
+WS_RECORD_FILE = os.getenv("WS_RECORD_FILE")          # ws: อัด message ลงไฟล์ (jsonl)
+REPLAY_FILE = os.getenv("REPLAY_FILE", "replay.jsonl")
+REPLAY_SPEED = 0.0                                    # 0 = เร็วที่สุด
+WS_DEPTH = os.getenv("WS_DEPTH", "0") == "1"          # ws: subscribe depth20 + aggTrade (อัดไว้ให้ replay fill ตาม book)
+
+# Paper trading: market data จาก Binance จริง (rest / ws) แต่ order / balance / position อยู่ใน FakeExchange
+# fill ตาม order book (depth) -> สรุป slippage / fee ทุก PAPER_REPORT_SEC และตอนจบ (replay ใช้ exchange จำลองเสมอ)
+PAPER_TRADING = os.getenv("PAPER", "0") == "1"
+PAPER_BALANCE = float(os.getenv("PAPER_BALANCE", "1000"))
+PAPER_REPORT_SEC = 3600
 LOG_LEVEL = logging.INFO
 
+# Watchdog (watchdog.py): stage ไม่มี heartbeat เกิน HEARTBEAT_SEC -> หยุดต่อ lease (standby รับ)
+# stage ค้างเกิน STAGE_TIMEOUT_SEC / ไม่มีรอบไหนจบเกิน ITERATION_TIMEOUT_SEC -> exit (supervisor / standby รับต่อ)
+# REST ที่ช้าหยุดเองที่ EXCHANGE_TIMEOUT_SEC (ccxt timeout) -> error path ปกติ; ไม่ใช้ใน replay
+WATCHDOG_ENABLED = True
+HEARTBEAT_SEC = 5.0
+STAGE_TIMEOUT_SEC = 60.0
+ITERATION_TIMEOUT_SEC = 600.0
+EXCHANGE_TIMEOUT_SEC = 10.0
+# Hot standby: รัน process ที่สองใน directory เดียวกัน (journal เดียวกัน) -> ถือ lease ได้ตัวเดียวที่เทรด
+# อีกตัว warm-up รอไว้ แล้วรับช่วง (restore จาก checkpoint) เมื่อ primary ไม่ต่อ lease ภายใน LEASE_TTL_SEC
+# lease ต่ออายุจาก watchdog thread -> HA ต้องเปิด WATCHDOG_ENABLED
+HA_ENABLED = os.getenv("HA", "0") == "1"
+LEASE_NAME = "trader"
+LEASE_TTL_SEC = 10.0
+LEASE_RENEW_SEC = 2.0
+LEASE_GUARD_SEC = 2.0                  # ส่ง order / เขียน checkpoint เมื่อ lease เหลืออายุอย่างน้อยเท่านี้
+LEASE_POLL_SEC = 1.0                   # standby: ตรวจ lease ทุกเท่านี้
+
+# Metrics: ปิด = no-op; เปิด = http://127.0.0.1:METRICS_PORT/metrics + สรุปลง log ทุก METRICS_LOG_SEC
+METRICS_ENABLED = os.getenv("METRICS", "0") == "1"
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+METRICS_LOG_SEC = 300
+
 TELEGRAM_TOKEN   = os.getenv("TELEGRAM_TOKEN", "YOUR_TELEGRAM_TOKEN")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID", "YOUR_CHAT_ID")
 
@@ -65,34 +171,76 @@ logging.basicConfig(
 )
 log = logging.getLogger("main")
 
+_notifier = None
+
 def tg(msg):
+    # ไม่บล็อก: เข้าคิวแล้ว thread ของ Notifier ส่งให้ (ดู notifier.py)
+    global _notifier
     if not TELEGRAM_TOKEN or TELEGRAM_TOKEN.startswith("YOUR"):
         return
-    try:
-        requests.get(
-            f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage",
-            params={"chat_id": TELEGRAM_CHAT_ID, "text": msg}
-        )
-    except:
-        pass
+    if _notifier is None:
+        _notifier = Notifier(TELEGRAM_TOKEN, TELEGRAM_CHAT_ID)
+    _notifier.send(msg)
 
 # ============================================================
 # Exchange Setup
 # ============================================================
-def setup_exchange():
-    ex = ccxt.binance({
+def public_client():
+    return exchange_class()({"enableRateLimit": False, "timeout": int(EXCHANGE_TIMEOUT_SEC * 1000),
+                             "options": {"defaultType": "future"}})
+
+def setup_exchange(symbols=(SYMBOL,), limiter=None, marks=None):
+    marks = [] if marks is None else marks
+    cls = exchange_class()                    # เฉพาะ binanceusdm ไม่ import ccxt ทั้ง package
+    marks.append(("ccxt", time.time()))
+    ex = cls({
         "apiKey": API_KEY,
         "secret": SECRET,
-        "enableRateLimit": True,
+        "enableRateLimit": False,             # ใช้ limiter กลาง (weight-aware) แทน
+        "timeout": int(EXCHANGE_TIMEOUT_SEC * 1000),
         "options": {"defaultType": "future"}
     })
-    ex.load_markets()
-    try:
-        ex.set_leverage(LEVERAGE, SYMBOL)
-    except Exception as e:
-        log.warning(f"set_leverage warn: {e}")
+    # ccxt -> metrics -> weight limiter -> cache/coalescing
+    ex = Gateway(LimitedExchange(metrics.instrument(ex), limiter or RateLimiter()))
+    cache = MarketCache(MARKET_CACHE_FILE, MARKET_CACHE_TTL, MARKET_REFRESH_SEC)
+    log.info(f"[BOOT] markets from {cache.load(ex, symbols, public_client)}")
+    marks.append(("markets", time.time()))
+    for sym in symbols:
+        if cache.leverage_ok(sym, LEVERAGE):
+            continue                          # ตั้งไว้แล้ว (ตาม cache) ไม่ต้องเรียกซ้ำ
+        try:
+            ex.set_leverage(LEVERAGE, sym)
+            cache.set_leverage(sym, LEVERAGE)
+        except Exception as e:
+            log.warning(f"set_leverage {sym} warn: {e}")
+    marks.append(("leverage", time.time()))
+    return ex
+
+def setup_paper(symbols=(SYMBOL,), limiter=None, marks=None):
+    # public market data ผ่าน gateway เดิม (ไม่ใช้ API key), order ไม่ออกจากเครื่อง
+    marks = [] if marks is None else marks
+    data = public_client()
+    marks.append(("ccxt", time.time()))
+    data = Gateway(LimitedExchange(metrics.instrument(data), limiter or RateLimiter()))
+    cache = MarketCache(MARKET_CACHE_FILE, MARKET_CACHE_TTL, MARKET_REFRESH_SEC)
+    log.info(f"[BOOT] markets from {cache.load(data, symbols, public_client)}")
+    marks.append(("markets", time.time()))
+    ex = FakeExchange(balance=PAPER_BALANCE, leverage=LEVERAGE, data=data)
+    for sym in symbols:
+        ex.set_leverage(LEVERAGE, sym)
+    log.info(f"[PAPER] simulated account {PAPER_BALANCE:.2f} USDT, fills from order book")
     return ex
 
+def paper_report(ex, journal):
+    # execution quality ของ exchange จำลอง: slippage เทียบ mid ตอนส่ง order + fee
+    r = ex.exec_report()
+    log.info(f"[PAPER] orders={r['orders']} fills={r['fills']} (maker {r['maker_fills']}) notional={r['notional']:.2f}"
+             f" fees={r['fees']:.2f} ({r['fee_bps']:.2f}bps) slippage avg={r['slippage_bps_avg']:.2f}bps"
+             f" p95={r['slippage_bps_p95']:.2f}bps cost={r['slippage_cost']:.2f} rejects={r['rejects']}"
+             f" balance={r['balance']:.2f}")
+    journal.event("exec_report", **r)
+    return r
+
 # ============================================================
 # Indicators
 # ============================================================
@@ -106,19 +254,8 @@ def ema(series, period):
     return e
 
 def nwe_luxalgo_repaint(closes, h=NW_BANDWIDTH, mult=NW_MULT, factor=NW_FACTOR):
-    n = len(closes)
-    if n < 200:
-        return None, None, None
-    win = min(499, n - 1)
-    coefs = [math.exp(-(i * i) / (2 * (h ** 2))) for i in range(win)]
-    den = sum(coefs)
-    num = sum(closes[-1 - j] * coefs[j] for j in range(win))
-    mean = num / den
-    win_s = int(h * 10)
-    win_s = min(win_s, win - 1)
-    diffs = [abs(closes[-1 - i] - closes[-1 - i - 1]) for i in range(1, win_s)]
-    mae = (sum(diffs) / len(diffs)) * mult * factor if diffs else 0.0
-    return mean + mae, mean - mae, mean
+    # kernel cache + np.dot (ดู nwe.py)
+    return nwe.get_engine(h, mult, factor).envelope(closes)
 
 def macd(closes, fast=12, slow=26, signal=9):
     if len(closes) < slow + signal + 5:
@@ -152,12 +289,6 @@ def macd(closes, fast=12, slow=26, signal=9):
         dea.append(e)
     return dif_clean[-2], dif_clean[-1], dea[-2], dea[-1]
 
-def macd_up(dp,dn,ep,en):   # ตัดขึ้น
-    return dp <= ep and dn > en
-
-def macd_down(dp,dn,ep,en): # ตัดลง
-    return dp >= ep and dn < en
-
 # ============================================================
 # Position sizing
 # ============================================================
@@ -165,53 +296,144 @@ def free_usdt(ex):
     bal = ex.fetch_balance({"type":"future"})
     return float((bal.get("USDT") or {}).get("free") or 0.0)
 
-def order_size(ex, price):
+def order_size(ex, price, symbol=SYMBOL):
     free = free_usdt(ex)
     margin = free * POSITION_MARGIN_FRACTION
     notional = margin * LEVERAGE
     qty = notional / price if price > 0 else 0
     try:
-        return float(ex.amount_to_precision(SYMBOL, qty))
+        return float(ex.amount_to_precision(symbol, qty))
     except:
         return round(qty, 3)
 
+def send_order(ex, journal, symbol, side, qty, ref, reduce=False, label=""):
+    # parent order ผ่าน execution.py -> บันทึก implementation shortfall ต่อ trade
+    e = Executor(ex, EXEC_ALGO, EXEC_SLICES, EXEC_INTERVAL_SEC, EXEC_TIMEOUT_SEC,
+                 EXEC_PARTICIPATION, EXEC_MAX_BPS).run(symbol, side, qty, reduce, ref)
+    r = e.report()
+    if r["algo"] != "market" or r["filled"] < qty:
+        bps = f"{r['shortfall_bps']:+.2f}bps" if r["shortfall_bps"] is not None else "-"
+        log.info(f"[EXEC] {label}{side} {r['filled']}/{qty} {r['algo']} children={r['children']} "
+                 f"avg={r['avg']} arrival={r['arrival']} IS={bps}")
+    journal.event("execution", **r)
+    return e
+
+def close_market(ex, om, journal, side, qty, ref, label=""):
+    # ปิดครบ -> cancel SL/TP; ไม่ครบ -> SL/TP วางใหม่เท่าส่วนที่เหลือ (stop ทะลุแล้ว -> om flatten, fill รอ reconcile)
+    e = send_order(ex, journal, om.symbol, side, qty, ref, reduce=True, label=label)
+    if e.remaining() <= 0:
+        om.cancel_all()
+    else:
+        om.resize(e.remaining())
+    return e
+
+def order_metrics(order, ref_price, buy, t_order, t_signal=None):
+    # signal -> ส่ง order, ส่ง -> fill (market ack), slippage เทียบราคาที่ใช้ตัดสินใจ (bps, + = เสียเปรียบ)
+    if not metrics.enabled():
+        return
+    now = time.time()
+    if t_signal:
+        metrics.observe("signal_to_order_seconds", t_order - t_signal)
+    metrics.observe("order_to_fill_seconds", now - t_order)
+    avg = (order or {}).get("average")
+    if avg and ref_price:
+        slip = (avg - ref_price) / ref_price * 1e4 * (1 if buy else -1)
+        metrics.observe("slippage_bps", slip, metrics.BPS_BUCKETS)
+
+def trade_msg(side, reason, entry, exit_price, pnl, note=None):
+    S = side.upper()
+    if reason == "TP_mid_trend_flip":
+        return f"⚠ {S} EMA Flip TP Mid @ {exit_price:.2f} PnL={pnl:+.2f}"
+    if reason.startswith("TP"):
+        return f"✅ {S} TP @ {exit_price:.2f} PnL={pnl:+.2f}"
+    if note == "MACD close":
+        return f"❌ {S} SL (MACD close) {entry:.2f}->{exit_price:.2f} PnL={pnl:+.2f}"
+    return f"🚨 {S} {reason} {entry:.2f}->{exit_price:.2f} PnL={pnl:+.2f}"
+
+def execute(ex, om, strat, journal, act, size=None, label="", t_signal=None):
+    # ทำ action จาก strategy บน exchange จริง (symbol = om.symbol, size(price) -> qty)
+    t = act["type"]
+    symbol = om.symbol
+    metrics.inc("actions_total", type=t)
+    if t == "open":
+        side, price = act["side"], act["price"]
+        qty = size(price) if size else order_size(ex, price, symbol)
+        t_order = time.time()
+        e = send_order(ex, journal, symbol, "buy" if side=="long" else "sell", qty, price, label=label)
+        order_metrics({"average": e.avg}, price, side == "long", t_order, t_signal)
+        if e.filled <= 0:
+            log.warning(f"{label}OPEN {side.upper()} not filled, dropped")
+            strat.position = None
+            return
+        qty = e.filled
+        strat.position["qty"] = qty
+        strat.position["opened"] = act.get("ts") or time.time()
+        if USE_EXCHANGE_STOPS and not strat.client_stops and not om.protect(side, qty, act["sl"], act["tp"]):
+            # ไม่มี SL บน exchange -> ปิดไปแล้ว (engine ส่ง fill ให้ plugin ต่อ)
+            log.error(f"{label}OPEN {side.upper()} {qty} @ {price:.2f}: SL not placed, closed at market")
+            tg(f"{label}🚨 {side.upper()} opened without SL -> closed at market")
+            return
+        tp = f"{act['tp']:.2f}" if act["tp"] is not None else "-"
+        log.info(f"🚀 {label}OPEN {side.upper()} ({act['note']}) @ {price:.2f} SL@{act['sl']:.2f} TP@{tp}")
+        tg(f"{label}{'🟢' if side=='long' else '🔴'} {side.upper()} {price:.2f}")
+    elif t in ("close", "closed"):
+        pos = act["position"]
+        price, qty = act["price"], pos["qty"]
+        if t == "close":
+            t_order = time.time()
+            e = close_market(ex, om, journal, "sell" if pos["side"]=="long" else "buy", qty, price, label)
+            order_metrics({"average": e.avg}, price, pos["side"] == "short", t_order, t_signal)
+            rest = e.remaining()
+            if rest > 0:
+                # ปิดไม่ครบ -> ส่วนที่เหลือกลับไปให้ plugin ดูแลต่อ (SL/TP บน exchange ยังอยู่)
+                log.error(f"{label}CLOSE {pos['side'].upper()} filled {e.filled}/{qty} ({e.error or 'under-filled'}), "
+                          f"residual {rest} kept")
+                tg(f"{label}🚨 {pos['side'].upper()} close filled {e.filled}/{qty}, residual {rest} still open")
+                strat.position = dict(pos, qty=rest)
+                if e.filled <= 0:
+                    return
+            price, qty = e.avg or price, e.filled
+        pnl = record_trade(journal, pos["side"], pos["entry"], price, qty, act["reason"],
+                           symbol if label else None, act.get("ts"), pos.get("opened"))
+        tg(label + trade_msg(pos["side"], act["reason"], pos["entry"], price, pnl, act.get("note")))
+    elif t == "reduce":
+        # ปิดบางส่วน (เช่น TP1 ของ smc) -> บันทึกเป็น trade ของส่วนที่ปิด
+        pos = act["position"]
+        try:
+            qty = float(ex.amount_to_precision(symbol, act["qty"]))
+        except Exception:
+            qty = round(act["qty"], 3)
+        t_order = time.time()
+        e = send_order(ex, journal, symbol, "sell" if pos["side"]=="long" else "buy", qty, act["price"], True, label)
+        order_metrics({"average": e.avg}, act["price"], pos["side"] == "short", t_order, t_signal)
+        if e.filled < qty:
+            log.error(f"{label}REDUCE {pos['side'].upper()} filled {e.filled}/{qty} ({e.error or 'under-filled'})")
+            if e.filled <= 0:
+                return
+        qty, price = e.filled, e.avg or act["price"]
+        pos["qty"] -= qty
+        pnl = record_trade(journal, pos["side"], pos["entry"], price, qty, act["reason"],
+                           symbol if label else None, act.get("ts"), pos.get("opened"))
+        tg(f"{label}✅ {pos['side'].upper()} {act['reason']} {qty} @ {price:.2f} PnL={pnl:+.2f}")
+    elif t == "move_sl":
+        if om.active():
+            om.move_sl(act["sl"])
+    elif t == "alert":
+        log.info(f"[ALERT] {label}{act['msg']}")
+        tg(label + act["msg"])
+
 # ============================================================
-# Daily Stats
+# Trade journal / Monthly report
 # ============================================================
-def load_stats():
-    if os.path.exists(STATS_FILE):
-        try:
-            return json.load(open(STATS_FILE,"r"))
-        except:
-            pass
-    return {
-        "date": datetime.now().strftime("%Y-%m-%d"),
-        "pnl": 0.0,
-        "trades": []   # list of dict: {time, side, entry, exit, pnl, reason}
-    }
-
-def save_stats(s):
-    json.dump(s, open(STATS_FILE,"w"), indent=2)
-
-def has_sent_today():
-    if not os.path.exists(REPORT_SENT_FILE):
-        return False
-    d = open(REPORT_SENT_FILE).read().strip()
-    return d == datetime.now().strftime("%Y-%m-%d")
-
-def mark_sent_today():
-    open(REPORT_SENT_FILE,"w").write(datetime.now().strftime("%Y-%m-%d"))
-
-def reset_report_if_new_day(stats):
-    today = datetime.now().strftime("%Y-%m-%d")
-    if stats.get("date") != today:
-        stats["date"] = today
-        stats["pnl"] = 0.0
-        stats["trades"] = []
-        save_stats(stats)
-        open(REPORT_SENT_FILE,"w").write("")
-
-def try_send_daily_report(stats):
+def open_journal():
+    j = Journal(JOURNAL_FILE)
+    j.import_stats(STATS_FILE)          # ย้าย daily_pnl.json เดิมเข้ามาครั้งแรก
+    return j
+
+def record_trade(journal, side, entry, exit_price, qty, reason, symbol=None, ts=None, opened=None):
+    return journal.record_trade(side, entry, exit_price, qty, reason, symbol, ts, opened)
+
+def try_send_daily_report(journal):
     now = datetime.now()
 
     # ส่งเฉพาะวันที่ 25 ของทุกเดือน เวลาเดิม HH:MM
@@ -219,417 +441,346 @@ def try_send_daily_report(stats):
         return
 
     # กันส่งซ้ำเดือนเดียวกัน
-    if has_sent_today():
+    today = now.strftime("%Y-%m-%d")
+    if journal.get("report_sent") == today:
         return
 
-    tp_count = sum(1 for t in stats["trades"] if t.get("reason","").startswith("TP"))
-    sl_count = sum(1 for t in stats["trades"] if t.get("reason","") == "SL")
-    be_count = sum(1 for t in stats["trades"] if t.get("reason","") == "BE")
-    total_pnl = stats["pnl"]
+    # ช่วงรายงาน = ตั้งแต่รายงานครั้งก่อน (ครั้งแรก: ต้นเดือน)
+    start = journal.get("report_ts") or now.replace(day=1, hour=0, minute=0, second=0, microsecond=0).timestamp()
+    s = journal.summary(start, now.timestamp())
 
     lines = [
-        f"📅 รายงานประจำเดือน {stats['date']}",
-        f"TP: {tp_count}   SL: {sl_count}   BE: {be_count}",
-        f"Σ PnL: {total_pnl:+.2f} USDT"
+        f"📅 รายงานประจำเดือน {today}",
+        f"TP: {s['tp']}   SL: {s['sl']}   BE: {s['be']}",
+        f"Σ PnL: {s['pnl']:+.2f} USDT"
     ]
     tg("\n".join(lines))
-    mark_sent_today()
+    try:
+        hist = HistoryStore(HISTORY_DIR) if USE_HISTORY else None
+        res = analytics.analyze(journal, hist, TIMEFRAME, SYMBOL, ANALYTICS_WINDOW)
+        analytics.write_report(analytics.render(res), ANALYTICS_FILE, tg)
+    except Exception as e:
+        log.warning(f"analytics report failed: {e}")
+    journal.set("report_sent", today)
+    journal.set("report_ts", now.timestamp())
     log.info("📨 Monthly report sent.")
-    
+
 # ============================================================
-# Main Loop
+# Per-symbol bot
 # ============================================================
-def main():
-    ex = setup_exchange()
-    log.info(f"✅ Started Binance Futures NW Bot ({TIMEFRAME}, MACD={MACD_TF}, TP_BUFFER={TP_BUFFER})")
-
-    stats = load_stats()
-
-    position = None          # {"side","qty","entry","sl","tp"}
-    sl_lock = False
-    pending = None           # {"side","touch_price","lower","upper","mid","ts"}
+def make_plugins(names=None):
+    out = []
+    for name in names or STRATEGIES:
+        if name == "nw":
+            out.append(NWPlugin(
+                timeframe=TIMEFRAME, macd_tf=MACD_TF, be_macd_tf=BREAKEVEN_MACD_TF,
+                ema_fast=EMA_FAST, ema_slow=EMA_SLOW, nw=(NW_BANDWIDTH, NW_MULT, NW_FACTOR),
+                tp_buffer=TP_BUFFER, sl_distance=SL_DISTANCE, breakeven_offset=BREAKEVEN_OFFSET,
+                use_breakeven=USE_BREAKEVEN, use_breakeven_macd=USE_BREAKEVEN_MACD,
+                ema_enabled=EMA_ENABLED, macd_enabled=MACD_ENABLED,
+                client_stops=not USE_EXCHANGE_STOPS,
+                freeze_sec=tf_seconds(TIMEFRAME) * UPDATE_FRACTION))
+        elif name == "ema":
+            out.append(EMATrendPlugin(ladder=EMA_TP_LADDER, trail=EMA_TRAIL))
+        elif name == "smc":
+            out.append(SMCFiboPlugin())
+        else:
+            raise ValueError(f"unknown strategy: {name}")
+    return out
+
+def make_scheduler(plugins, limiter=None):
+    # ขอบแท่งของทุก TF + รอบ NW freeze (ถ้ามี)
+    extra = [p.strat.freeze_sec for p in plugins if isinstance(p, NWPlugin)]
+    return Scheduler(need_timeframes(plugins), extra, LOOP_MIN_SEC, LOOP_MAX_SEC, LOOP_NEAR, LOOP_FAR,
+                     LOOP_WEIGHT_BUDGET, limiter, CLOSE_LAG_SEC)
+
+def need_timeframes(plugins):
+    # tf -> จำนวนแท่งมากสุดที่ plugin ใดๆ ต้องใช้
+    need = {}
+    for p in plugins:
+        for tf, n in p.timeframes.items():
+            need[tf] = max(need.get(tf, 0), n)
+    return need
+
+def data_plan(need):
+    # -> (fetch: tf -> จำนวนแท่งที่ดึงจาก exchange, derived: tf -> (base_tf, จำนวนแท่ง))
+    base = BASE_TF or min(need, key=tf_seconds)
+    fetch, derived = {base: need.get(base, 0)}, {}
+    for tf, n in need.items():
+        if tf == base:
+            continue
+        try:
+            k = ratio(base, tf)
+        except ValueError:
+            fetch[tf] = n
+            continue
+        derived[tf] = (base, n)
+        fetch[base] = max(fetch[base], (n + 1) * k)     # +1 เผื่อ bucket แรกที่ไม่ครบ
+    if not fetch[base]:
+        del fetch[base]                                  # BASE_TF ไม่ได้ใช้ และไม่มี TF ไหน derive ได้
+    return fetch, derived
+
+class SymbolBot(Engine):
+    """state ต่อ symbol: plugins (STRATEGIES) + streaming indicators ร่วมกัน + protective orders
+    tick() = 1 รอบ decision โดยอ่าน market data ผ่าน feed (RestFeed / WsFeed / ReplayFeed / SymbolView)"""
+    def __init__(self, ex, symbol, store, feed, journal, hist=None, size=None, label="", plugins=None, triggers=None):
+        super().__init__(ex, symbol, store, feed, journal, plugins or make_plugins(), execute,
+                         hist=hist, size=size, label=label, triggers=triggers)
 
-    last_nw_update = 0
-    upper = lower = mid = None
+# ============================================================
+# Main Loop
+# ============================================================
+def make_watchdog():
+    # (watchdog, lease) ของ process; replay ไม่ใช้
+    if MARKET_DATA_MODE == "replay":
+        return None, None
+    if HA_ENABLED and not WATCHDOG_ENABLED:
+        # ไม่มี watchdog = ไม่มีใครต่อ lease -> primary สลับเป็น standby ทุก TTL
+        raise ValueError("HA=1 requires WATCHDOG_ENABLED (lease is renewed by the watchdog)")
+    lease = Lease(JOURNAL_FILE, LEASE_NAME, LEASE_TTL_SEC, LEASE_GUARD_SEC) if HA_ENABLED else None
+    wd = None
+    if WATCHDOG_ENABLED:
+        wd = Watchdog(STAGE_TIMEOUT_SEC, iteration=ITERATION_TIMEOUT_SEC, beat=HEARTBEAT_SEC,
+                      lease=lease, renew_sec=LEASE_RENEW_SEC).start()
+    return wd, lease
+
+def stage(wd, name, budget=None):
+    return wd.stage(name, budget) if wd else metrics.span("stage", stage=name)
+
+def standby(lease, wd, feed, journal):
+    # รอจนได้ lease (primary หยุด / ค้าง); ระหว่างรอ data / session พร้อมใช้อยู่แล้ว -> False = feed จบ
+    t0, waiting = time.time(), False
+    while not lease.acquire():
+        if not waiting:
+            log.warning(f"[LEASE] standby ({lease.owner}), waiting for '{lease.name}'")
+            waiting = True
+        if wd:
+            wd.iteration()
+        if feed.done:
+            return False
+        time.sleep(LEASE_POLL_SEC)
+    if waiting:
+        log.warning(f"[LEASE] takeover after {time.time() - t0:.1f}s (epoch {lease.epoch})")
+        tg(f"⚠️ standby took over (epoch {lease.epoch})")
+    journal.event("lease", owner=lease.owner, epoch=lease.epoch, waited=round(time.time() - t0, 3))
+    return True
+
+def report_boot(journal, marks):
+    # marks = [(stage, epoch)] -> เวลาแต่ละช่วง + รวม startup -> decision แรก
+    parts = {b[0]: round(b[1] - a[1], 3) for a, b in zip(marks, marks[1:])}
+    total = marks[-1][1] - marks[0][1]
+    log.info(f"[BOOT] first decision after {total:.2f}s " + " ".join(f"{k}={v:.2f}s" for k, v in parts.items()))
+    journal.event("boot", total=round(total, 3), **parts)
 
-    while True:
+def main():
+    marks = [("start", T_START), ("imports", time.time())]
+    if METRICS_ENABLED:
+        metrics.enable(METRICS_PORT)
+    if MARKET_DATA_MODE != "replay" and len(SYMBOLS) > 1:
+        return run_portfolio(SYMBOLS)
+    fake = limiter = None
+    if MARKET_DATA_MODE == "replay":
+        fake = FakeExchange(balance=PAPER_BALANCE, leverage=LEVERAGE)
+        ex = metrics.instrument(fake)
+        marks.append(("exchange", time.time()))
+    elif PAPER_TRADING:
+        limiter = RateLimiter()
+        ex = fake = setup_paper(limiter=limiter, marks=marks)
+    else:
+        limiter = RateLimiter()
+        ex = setup_exchange(limiter=limiter, marks=marks)
+    log.info(f"✅ Started Binance Futures Bot {STRATEGIES} ({TIMEFRAME}, MACD={MACD_TF}, TP_BUFFER={TP_BUFFER})")
+
+    journal = open_journal()
+
+    # candle cache: backfill ครั้งเดียว แล้ว update แบบ incremental ทุก loop
+    store = CandleStore(ex)
+    plugins = make_plugins()
+    need = need_timeframes(plugins)
+    hist = None
+    if MARKET_DATA_MODE == "replay":
+        for tf, n in need.items():
+            store.limits[(SYMBOL, tf)] = n
+        feed = ReplayFeed(ex, store, SYMBOL, list(need), REPLAY_FILE, REPLAY_SPEED)
+        if feed.price is not None:
+            fake.set_price(SYMBOL, feed.price)
+    else:
+        hist = HistoryStore(HISTORY_DIR) if USE_HISTORY else None
+        fetched = warm_up_symbol(ex, store, hist, SYMBOL, need)
+        if MARKET_DATA_MODE == "ws":
+            feed = WsFeed(ex, store, SYMBOL, fetched, LOOP_SEC, user_data=fake is None,
+                          record_path=WS_RECORD_FILE, depth=WS_DEPTH)
+        else:
+            feed = RestFeed(ex, store, SYMBOL, LOOP_SEC)
+    if fake is not None and MARKET_DATA_MODE != "rest":
+        # depth / trade / ราคาจาก stream -> fill จำลอง + trigger SL/TP บน exchange จำลอง
+        feed.listeners.append(lambda d: fake.on_stream(SYMBOL, d))
+        feed.listeners.append(lambda d: feed.price is not None and fake.set_price(SYMBOL, feed.price))
+    log.info(f"[FEED] market data mode: {MARKET_DATA_MODE}")
+    marks.append(("warmup", time.time()))
+    bot = SymbolBot(ex, SYMBOL, store, feed, journal, hist, plugins=plugins)
+    sched = make_scheduler(plugins, limiter)
+    if MARKET_DATA_MODE != "rest":
+        # ราคาจาก stream -> trigger ยิงทันทีที่ราคาข้าม (ทำ action ในรอบ decision ถัดไป)
+        feed.listeners.append(lambda d: feed.price is not None and bot.triggers.update(SYMBOL, feed.price))
+    wd, lease = make_watchdog()
+    bot.watchdog = wd
+    if lease:
+        bot.fence = lease.held
+        standby(lease, wd, feed, journal)
+        marks.append(("standby", time.time()))
+    if MARKET_DATA_MODE != "replay" and not feed.done:
+        with stage(wd, "restore"):
+            bot.restore()              # replay เริ่มจากศูนย์เสมอ (deterministic)
+    marks.append(("restore", time.time()))
+
+    t_report = time.time()
+    while not feed.done:
         try:
-            reset_report_if_new_day(stats)
-            try_send_daily_report(stats)
-
-            # TF main
-            candles = ex.fetch_ohlcv(SYMBOL, TIMEFRAME, limit=600)
-            closes = [c[4] for c in candles]
-            last_close = closes[-1]
-
-            # EMA Trend (if enabled)
-            e_fast = ema(closes, EMA_FAST) if EMA_ENABLED else None
-            e_slow = ema(closes, EMA_SLOW) if EMA_ENABLED else None
-            if EMA_ENABLED and (e_fast is None or e_slow is None):
-                time.sleep(LOOP_SEC); continue
-            trend = "BUY" if EMA_ENABLED and e_fast > e_slow else "SELL" if EMA_ENABLED else None
-
-            # NW freeze
-            now_ts = time.time()
-            if "m" in TIMEFRAME:
-                tf_minutes = int(TIMEFRAME.replace("m",""))
-            else:
-                tf_minutes = int(TIMEFRAME.replace("h","")) * 60
-            freeze_sec = tf_minutes * 60 * UPDATE_FRACTION
-
-            if upper is None or now_ts - last_nw_update > freeze_sec:
-                u,l,m = nwe_luxalgo_repaint(closes)
-                if u is None:
-                    log.info("[DEBUG] NW not ready"); time.sleep(LOOP_SEC); continue
-                upper,lower,mid = u,l,m
-                last_nw_update = now_ts
-                log.info(f"[DEBUG] NW updated: U={upper:.2f}, L={lower:.2f}, M={mid:.2f}")
-            else:
-                log.info("[DEBUG] Using previous NW band (frozen)")
-
-            # MACD small TF for entry confirm
-            macd_side_ok = None
-            if MACD_ENABLED:
-                small = ex.fetch_ohlcv(SYMBOL, MACD_TF, limit=200)
-                mcloses = [c[4] for c in small[:-1]]
-                mac = macd(mcloses)
-                if mac:
-                    dp,dn,ep,en = mac
-                    # If EMA is enabled, we still respect trend for entry; if EMA disabled, trend var is None
-                    if EMA_ENABLED:
-                        if trend=="BUY":
-                            macd_side_ok = macd_up(dp,dn,ep,en)
-                        else:
-                            macd_side_ok = macd_down(dp,dn,ep,en)
-                    else:
-                        # without EMA: use MACD direction to confirm side of pending
-                        macd_side_ok = True  # pending will later check correct sign relative to pending side
-                # else: macd_side_ok stays None
-
-            # Read live position on exchange
-            try:
-                pos_list = ex.fetch_positions([SYMBOL])
-                amt = 0.0; live_side = None
-                for p in pos_list:
-                    if p.get("symbol") == SYMBOL and float(p.get("contracts") or 0) != 0:
-                        amt = float(p["contracts"])
-                        live_side = p["side"]
-                        break
-            except:
-                amt=0.0; live_side=None
-
-            if amt == 0 and position is not None:
-                log.info("⚠ Position disappeared on exchange, reset local state.")
-                position = None
-
-            # ---------------- MANAGE OPEN POSITION ----------------
-            if position and amt > 0:
-                last_price = ex.fetch_ticker(SYMBOL)["last"]
-                side = position["side"]
-                entry = position["entry"]
-                sl = position["sl"]
-                tp = position.get("tp")
-
-                # --- Breakeven via MACD experimental (if enabled) ---
-                if USE_BREAKEVEN_MACD:
-                    # check MACD on BREAKEVEN_MACD_TF
-                    try:
-                        small_be = ex.fetch_ohlcv(SYMBOL, BREAKEVEN_MACD_TF, limit=200)
-                        be_closes = [c[4] for c in small_be[:-1]]
-                        mac_be = macd(be_closes)
-                        if mac_be:
-                            dp,dn,ep,en = mac_be
-                            if side == "long" and macd_down(dp,dn,ep,en):
-                                # opposite MACD
-                                unreal = (last_close - entry) * position["qty"]
-                                if unreal > 0:
-                                    # move SL to BE (entry + offset)
-                                    if position["sl"] < entry + BREAKEVEN_OFFSET:
-                                        position["sl"] = entry + BREAKEVEN_OFFSET
-                                        log.info(f"🔁 LONG Move SL to BE {position['sl']:.2f} (MACD BE)")
-                                else:
-                                    # negative -> close immediately
-                                    pnl = (last_price-entry)*position["qty"]
-                                    stats["pnl"] += pnl
-                                    stats["trades"].append({
-                                        "time": datetime.now().strftime("%H:%M:%S"),
-                                        "side": "LONG",
-                                        "entry": entry,
-                                        "exit": last_price,
-                                        "pnl": pnl,
-                                        "reason": "SL"
-                                    })
-                                    ex.create_market_order(SYMBOL,"sell",position["qty"],params={"reduceOnly":True})
-                                    tg(f"❌ LONG SL (MACD close) {entry:.2f}->{last_price:.2f} PnL={pnl:+.2f}")
-                                    position=None; sl_lock=True
-                                    save_stats(stats); time.sleep(LOOP_SEC); continue
-                            if side == "short" and macd_up(dp,dn,ep,en):
-                                unreal = (entry-last_close) * position["qty"]
-                                if unreal > 0:
-                                    if position["sl"] > entry - BREAKEVEN_OFFSET:
-                                        position["sl"] = entry - BREAKEVEN_OFFSET
-                                        log.info(f"🔁 SHORT Move SL to BE {position['sl']:.2f} (MACD BE)")
-                                else:
-                                    pnl = (entry-last_price)*position["qty"]
-                                    stats["pnl"] += pnl
-                                    stats["trades"].append({
-                                        "time": datetime.now().strftime("%H:%M:%S"),
-                                        "side": "SHORT",
-                                        "entry": entry,
-                                        "exit": last_price,
-                                        "pnl": pnl,
-                                        "reason": "SL"
-                                    })
-                                    ex.create_market_order(SYMBOL,"buy",position["qty"],params={"reduceOnly":True})
-                                    tg(f"❌ SHORT SL (MACD close) {entry:.2f}->{last_price:.2f} PnL={pnl:+.2f}")
-                                    position=None; sl_lock=True
-                                    save_stats(stats); time.sleep(LOOP_SEC); continue
-                    except Exception as e:
-                        log.debug(f"[BE_MACD] fetch error: {e}")
-
-                # --- SL Touch ---
-                if side=="long" and last_price <= sl:
-                    # detect BE vs normal SL
-                    reason = "BE" if abs(sl - (entry + BREAKEVEN_OFFSET)) < 1e-6 else "SL"
-                    pnl = (last_price-entry)*position["qty"]
-                    stats["pnl"] += pnl
-                    stats["trades"].append({
-                        "time": datetime.now().strftime("%H:%M:%S"),
-                        "side": "LONG",
-                        "entry": entry,
-                        "exit": last_price,
-                        "pnl": pnl,
-                        "reason": reason
-                    })
-                    ex.create_market_order(SYMBOL,"sell",position["qty"],params={"reduceOnly":True})
-                    tg(f"🚨 LONG {reason} {entry:.2f}->{last_price:.2f} PnL={pnl:+.2f}")
-                    position=None; sl_lock=True
-                    save_stats(stats); time.sleep(LOOP_SEC); continue
-
-                if side=="short" and last_price >= sl:
-                    reason = "BE" if abs(sl - (entry - BREAKEVEN_OFFSET)) < 1e-6 else "SL"
-                    pnl = (entry-last_price)*position["qty"]
-                    stats["pnl"] += pnl
-                    stats["trades"].append({
-                        "time": datetime.now().strftime("%H:%M:%S"),
-                        "side": "SHORT",
-                        "entry": entry,
-                        "exit": last_price,
-                        "pnl": pnl,
-                        "reason": reason
-                    })
-                    ex.create_market_order(SYMBOL,"buy",position["qty"],params={"reduceOnly":True})
-                    tg(f"🚨 SHORT {reason} {entry:.2f}->{last_price:.2f} PnL={pnl:+.2f}")
-                    position=None; sl_lock=True
-                    save_stats(stats); time.sleep(LOOP_SEC); continue
-
-                # --- TP (ใช้ค่า tp ที่ตั้งตอนเปิด) ---
-                if tp is not None:
-                    if side=="long" and last_price >= tp:
-                        pnl = (last_price-entry)*position["qty"]
-                        stats["pnl"] += pnl
-                        stats["trades"].append({
-                            "time": datetime.now().strftime("%H:%M:%S"),
-                            "side": "LONG",
-                            "entry": entry,
-                            "exit": last_price,
-                            "pnl": pnl,
-                            "reason": "TP_upper"
-                        })
-                        ex.create_market_order(SYMBOL,"sell",position["qty"],params={"reduceOnly":True})
-                        tg(f"✅ LONG TP @ {last_price:.2f} PnL={pnl:+.2f}")
-                        position=None
-                        save_stats(stats); time.sleep(LOOP_SEC); continue
-
-                    if side=="short" and last_price <= tp:
-                        pnl = (entry-last_price)*position["qty"]
-                        stats["pnl"] += pnl
-                        stats["trades"].append({
-                            "time": datetime.now().strftime("%H:%M:%S"),
-                            "side": "SHORT",
-                            "entry": entry,
-                            "exit": last_price,
-                            "pnl": pnl,
-                            "reason": "TP_lower"
-                        })
-                        ex.create_market_order(SYMBOL,"buy",position["qty"],params={"reduceOnly":True})
-                        tg(f"✅ SHORT TP @ {last_price:.2f} PnL={pnl:+.2f}")
-                        position=None
-                        save_stats(stats); time.sleep(LOOP_SEC); continue
-
-                # --- ถ้า EMA flip (ถ้ายังใช้ EMA) ให้ mid เป็น TP แบบเดิม ---
-                if EMA_ENABLED:
-                    trend_now = "BUY" if e_fast > e_slow else "SELL"
-                    if side=="long" and trend_now=="SELL":
-                        if last_price <= mid:
-                            pnl = (last_price-entry)*position["qty"]
-                            stats["pnl"] += pnl
-                            stats["trades"].append({
-                                "time": datetime.now().strftime("%H:%M:%S"),
-                                "side": "LONG",
-                                "entry": entry,
-                                "exit": last_price,
-                                "pnl": pnl,
-                                "reason": "TP_mid_trend_flip"
-                            })
-                            ex.create_market_order(SYMBOL,"sell",position["qty"],params={"reduceOnly":True})
-                            tg(f"⚠ LONG EMA Flip TP Mid @ {last_price:.2f} PnL={pnl:+.2f}")
-                            position=None
-                            save_stats(stats); time.sleep(LOOP_SEC); continue
-
-                    if side=="short" and trend_now=="BUY":
-                        if last_price >= mid:
-                            pnl = (entry-last_price)*position["qty"]
-                            stats["pnl"] += pnl
-                            stats["trades"].append({
-                                "time": datetime.now().strftime("%H:%M:%S"),
-                                "side": "SHORT",
-                                "entry": entry,
-                                "exit": last_price,
-                                "pnl": pnl,
-                                "reason": "TP_mid_trend_flip"
-                            })
-                            ex.create_market_order(SYMBOL,"buy",position["qty"],params={"reduceOnly":True})
-                            tg(f"⚠ SHORT EMA Flip TP Mid @ {last_price:.2f} PnL={pnl:+.2f}")
-                            position=None
-                            save_stats(stats); time.sleep(LOOP_SEC); continue
-
-                # --- Breakeven via mid (ถ้าเปิดและไม่ได้ใช้ MACD BE) ---
-                if not USE_BREAKEVEN_MACD and USE_BREAKEVEN and not sl_lock:
-                    if side=="long" and last_close > mid and position["sl"] < entry + BREAKEVEN_OFFSET:
-                        position["sl"] = entry + BREAKEVEN_OFFSET
-                        log.info(f"🔁 LONG Move SL to BE {position['sl']:.2f}")
-                    if side=="short" and last_close < mid and position["sl"] > entry - BREAKEVEN_OFFSET:
-                        position["sl"] = entry - BREAKEVEN_OFFSET
-                        log.info(f"🔁 SHORT Move SL to BE {position['sl']:.2f}")
-
-                save_stats(stats)
-                time.sleep(LOOP_SEC)
-                continue
-
-            # ---------------- NO POSITION ----------------
-            if sl_lock:
-                # ปลดล็อกเมื่อราคาข้าม mid (ทั้ง SL และ BE ต้องรอ mid)
-                if (last_close > mid) or (last_close < mid):
-                    # but ensure crossing direction: user wanted wait until price cuts mid before unlocking
-                    # implementing simple check: if last_close crosses mid in any direction -> release
-                    sl_lock=False
-                    log.info("🔓 SL Lock released")
-                time.sleep(LOOP_SEC)
-                continue
-
-            # 1) pending from touch -> wait MACD confirm
-            if MACD_ENABLED and pending is not None:
-                last_price = ex.fetch_ticker(SYMBOL)["last"]
-                side = pending["side"]
-                p_lower = pending["lower"]
-                p_upper = pending["upper"]
-                p_mid   = pending["mid"]
-
-                # require macd_side_ok True and if EMA disabled we still require that pending side matches macd direction
-                if macd_side_ok:
-                    # if EMA disabled, we need to check MACD sign matches pending side
-                    if not EMA_ENABLED:
-                        # recalc macd sign to be sure
-                        small = ex.fetch_ohlcv(SYMBOL, MACD_TF, limit=200)
-                        mcloses = [c[4] for c in small[:-1]]
-                        mac = macd(mcloses)
-                        if mac:
-                            dp,dn,ep,en = mac
-                            if side=="long" and not macd_up(dp,dn,ep,en):
-                                log.info("❌ Pending MACD sign mismatch -> cancel pending")
-                                pending=None
-                                save_stats(stats); time.sleep(LOOP_SEC); continue
-                            if side=="short" and not macd_down(dp,dn,ep,en):
-                                log.info("❌ Pending MACD sign mismatch -> cancel pending")
-                                pending=None
-                                save_stats(stats); time.sleep(LOOP_SEC); continue
-
-                    if side=="long":
-                        if last_price < p_lower or last_price > p_mid:
-                            log.info("❌ MACD up but price out of [lower,mid] → cancel pending")
-                            pending=None
-                        else:
-                            qty = order_size(ex, last_price)
-                            ex.create_market_order(SYMBOL,"buy",qty)
-                            tp_val = p_upper - TP_BUFFER
-                            position={"side":"long","qty":qty,"entry":last_price,"sl":last_price-SL_DISTANCE,"tp":tp_val}
-                            log.info(f"🚀 OPEN LONG (pending MACD confirm) @ {last_price:.2f} TP@{tp_val:.2f}")
-                            tg(f"🟢 LONG {last_price:.2f}")
-                            pending=None
-                    else:
-                        if last_price > p_upper or last_price < p_mid:
-                            log.info("❌ MACD down but price out of [mid,upper] → cancel pending")
-                            pending=None
-                        else:
-                            qty = order_size(ex, last_price)
-                            ex.create_market_order(SYMBOL,"sell",qty)
-                            tp_val = p_lower + TP_BUFFER
-                            position={"side":"short","qty":qty,"entry":last_price,"sl":last_price+SL_DISTANCE,"tp":tp_val}
-                            log.info(f"🚀 OPEN SHORT (pending MACD confirm) @ {last_price:.2f} TP@{tp_val:.2f}")
-                            tg(f"🔴 SHORT {last_price:.2f}")
-                            pending=None
-
-                save_stats(stats)
-                time.sleep(LOOP_SEC)
-                continue
-
-            # 2) no pending -> detect new NW touch
-            # decide if trend check is required: if EMA_ENABLED True, require trend matches entry side
-            # LONG touch
-            if (not EMA_ENABLED or (EMA_ENABLED and trend=="BUY")) and last_close <= lower:
-                last_price = ex.fetch_ticker(SYMBOL)["last"]
-                if MACD_ENABLED:
-                    pending = {
-                        "side":"long",
-                        "touch_price": last_price,
-                        "lower": lower,
-                        "upper": upper,
-                        "mid": mid,
-                        "ts": now_ts
-                    }
-                    log.info("🟡 LONG touch, waiting MACD up (pending created)")
-                else:
-                    qty = order_size(ex, last_price)
-                    tp_val = upper - TP_BUFFER
-                    ex.create_market_order(SYMBOL,"buy",qty)
-                    position={"side":"long","qty":qty,"entry":last_price,"sl":last_price-SL_DISTANCE,"tp":tp_val}
-                    log.info(f"🚀 LONG ENTRY (no MACD) @ {last_price:.2f} TP@{tp_val:.2f}")
-                    tg(f"🟢 LONG {last_price:.2f}")
-                save_stats(stats)
-                time.sleep(LOOP_SEC)
-                continue
-
-            # SHORT touch
-            if (not EMA_ENABLED or (EMA_ENABLED and trend=="SELL")) and last_close >= upper:
-                last_price = ex.fetch_ticker(SYMBOL)["last"]
-                if MACD_ENABLED:
-                    pending = {
-                        "side":"short",
-                        "touch_price": last_price,
-                        "lower": lower,
-                        "upper": upper,
-                        "mid": mid,
-                        "ts": now_ts
-                    }
-                    log.info("🟡 SHORT touch, waiting MACD down (pending created)")
-                else:
-                    qty = order_size(ex, last_price)
-                    tp_val = lower + TP_BUFFER
-                    ex.create_market_order(SYMBOL,"sell",qty)
-                    position={"side":"short","qty":qty,"entry":last_price,"sl":last_price+SL_DISTANCE,"tp":tp_val}
-                    log.info(f"🚀 SHORT ENTRY (no MACD) @ {last_price:.2f} TP@{tp_val:.2f}")
-                    tg(f"🔴 SHORT {last_price:.2f}")
-                save_stats(stats)
-                time.sleep(LOOP_SEC)
-                continue
-
-            save_stats(stats)
-            time.sleep(LOOP_SEC)
+            if lease and not lease.held():
+                # lease หลุด / ใกล้หมดอายุ (loop ค้างจน standby รับไป) -> กลับไปเป็น standby
+                if not standby(lease, wd, feed, journal):
+                    break
+                with stage(wd, "restore"):
+                    bot.restore()
+            with stage(wd, "report"):
+                try_send_daily_report(journal)
+            bot.tick()
+            if wd:
+                wd.iteration()
+            if marks:
+                marks.append(("first_decision", time.time()))
+                report_boot(journal, marks)
+                marks = None
+            metrics.maybe_log(METRICS_LOG_SEC)
+            if fake is not None and MARKET_DATA_MODE != "replay" and time.time() - t_report >= PAPER_REPORT_SEC:
+                paper_report(fake, journal)
+                t_report = time.time()
+            sec = sched.next(feed.now(), bot.distance())
+            with stage(wd, "wait", sec + HEARTBEAT_SEC):
+                feed.wait(sec)
 
         except Exception as e:
             log.exception(f"loop error: {e}")
-            time.sleep(2)
+            metrics.inc("errors_total", where="loop")
+            feed.wait(sched.error())
+
+    feed.close()
+    if fake is not None:
+        paper_report(fake, journal)
+    if wd:
+        wd.stop()
+    if lease:
+        lease.release()            # standby รับช่วงได้ทันที ไม่ต้องรอหมดอายุ
+    journal.close()
+    if _notifier:
+        _notifier.close()          # ส่งข้อความที่ค้างในคิวก่อนจบ
+
+def warm_up_symbol(ex, store, hist, symbol, need):
+    # คืน TF ที่ต้อง subscribe / poll จาก exchange (ที่เหลือ derive จาก base)
+    fetch, derived = data_plan(need)
+    for tf, n in fetch.items():
+        if hist:
+            src = warm_up(ex, store, hist, symbol, tf, n)
+            log.info(f"[HIST] warm-up {symbol} {tf} from {src}")
+        else:
+            store.backfill(symbol, tf, limit=n)
+    for tf, (base, n) in derived.items():
+        store.derive(symbol, tf, base, n)
+        log.info(f"[CANDLES] {symbol} {tf} resampled from {base}: {len(store.candles(symbol, tf))} bars")
+    return list(fetch)
+
+def run_portfolio(symbols, ex=None):
+    # หลาย symbol ใน process เดียว: exchange session / rate limiter / poll ร่วมกัน
+    marks = [("start", T_START), ("imports", time.time())]
+    if METRICS_ENABLED and not metrics.enabled():
+        metrics.enable(METRICS_PORT)
+    limiter = RateLimiter()
+    if ex is None:
+        ex = (setup_paper if PAPER_TRADING else setup_exchange)(symbols, limiter, marks)
+    else:
+        marks.append(("exchange", time.time()))
+    fake = ex if isinstance(ex, FakeExchange) else None
+    log.info(f"✅ Started Binance Futures Portfolio {symbols} {STRATEGIES} ({TIMEFRAME}, MACD={MACD_TF})")
+    journal = open_journal()
+    store = CandleStore(ex)
+    plugins = {sym: make_plugins() for sym in symbols}
+    hist = HistoryStore(HISTORY_DIR) if USE_HISTORY else None
+    fetched = []                   # TF ที่ feed ต้อง poll = union ของทุก symbol
+    for sym in symbols:
+        for tf in warm_up_symbol(ex, store, hist, sym, need_timeframes(plugins[sym])):
+            if tf not in fetched:
+                fetched.append(tf)
+    pf = PortfolioFeed(ex, store, symbols, fetched, LOOP_SEC)
+    alloc = Allocator(symbols, PORTFOLIO_WEIGHTS, POSITION_MARGIN_FRACTION, LEVERAGE)
+    book = TriggerBook()
+    bots = [SymbolBot(ex, sym, store, pf.view(sym), journal, hist,
+                      size=lambda price, sym=sym: alloc.qty(ex, sym, price),
+                      label=f"[{sym.split('/')[0]}] ", plugins=plugins[sym], triggers=book)
+            for sym in symbols]
+    marks.append(("warmup", time.time()))
+    sched = make_scheduler([p for ps in plugins.values() for p in ps], limiter)
+    wd, lease = make_watchdog()
+    for bot in bots:
+        bot.watchdog, bot.fence = wd, lease.held if lease else None
+    if lease:
+        standby(lease, wd, pf, journal)
+        marks.append(("standby", time.time()))
+    with stage(wd, "restore"):
+        pf.refresh()
+        for bot in bots:
+            bot.restore()
+    marks.append(("restore", time.time()))
+
+    t_report = time.time()
+    while not pf.done:
+        try:
+            if lease and not lease.held():
+                if not standby(lease, wd, pf, journal):
+                    break
+                with stage(wd, "restore"):
+                    pf.refresh()
+                    for bot in bots:
+                        bot.restore()
+            with stage(wd, "report"):
+                try_send_daily_report(journal)
+            with stage(wd, "refresh"):
+                pf.refresh()
+            for bot in bots:
+                try:
+                    bot.tick()
+                except Exception as e:
+                    log.exception(f"{bot.label}loop error: {e}")
+                    metrics.inc("errors_total", where="loop", symbol=bot.symbol)
+            if wd:
+                wd.iteration()
+            if marks:
+                marks.append(("first_decision", time.time()))
+                report_boot(journal, marks)
+                marks = None
+            metrics.maybe_log(METRICS_LOG_SEC)
+            if fake is not None and time.time() - t_report >= PAPER_REPORT_SEC:
+                paper_report(fake, journal)
+                t_report = time.time()
+            dist = min((d for d in (bot.distance() for bot in bots) if d is not None), default=None)
+            sec = sched.next(time.time(), dist)
+            log.debug(f"[RATE] weight used={limiter.used} waited={limiter.waited:.1f}s next={sec:.1f}s ({sched.last[1]})")
+            with stage(wd, "wait", sec + HEARTBEAT_SEC):
+                pf.wait(sec)
+        except Exception as e:
+            log.exception(f"loop error: {e}")
+            pf.wait(sched.error())
+
+    pf.close()
+    if fake is not None:
+        paper_report(fake, journal)
+    if wd:
+        wd.stop()
+    if lease:
+        lease.release()
+    journal.close()
+    if _notifier:
+        _notifier.close()          # ส่งข้อความที่ค้างในคิวก่อนจบ
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+# metrics.py
+# Counters / gauges / histograms / timing spans + Prometheus text endpoint
+# - ปิดอยู่ (default): ทุก call เป็น no-op (เช็ค None ครั้งเดียว), instrument() คืน object เดิม
+# - enable(port): เปิด registry + HTTP /metrics (127.0.0.1) ใน daemon thread
+# - summary(): บรรทัดสรุปสำหรับ log เป็นระยะ (maybe_log)
+#
+#   with metrics.span("stage", stage="candles"): ...
+#   metrics.inc("rest_weight_total", 5)
+#   metrics.observe("slippage_bps", 1.2)
+#   metrics.gauge("telegram_queue_depth", 3)
+
+import time, threading, logging
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from ratelimit import WEIGHTS
+
+log = logging.getLogger("main")
+
+# bucket (sec) สำหรับ latency; slippage ใช้ bps
+TIME_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BPS_BUCKETS = (-10, -5, -2, -1, 0, 1, 2, 5, 10, 20, 50)
+
+_reg = None
+_NULL = nullcontext()
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count", "max")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = None
+
+    def observe(self, v):
+        i = 0
+        for b in self.buckets:
+            if v <= b:
+                break
+            i += 1
+        self.counts[i] += 1
+        self.sum += v
+        self.count += 1
+        self.max = v if self.max is None else max(self.max, v)
+
+    def quantile(self, q):
+        # ค่าประมาณจาก bucket (upper bound ของ bucket ที่ครอบ q)
+        if not self.count:
+            return 0.0
+        need, acc = q * self.count, 0
+        for i, c in enumerate(self.counts):
+            acc += c
+            if acc >= need:
+                return self.buckets[i] if i < len(self.buckets) else self.max
+        return self.max
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}       # (name, labels) -> float
+        self.hists = {}          # (name, labels) -> Histogram
+        self.gauges = {}         # (name, labels) -> ค่าล่าสุด
+        self.started = time.time()
+        self.last_log = time.time()
+
+    def inc(self, name, v=1, labels=()):
+        key = (name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + v
+
+    def gauge(self, name, v, labels=()):
+        with self.lock:
+            self.gauges[(name, labels)] = v
+
+    def observe(self, name, v, labels=(), buckets=TIME_BUCKETS):
+        key = (name, labels)
+        with self.lock:
+            h = self.hists.get(key)
+            if h is None:
+                h = self.hists[key] = Histogram(buckets)
+            h.observe(v)
+
+    @contextmanager
+    def span(self, name, labels=()):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name + "_seconds", time.perf_counter() - t, labels)
+
+    # ---------------- export ----------------
+    def render(self):
+        fmt = lambda labels, extra=(): "{" + ",".join(f'{k}="{v}"' for k, v in (*labels, *extra)) + "}" \
+            if (labels or extra) else ""
+        out = []
+        with self.lock:
+            for (name, labels), v in sorted(self.counters.items()):
+                out.append(f"{name}{fmt(labels)} {v}")
+            for (name, labels), v in sorted(self.gauges.items()):
+                out.append(f"{name}{fmt(labels)} {v}")
+            for (name, labels), h in sorted(self.hists.items()):
+                acc = 0
+                for b, c in zip(h.buckets, h.counts):
+                    acc += c
+                    out.append(f"{name}_bucket{fmt(labels, (('le', b),))} {acc}")
+                out.append(f"{name}_bucket{fmt(labels, (('le', '+Inf'),))} {h.count}")
+                out.append(f"{name}_sum{fmt(labels)} {h.sum}")
+                out.append(f"{name}_count{fmt(labels)} {h.count}")
+        return "\n".join(out) + "\n"
+
+    def summary(self):
+        lines = []
+        with self.lock:
+            for (name, labels), h in sorted(self.hists.items()):
+                lab = ",".join(f"{v}" for _, v in labels)
+                unit = 1000 if name.endswith("_seconds") else 1
+                lines.append(f"{name}[{lab}] n={h.count} avg={h.sum / h.count * unit:.1f} "
+                             f"p95~{h.quantile(0.95) * unit:.1f} max={h.max * unit:.1f}")
+            for (name, labels), v in sorted({**self.counters, **self.gauges}.items()):
+                lab = ",".join(f"{v}" for _, v in labels)
+                lines.append(f"{name}[{lab}]={v:g}")
+        return lines
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("/metrics", ""):
+            self.send_response(404); self.end_headers(); return
+        body = (_reg.render() if _reg else "").encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *a):
+        pass
+
+# ============================================================
+# module API (no-op เมื่อปิด)
+# ============================================================
+def enable(port=None, host="127.0.0.1"):
+    global _reg
+    _reg = Registry()
+    if port:
+        srv = ThreadingHTTPServer((host, port), _Handler)
+        threading.Thread(target=srv.serve_forever, name="metrics-http", daemon=True).start()
+        log.info(f"[METRICS] http://{host}:{srv.server_port}/metrics")
+        return srv
+    return None
+
+def disable():
+    global _reg
+    _reg = None
+
+def enabled():
+    return _reg is not None
+
+def inc(name, v=1, **labels):
+    if _reg is not None:
+        _reg.inc(name, v, tuple(sorted(labels.items())))
+
+def observe(name, v, buckets=TIME_BUCKETS, **labels):
+    if _reg is not None:
+        _reg.observe(name, v, tuple(sorted(labels.items())), buckets)
+
+def gauge(name, v, **labels):
+    if _reg is not None:
+        _reg.gauge(name, v, tuple(sorted(labels.items())))
+
+def span(name, **labels):
+    if _reg is None:
+        return _NULL
+    return _reg.span(name, tuple(sorted(labels.items())))
+
+def maybe_log(interval=300):
+    if _reg is None or time.time() - _reg.last_log < interval:
+        return
+    _reg.last_log = time.time()
+    log.info("[METRICS] " + " | ".join(_reg.summary()))
+
+class Instrumented:
+    """proxy ของ ccxt client: จับเวลา + นับ error / REST weight ทุก method call"""
+    def __init__(self, ex):
+        self._ex = ex
+
+    def __getattr__(self, name):
+        attr = getattr(self._ex, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+        def call(*a, **k):
+            w = WEIGHTS.get(name)
+            if w is not None:
+                inc("rest_weight_total", w(a, k) if callable(w) else w)
+            t = time.perf_counter()
+            try:
+                return attr(*a, **k)
+            except Exception as e:
+                inc("ccxt_errors_total", method=name, error=type(e).__name__)
+                raise
+            finally:
+                observe("ccxt_call_seconds", time.perf_counter() - t, method=name)
+        return call
+
+def instrument(ex):
+    return Instrumented(ex) if _reg is not None else ex
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+# notifier.py
+# Telegram notifier แบบ background (ไม่บล็อก trading loop)
+# - bounded queue: เต็มแล้วทิ้งข้อความเก่าสุด (นับใน metrics)
+# - requests.Session (connection reuse) + timeout ทุก request
+# - retry + exponential backoff, เคารพ 429 retry_after ของ Telegram
+# - coalesce: ข้อความที่เข้ามาติดๆ กันใน COALESCE_SEC รวมเป็นข้อความเดียว (ไม่เกิน 4096 ตัวอักษร)
+# - rate: ไม่เกิน 1 ข้อความ / MIN_INTERVAL ต่อ chat
+# - metrics(): queue depth, sent / failed / dropped, delivery latency
+#   ส่งเข้า metrics.py ด้วย: telegram_queue_depth (gauge), telegram_messages_total{result},
+#   telegram_delivery_seconds (histogram) -> /metrics + สรุปใน log
+
+import queue, threading, time, logging
+import requests
+
+import metrics
+
+log = logging.getLogger("main")
+
+API_URL = "https://api.telegram.org"
+MAX_LEN = 4096             # Telegram message limit
+COALESCE_SEC = 1.0
+MIN_INTERVAL = 1.0         # Telegram: ~1 msg/sec ต่อ chat
+TIMEOUT = (3.05, 10)       # (connect, read)
+
+class Notifier:
+    def __init__(self, token, chat_id, base_url=API_URL, maxsize=1000, retries=5,
+                 coalesce_sec=COALESCE_SEC, min_interval=MIN_INTERVAL, timeout=TIMEOUT):
+        self.url = f"{base_url}/bot{token}/sendMessage"
+        self.chat_id = chat_id
+        self.retries = retries
+        self.coalesce_sec = coalesce_sec
+        self.min_interval = min_interval
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.q = queue.Queue(maxsize=maxsize)
+        self.lock = threading.Lock()
+        self.stats = {"enqueued": 0, "sent": 0, "batches": 0, "failed": 0, "dropped": 0, "retries": 0,
+                      "latency_last": 0.0, "latency_max": 0.0, "latency_sum": 0.0}
+        self._last_send = 0.0
+        self._stop = False
+        self.thread = threading.Thread(target=self._run, name="notifier", daemon=True)
+        self.thread.start()
+
+    # ---------------- producer (trading thread) ----------------
+    def send(self, msg):
+        item = (time.time(), str(msg))
+        while True:
+            try:
+                self.q.put_nowait(item)
+                break
+            except queue.Full:
+                try:
+                    self.q.get_nowait()          # ทิ้งข้อความเก่าสุด
+                    self.q.task_done()
+                    with self.lock:
+                        self.stats["dropped"] += 1
+                    metrics.inc("telegram_messages_total", result="dropped")
+                except queue.Empty:
+                    pass
+        with self.lock:
+            self.stats["enqueued"] += 1
+        metrics.gauge("telegram_queue_depth", self.q.qsize())
+
+    def metrics(self):
+        with self.lock:
+            m = dict(self.stats)
+        m["queue_depth"] = self.q.qsize()
+        m["latency_avg"] = m["latency_sum"] / m["sent"] if m["sent"] else 0.0
+        return m
+
+    def flush(self, timeout=10.0):
+        # รอจนส่ง (หรือยอมแพ้) ครบทุกข้อความในคิว
+        end = time.time() + timeout
+        while self.q.unfinished_tasks and time.time() < end:
+            time.sleep(0.05)
+        return self.q.unfinished_tasks == 0
+
+    def close(self, timeout=10.0):
+        self.flush(timeout)
+        self._stop = True
+        self.session.close()
+
+    # ---------------- worker ----------------
+    def _batch(self):
+        items = [self.q.get()]
+        size = len(items[0][1])
+        end = time.time() + self.coalesce_sec
+        while True:
+            left = end - time.time()
+            if left <= 0:
+                break
+            try:
+                it = self.q.get(timeout=left)
+            except queue.Empty:
+                break
+            if size + 1 + len(it[1]) > MAX_LEN:
+                self._post_batch(items)          # เต็มแล้ว -> ส่งก้อนนี้ก่อน
+                items, size = [], 0
+            items.append(it)
+            size += len(it[1]) + 1
+        return items
+
+    def _run(self):
+        while not self._stop:
+            items = self._batch()
+            if items:
+                self._post_batch(items)
+
+    def _post_batch(self, items):
+        text = "\n".join(m for _, m in items)[:MAX_LEN]
+        ok = self._post(text)
+        now = time.time()
+        with self.lock:
+            if ok:
+                self.stats["batches"] += 1
+                self.stats["sent"] += len(items)
+                for t, _ in items:
+                    lat = now - t
+                    self.stats["latency_sum"] += lat
+                    self.stats["latency_max"] = max(self.stats["latency_max"], lat)
+                    self.stats["latency_last"] = lat
+            else:
+                self.stats["failed"] += len(items)
+        if ok:
+            for t, _ in items:
+                metrics.observe("telegram_delivery_seconds", now - t)
+        metrics.inc("telegram_messages_total", len(items), result="sent" if ok else "failed")
+        metrics.gauge("telegram_queue_depth", self.q.qsize())
+        for _ in items:
+            self.q.task_done()
+
+    def _post(self, text):
+        backoff = 1.0
+        for attempt in range(self.retries):
+            wait = self._last_send + self.min_interval - time.time()
+            if wait > 0:
+                time.sleep(wait)
+            self._last_send = time.time()
+            try:
+                r = self.session.post(self.url, json={"chat_id": self.chat_id, "text": text}, timeout=self.timeout)
+                if r.status_code == 200:
+                    return True
+                if r.status_code == 429:
+                    try:
+                        backoff = float(r.json().get("parameters", {}).get("retry_after", backoff))
+                    except ValueError:
+                        pass
+                elif 400 <= r.status_code < 500:
+                    log.warning(f"[TG] rejected {r.status_code}: {r.text[:200]}")
+                    return False                # ส่งซ้ำก็ไม่ผ่าน
+                err = f"HTTP {r.status_code}"
+            except requests.RequestException as e:
+                err = str(e)
+            with self.lock:
+                self.stats["retries"] += 1
+            metrics.inc("retries_total", component="telegram")
+            if attempt + 1 == self.retries:
+                log.warning(f"[TG] send failed ({err})")
+                break
+            log.warning(f"[TG] send failed ({err}), retry in {backoff:.1f}s")
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 60)
+        log.error(f"[TG] giving up after {self.retries} attempts")
+        return False
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+# nwe.py
+# Nadaraya-Watson Envelope (LuxAlgo repaint) engine
+# - kernel (Gaussian coefs) คำนวณครั้งเดียว/cache ต่อ (bandwidth, window)
+# - envelope = np.dot บน close array ที่ต่อเนื่องกัน
+# - MAE แบบ rolling sum เมื่อมีแท่งใหม่ต่อท้าย (seed / update: live NWPlugin)
+# - batch(): คืน upper/lower/mid ทั้ง history ในครั้งเดียว
+# - forming(): batch แบบแยกส่วนของแท่งที่ปิดแล้ว (backtest / sweep ป้อนราคาแท่งที่กำลังก่อตัวเอง)
+
+import math
+import numpy as np
+
+MAX_WIN = 499
+MIN_BARS = 200
+
+_kernels = {}   # (h, win) -> (coefs, coefs_rev, den)
+
+def kernel(h, win):
+    key = (float(h), int(win))
+    k = _kernels.get(key)
+    if k is None:
+        i = np.arange(win, dtype=np.float64)
+        coefs = np.exp(-(i * i) / (2 * (h ** 2)))
+        k = (coefs, np.ascontiguousarray(coefs[::-1]), float(coefs.sum()))
+        _kernels[key] = k
+    return k
+
+class NWEngine:
+    def __init__(self, h=8.0, mult=4, factor=1.5, max_win=MAX_WIN, min_bars=MIN_BARS):
+        self.h = float(h)
+        self.mult = mult
+        self.factor = factor
+        self.max_win = max_win
+        self.min_bars = min_bars
+        # incremental state
+        self._buf = np.empty(0)
+        self._n = 0
+        self._mae_sum = 0.0
+        self._mae_w = 0
+
+    def __len__(self):
+        return self._n
+
+    def _win(self, n):
+        win = min(self.max_win, n - 1)
+        win_s = min(int(self.h * 10), win - 1)
+        return win, win_s
+
+    # ---------------- one-shot ----------------
+    def envelope(self, closes):
+        n = len(closes)
+        if n < self.min_bars:
+            return None, None, None
+        win, win_s = self._win(n)
+        c = np.asarray(closes[-win - 1:], dtype=np.float64)
+        _, coefs_rev, den = kernel(self.h, win)
+        mean = float(np.dot(c[-win:], coefs_rev)) / den
+        if win_s > 1:
+            # diffs |c[-1-i] - c[-2-i]| สำหรับ i = 1..win_s-1 (ไม่รวม diff ล่าสุด)
+            seg = c[-win_s - 1:-1]
+            mae = float(np.abs(np.diff(seg)).mean()) * self.mult * self.factor
+        else:
+            mae = 0.0
+        return mean + mae, mean - mae, mean
+
+    # ---------------- incremental ----------------
+    def seed(self, closes):
+        cap = max(2 * (self.max_win + 1), 2 * len(closes))
+        self._buf = np.empty(cap, dtype=np.float64)
+        self._n = len(closes)
+        self._buf[:self._n] = closes
+        self._resync_mae()
+
+    def _resync_mae(self):
+        n = self._n
+        if n < self.min_bars:
+            self._mae_sum, self._mae_w = 0.0, 0
+            return
+        _, win_s = self._win(n)
+        seg = self._buf[n - win_s - 1:n - 1]
+        self._mae_sum = float(np.abs(np.diff(seg)).sum()) if win_s > 1 else 0.0
+        self._mae_w = win_s
+
+    def update(self, close, new_bar=True):
+        # new_bar=False: patch แท่งที่ยังไม่ปิด (ไม่กระทบ MAE เพราะ MAE ไม่รวม diff ล่าสุด)
+        if not new_bar and self._n:
+            self._buf[self._n - 1] = close
+            return self.value()
+        if self._n >= len(self._buf):
+            keep = self.max_win + 1
+            self._buf[:keep] = self._buf[self._n - keep:self._n]
+            self._n = keep
+        self._buf[self._n] = close
+        self._n += 1
+        n = self._n
+        _, win_s = self._win(n) if n >= self.min_bars else (0, 0)
+        if n < self.min_bars or win_s != self._mae_w or win_s <= 1:
+            self._resync_mae()
+        else:
+            b = self._buf
+            # diff ที่เข้า window (เดิมคือ diff ล่าสุด) และ diff ที่หลุดออก
+            self._mae_sum += abs(b[n - 2] - b[n - 3])
+            self._mae_sum -= abs(b[n - win_s - 1] - b[n - win_s - 2])
+        return self.value()
+
+    def value(self):
+        n = self._n
+        if n < self.min_bars:
+            return None, None, None
+        win, win_s = self._win(n)
+        _, coefs_rev, den = kernel(self.h, win)
+        mean = float(np.dot(self._buf[n - win:n], coefs_rev)) / den
+        mae = (self._mae_sum / (win_s - 1)) * self.mult * self.factor if win_s > 1 else 0.0
+        return mean + mae, mean - mae, mean
+
+    # ---------------- batch ----------------
+    def batch(self, closes):
+        """upper/lower/mid ของทุกแท่ง (ค่า ณ แท่ง t ใช้ closes[:t+1]); NaN ถ้าแท่งไม่พอ"""
+        c = np.ascontiguousarray(closes, dtype=np.float64)
+        N = len(c)
+        mid = np.full(N, np.nan)
+        mae = np.full(N, np.nan)
+        if N < self.min_bars:
+            return mid.copy(), mid.copy(), mid
+
+        full = self.max_win + 1            # n ที่ window เต็ม
+        # mean: window เต็ม -> convolution ครั้งเดียว
+        if N >= full:
+            coefs, _, den = kernel(self.h, self.max_win)
+            conv = np.convolve(c, coefs, mode="full")[:N]
+            mid[full - 1:] = conv[full - 1:] / den
+        # ช่วงต้นที่ window ยังไม่เต็ม (n-1) -> คำนวณทีละแท่ง
+        for t in range(self.min_bars - 1, min(N, full - 1)):
+            win = t
+            _, coefs_rev, den = kernel(self.h, win)
+            mid[t] = float(np.dot(c[t - win + 1:t + 1], coefs_rev)) / den
+
+        t = np.arange(self.min_bars - 1, N)
+        mae[t] = self._mae(c, t)
+        return mid + mae, mid - mae, mid
+
+    def forming(self, closes):
+        """ส่วนของ envelope ที่ขึ้นกับแท่งที่ปิดแล้วเท่านั้น ต่อ index แท่งที่กำลังก่อตัว j (window = max_win):
+        mid(j, c) = (c * coef0 + S[j]) / den, MAE = mae[j]  (= batch() ที่ closes[j] = c)
+        คืน (S, mae, coef0, den, แท่งแรกที่ใช้ได้)"""
+        c = np.ascontiguousarray(closes, dtype=np.float64)
+        N = len(c)
+        win = self.max_win
+        coefs, _, den = kernel(self.h, win)
+        S = np.full(N, np.nan)
+        conv = np.convolve(c, coefs[1:], mode="full")[:N]       # conv[t] = sum_m c[t-m] * coef[m+1]
+        S[win - 1:] = conv[win - 2:N - 1]                        # S[j] = conv[j-1]
+        mae = np.full(N, np.nan)
+        j = np.arange(win - 1, N)
+        mae[j] = self._mae(c, j, win)
+        return S, mae, coefs[0], den, win - 1
+
+    def _mae(self, c, t, win=None):
+        # rolling mean ของ |diff| ผ่าน cumsum: diffs d[t-win_s+1 .. t-1] (ไม่รวม diff ของแท่ง t)
+        d = np.zeros(len(c))
+        d[1:] = np.abs(np.diff(c))
+        cs = np.concatenate(([0.0], np.cumsum(d)))
+        win = np.minimum(self.max_win, t) if win is None else win
+        win_s = np.minimum(int(self.h * 10), win - 1)
+        s = cs[t] - cs[t - win_s + 1]
+        cnt = win_s - 1
+        with np.errstate(invalid="ignore", divide="ignore"):
+            m = np.where(cnt > 0, s / np.maximum(cnt, 1), 0.0)
+        return m * self.mult * self.factor
+
+_engines = {}
+
+def get_engine(h, mult, factor):
+    key = (float(h), mult, factor)
+    eng = _engines.get(key)
+    if eng is None:
+        eng = _engines[key] = NWEngine(h, mult, factor)
+    return eng
+
+def nwe_reference(closes, h, mult, factor):
+    # สูตรเดิมแบบ pure-Python (เก็บไว้เทียบผล)
+    n = len(closes)
+    if n < MIN_BARS:
+        return None, None, None
+    win = min(MAX_WIN, n - 1)
+    coefs = [math.exp(-(i * i) / (2 * (h ** 2))) for i in range(win)]
+    den = sum(coefs)
+    num = sum(closes[-1 - j] * coefs[j] for j in range(win))
+    mean = num / den
+    win_s = min(int(h * 10), win - 1)
+    diffs = [abs(closes[-1 - i] - closes[-1 - i - 1]) for i in range(1, win_s)]
+    mae = (sum(diffs) / len(diffs)) * mult * factor if diffs else 0.0
+    return mean + mae, mean - mae, mean
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+# orders.py
+# Exchange-side protective orders (STOP_MARKET / TAKE_PROFIT_MARKET)
+# - protect(): วาง SL/TP บน exchange ทันทีหลัง entry
+# - move_sl(): ย้าย SL (เช่น breakeven) แบบวางใหม่ก่อนแล้วค่อย cancel ตัวเก่า (ไม่มีช่วงไร้ SL)
+# - resize(): ปิดไปบางส่วน -> วาง SL/TP ใหม่เท่า qty ที่เหลือก่อนแล้วค่อย cancel ตัวเก่า
+# - reconcile(): ตรวจ fill จาก order status (open orders / ORDER_TRADE_UPDATE) แทนการเทียบราคา
+#   SL/TP ที่ยังไม่มี order (วางไม่ผ่าน / ถูก cancel) -> วางใหม่ทุกรอบ
+# - วาง SL ไม่ได้ (retry ครบ) หรือ stop ทะลุ mark แล้ว (Binance -2021 "would immediately trigger")
+#   -> flatten(): ปิด market reduce-only แล้ว reconcile() คืน fill เหมือน SL/TP บน exchange ถูก fill
+
+import logging, time
+
+import metrics
+
+log = logging.getLogger("main")
+
+PLACE_RETRIES = 3
+RETRY_SEC = 0.5
+
+def would_trigger(e):
+    # ccxt: OrderImmediatelyFillable (-2021) -> ไม่ import ccxt ทั้ง package เพื่อเช็ค type
+    msg = str(e)
+    return type(e).__name__ == "OrderImmediatelyFillable" or "-2021" in msg or "immediately trigger" in msg.lower()
+
+class OrderManager:
+    def __init__(self, ex, symbol, working_type="MARK_PRICE"):
+        self.ex = ex
+        self.symbol = symbol
+        self.working_type = working_type
+        self.side = None          # "long" / "short"
+        self.qty = 0.0
+        self.sl = self.tp = None
+        self.sl_id = self.tp_id = None
+        self.pending = None       # fill จาก flatten() รอ reconcile() ส่งต่อ
+        self.sleep = time.sleep
+
+    def _close_side(self):
+        return "sell" if self.side == "long" else "buy"
+
+    def _place(self, type, price):
+        params = {"stopPrice": price, "reduceOnly": True, "workingType": self.working_type}
+        o = self.ex.create_order(self.symbol, type, self._close_side(), self.qty, None, params)
+        return str(o["id"])
+
+    def _try_place(self, type, price, retries=PLACE_RETRIES):
+        # None = วางไม่ผ่านครบ retries; stop ทะลุ mark แล้ว -> raise ทันที (retry ไม่ช่วย)
+        for i in range(retries):
+            try:
+                return self._place(type, price)
+            except Exception as e:
+                if would_trigger(e):
+                    raise
+                log.warning(f"[ORDERS] place {type} @ {price:.2f} failed ({i + 1}/{retries}): {e}")
+                metrics.inc("errors_total", where="protect")
+                if i + 1 < retries:
+                    self.sleep(RETRY_SEC)
+        return None
+
+    def _ensure(self, kind):
+        # วาง SL / TP ที่ยังไม่มี order; คืน False ถ้าต้อง flatten แล้ว (pending)
+        typ, level = ("STOP_MARKET", self.sl) if kind == "SL" else ("TAKE_PROFIT_MARKET", self.tp)
+        if level is None or (self.sl_id if kind == "SL" else self.tp_id):
+            return True
+        try:
+            oid = self._try_place(typ, level)
+        except Exception as e:
+            log.warning(f"[ORDERS] {kind} @ {level:.2f} already through mark ({e}) -> close at market")
+            return not self.flatten(kind)
+        if kind == "SL":
+            self.sl_id = oid
+            if oid is None:
+                log.error(f"[ORDERS] no SL for {self.side} {self.qty} after {PLACE_RETRIES} tries -> close at market")
+                return not self.flatten("SL")
+        else:
+            self.tp_id = oid
+        return True
+
+    def flatten(self, kind):
+        # ปิด position ด้วย market reduce-only (ไม่มี SL / stop ทะลุแล้ว) -> True = ปิดแล้ว (pending)
+        try:
+            o = self.ex.create_order(self.symbol, "market", self._close_side(), self.qty, None, {"reduceOnly": True})
+        except Exception as e:
+            log.error(f"[ORDERS] flatten {self.side} {self.qty} failed: {e} (retry next reconcile)")
+            metrics.inc("errors_total", where="flatten")
+            return False
+        self._cancel(self.sl_id)
+        self._cancel(self.tp_id)
+        self.sl_id = self.tp_id = None
+        self.pending = {"kind": kind, "price": o.get("average"), "qty": float(o.get("filled") or 0) or self.qty}
+        log.warning(f"[ORDERS] flattened {self.side} {self.qty} @ {o.get('average')} ({kind})")
+        return True
+
+    def _cancel(self, oid):
+        if oid is None:
+            return
+        try:
+            self.ex.cancel_order(oid, self.symbol)
+        except Exception as e:
+            # filled/expired ไปแล้ว -> reconcile จะจัดการ
+            log.warning(f"[ORDERS] cancel {oid} warn: {e}")
+
+    def active(self):
+        return self.side is not None
+
+    def protect(self, side, qty, sl, tp=None):
+        """วาง SL/TP; False = วาง SL ไม่ได้ -> ปิด market แล้ว (fill รอใน reconcile())"""
+        self.side, self.qty = side, qty
+        self.sl, self.tp = sl, tp
+        self.sl_id = self.tp_id = None
+        if not self._ensure("SL") or not self._ensure("TP"):
+            return False
+        log.info(f"[ORDERS] protect {side} qty={qty} SL@{sl:.2f}" + (f" TP@{tp:.2f}" if tp is not None else ""))
+        return True
+
+    def move_sl(self, sl):
+        """False = วาง SL ใหม่ไม่ได้ SL เดิมยังอยู่ (self.sl) -> caller ต้องให้ position ตรงกับ self.sl"""
+        if not self.active() or sl == self.sl:
+            return True
+        old = self.sl_id
+        try:
+            new = self._try_place("STOP_MARKET", sl)
+        except Exception as e:
+            # SL ใหม่ (เช่น breakeven) ทะลุ mark แล้ว -> ปิด market แบบ client-side เดิม
+            log.warning(f"[ORDERS] SL {sl:.2f} already through mark ({e}) -> close at market")
+            self.sl = sl
+            self.flatten("SL")
+            return True
+        if new is None:
+            log.error(f"[ORDERS] SL move -> {sl:.2f} failed, keeping SL@{self.sl:.2f}")
+            return False
+        self.sl_id, self.sl = new, sl
+        self._cancel(old)
+        log.info(f"[ORDERS] SL moved -> {sl:.2f}")
+        return True
+
+    def resize(self, qty):
+        """SL/TP เท่า qty ที่เหลือหลังปิดบางส่วน; False = stop ทะลุ mark แล้ว -> ปิด market แล้ว (pending)"""
+        if not self.active() or qty == self.qty:
+            return True
+        self.qty = qty
+        for kind, typ, level, old in (("SL", "STOP_MARKET", self.sl, self.sl_id),
+                                      ("TP", "TAKE_PROFIT_MARKET", self.tp, self.tp_id)):
+            if level is None:
+                continue
+            try:
+                new = self._try_place(typ, level)
+            except Exception as e:
+                log.warning(f"[ORDERS] {kind} @ {level:.2f} already through mark ({e}) -> close at market")
+                return not self.flatten(kind)
+            if new is None:
+                # order เดิม (qty เต็ม) ยังอยู่ reduceOnly ปิดได้ไม่เกิน position -> ยังคุมส่วนที่เหลือ
+                log.warning(f"[ORDERS] resize {kind} -> {qty} failed, keeping order {old}")
+                continue
+            if kind == "SL":
+                self.sl_id = new
+            else:
+                self.tp_id = new
+            self._cancel(old)
+        log.info(f"[ORDERS] SL/TP resized -> qty={qty}")
+        return True
+
+    def cancel_all(self):
+        self._cancel(self.sl_id)
+        self._cancel(self.tp_id)
+        self.reset()
+
+    def reset(self):
+        self.side = None
+        self.qty = 0.0
+        self.sl = self.tp = None
+        self.sl_id = self.tp_id = None
+        self.pending = None
+
+    # ---------------- checkpoint / boot ----------------
+    STATE_KEYS = ("side", "qty", "sl", "tp", "sl_id", "tp_id", "pending")
+
+    def snapshot(self):
+        return {k: getattr(self, k) for k in self.STATE_KEYS}
+
+    def restore(self, state):
+        for k in self.STATE_KEYS:
+            if k in state:
+                setattr(self, k, state[k])
+
+    def adopt(self, side, qty, orders):
+        # ใช้ SL/TP ที่ค้างอยู่บน exchange (state หาย) แทนการวางซ้อน; คืน True ถ้าเจอ SL
+        self.side, self.qty = side, qty
+        close = self._close_side()
+        for o in orders:
+            sp = o.get("stopPrice") or o.get("triggerPrice")
+            if o.get("side") != close or not sp:
+                continue
+            typ = str(o.get("type") or "").upper()
+            if typ.startswith("STOP"):
+                self.sl_id, self.sl = str(o["id"]), float(sp)
+            elif typ.startswith("TAKE_PROFIT"):
+                self.tp_id, self.tp = str(o["id"]), float(sp)
+        return self.sl_id is not None
+
+    def _status(self, oid, updates):
+        # ORDER_TRADE_UPDATE จาก user-data stream (ถ้ามี) ก่อน แล้วค่อย REST
+        u = (updates or {}).get(oid)
+        if u is not None:
+            st = {"FILLED": "closed", "CANCELED": "canceled", "EXPIRED": "expired"}.get(u.get("X"), "open")
+            return st, float(u.get("ap") or 0) or None, float(u.get("z") or 0)
+        o = self.ex.fetch_order(oid, self.symbol)
+        return o.get("status"), o.get("average"), float(o.get("filled") or 0)
+
+    def reconcile(self, updates=None):
+        """คืน {"kind": "SL"/"TP", "price", "qty"} เมื่อ SL/TP ถูก fill (หรือ flatten), ไม่งั้น None"""
+        if not self.active():
+            return None
+        if self.pending is None:
+            for kind in ("SL", "TP"):
+                if not self._ensure(kind):
+                    break
+        if self.pending is not None:
+            fill = self.pending
+            self.reset()
+            return fill
+        ids = [i for i in (self.sl_id, self.tp_id) if i]
+        if not any(i in (updates or {}) for i in ids):
+            open_ids = {str(o["id"]) for o in self.ex.fetch_open_orders(self.symbol)}
+            if all(i in open_ids for i in ids):
+                return None
+        for kind, oid in (("SL", self.sl_id), ("TP", self.tp_id)):
+            if not oid:
+                continue
+            status, avg, filled = self._status(oid, updates)
+            if status == "closed":
+                other = self.tp_id if kind == "SL" else self.sl_id
+                self._cancel(other)
+                fill = {"kind": kind, "price": avg, "qty": filled or self.qty}
+                log.info(f"[ORDERS] {kind} filled @ {avg}")
+                self.reset()
+                return fill
+            if status in ("canceled", "expired", "rejected"):
+                # ถูก cancel จากภายนอก -> วางใหม่เพื่อไม่ให้ position ไม่มี SL/TP
+                log.warning(f"[ORDERS] {kind} order {oid} {status}, re-placing")
+                if kind == "SL":
+                    self.sl_id = None
+                else:
+                    self.tp_id = None
+                if not self._ensure(kind):
+                    fill = self.pending
+                    self.reset()
+                    return fill
+        return None
@@ -0,0 +1,540 @@
+# -*- coding: utf-8 -*-
+# plugins.py
+# Strategy plugins สำหรับ engine.py
+# - NWPlugin:        NW envelope + MACD confirm + EMA trend (strategy.NWStrategy) = main.py
+# - EMATrendPlugin:  H1 EMA cross จาก baseline -> M5 แตะ EMA + MACD cross, trailing SL เป็นขั้น = "main.py (ema)"
+#                    ขั้น SL / ladder TP / trailing / alert / auto close เป็น trigger (triggers.py)
+# - SMCFiboPlugin:   H1 BOS/CHOCH -> M5 CHOCH สวน -> Fibo/POC zone -> M5 CHOCH กลับ + MACD = "main.py smc fibo✅"
+
+import logging
+
+import nwe, smc
+import metrics
+from engine import Plugin
+from triggers import UP, DOWN
+from strategy import NWStrategy, macd_up, macd_down
+
+log = logging.getLogger("main")
+
+def _crossed(side, price, level):
+    # ราคาไปถึง level ในทิศกำไรของ side
+    return price >= level if side == "long" else price <= level
+
+# ============================================================
+# NW envelope
+# ============================================================
+class NWPlugin(Plugin):
+    name = "nw"
+
+    def __init__(self, timeframe="30m", bars=600, macd_tf="5m", be_macd_tf="5m",
+                 ema_fast=50, ema_slow=100, nw=(8.0, 4, 1.5), **kw):
+        self.strat = NWStrategy(**kw)
+        super().__init__()
+        self.tf, self.macd_tf, self.be_macd_tf = timeframe, macd_tf, be_macd_tf
+        self.ema_periods = (ema_fast, ema_slow)
+        self.nw = nw
+        self.engine = nwe.NWEngine(*nw)       # incremental: state ต่อ symbol (plugin instance)
+        self._nw_ts = None                     # ts ของแท่งล่าสุดที่ป้อนให้ engine แล้ว
+        self.timeframes = {timeframe: bars}
+        if self.strat.macd_enabled:
+            self.timeframes[macd_tf] = 200
+        if self.strat.use_breakeven_macd:
+            self.timeframes[be_macd_tf] = 200
+
+    # position / state อยู่ใน NWStrategy
+    @property
+    def position(self):
+        return self.strat.position
+
+    @position.setter
+    def position(self, v):
+        self.strat.position = v
+
+    @property
+    def client_stops(self):
+        return self.strat.client_stops
+
+    def snapshot(self):
+        return self.strat.snapshot()
+
+    def restore(self, state):
+        self.strat.restore(state)
+
+    def adopt(self, side, qty, entry):
+        d = self.strat.sl_distance
+        self.position = {"side": side, "qty": qty, "entry": entry,
+                         "sl": entry - d if side == "long" else entry + d, "tp": None}
+
+    def setup(self, ctx):
+        s = self.strat
+        self.ema_fast = ctx.ind.ema(self.tf, self.ema_periods[0]) if s.ema_enabled else None
+        self.ema_slow = ctx.ind.ema(self.tf, self.ema_periods[1]) if s.ema_enabled else None
+        self.macd_entry = ctx.ind.macd(self.macd_tf) if s.macd_enabled else None
+        self.macd_be = ctx.ind.macd(self.be_macd_tf) if s.use_breakeven_macd else None
+
+    def levels(self, ctx):
+        return self.strat.levels()
+
+    def on_fill(self, ctx, fill):
+        act = self.strat.on_stop_fill(fill["kind"], fill["price"])
+        return [act] if act else []
+
+    def _envelope(self, candles, closes):
+        # แท่งเดิม -> patch, แท่งใหม่ 1 แท่ง -> ต่อท้าย (MAE rolling), นอกนั้น (เริ่ม / แท่งหาย) -> seed ใหม่
+        eng, ts = self.engine, self._nw_ts
+        if ts == candles[-1][0]:
+            eng.update(closes[-1], new_bar=False)
+        elif len(candles) > 1 and ts == candles[-2][0]:
+            eng.update(closes[-2], new_bar=False)      # ราคาปิดจริงของแท่งก่อน
+            eng.update(closes[-1])
+        else:
+            eng.seed(closes)
+        if len(eng) != len(closes) and len(closes) <= eng.max_win:
+            eng.seed(closes)                           # window = จำนวนแท่งใน store (ยังไม่เต็ม max_win)
+        self._nw_ts = candles[-1][0]
+        return eng.value()
+
+    def on_tick(self, ctx):
+        strat, label = self.strat, ctx.label
+        candles = ctx.candles(self.tf)
+        closes = [c[4] for c in candles]
+        last_close = closes[-1]
+
+        # EMA Trend (if enabled)
+        trend = None
+        if strat.ema_enabled:
+            e_fast, e_slow = self.ema_fast.peek(last_close), self.ema_slow.peek(last_close)
+            if e_fast is None or e_slow is None:
+                return []
+            trend = "BUY" if e_fast > e_slow else "SELL"
+
+        # NW freeze
+        if strat.band_due(ctx.now):
+            with metrics.span("stage", stage="nw"):
+                u, l, m = self._envelope(candles, closes)
+            if u is None:
+                log.info(f"[DEBUG] {label}NW not ready")
+                return []
+            strat.set_band(u, l, m, ctx.now)
+            log.info(f"[DEBUG] {label}NW updated: U={u:.2f}, L={l:.2f}, M={m:.2f}")
+        else:
+            log.info(f"[DEBUG] {label}Using previous NW band (frozen)")
+        if ctx.fill:
+            return []
+
+        macd_entry = self.macd_entry.value() if self.macd_entry else None
+        macd_be = self.macd_be.value() if self.macd_be else None
+        amt, _ = ctx.position(self)
+        with metrics.span("stage", stage="strategy"):
+            return strat.step(ctx.now, last_close, amt, ctx.price, trend, macd_entry, macd_be)
+
+# ============================================================
+# EMA trend (H1 -> M5)
+# ============================================================
+def recent_swing_low_high(ohlcv, lookback=50, k=2):
+    # swing low/high ล่าสุดใน lookback แท่ง (ไม่เจอ -> min/max)
+    look = ohlcv[:] if len(ohlcv) < lookback + 2 * k + 1 else ohlcv[-lookback:]
+    highs = [c[2] for c in look]
+    lows = [c[3] for c in look]
+    swing_low = swing_high = None
+    for i in range(k, len(look) - k):
+        if all(lows[i] <= lows[i - j] for j in range(1, k + 1)) and all(lows[i] <= lows[i + j] for j in range(1, k + 1)):
+            swing_low = look[i][3]
+        if all(highs[i] >= highs[i - j] for j in range(1, k + 1)) and all(highs[i] >= highs[i + j] for j in range(1, k + 1)):
+            swing_high = look[i][2]
+    if swing_low is None:
+        swing_low = min(lows)
+    if swing_high is None:
+        swing_high = max(highs)
+    return swing_low, swing_high
+
+class EMATrendPlugin(Plugin):
+    name = "ema"
+    client_stops = False           # SL เป็น STOP_MARKET บน exchange (เลื่อนตาม step)
+
+    def __init__(self, htf="1h", ltf="5m", ema_fast=10, ema_slow=50, ema_ltf=45,
+                 swing_lookback=50, sl_extra=300, max_sl=1234,
+                 steps=((700, -250), (1299, 550), (1399, 1000)),
+                 alert_trigger=1350, auto_close=1400, new_signal_action="close_now",
+                 new_signal_sl_offset=100, opp_confirm_bars=1, ladder=(), trail=None):
+        super().__init__()
+        self.htf, self.ltf = htf, ltf
+        self.timeframes = {htf: 300, ltf: 300}
+        self.periods = (ema_fast, ema_slow, ema_ltf)
+        self.swing_lookback, self.sl_extra, self.max_sl = swing_lookback, sl_extra, max_sl
+        self.steps = steps                          # (กำไร pts, SL offset จาก entry)
+        self.ladder = ladder                        # (กำไร pts, สัดส่วนของ qty ที่เหลือ) ปิดบางส่วนเป็นขั้น
+        self.trail = trail                          # pts: trailing stop จากราคาดีสุด (None = ปิด)
+        self.alert_trigger, self.auto_close = alert_trigger, auto_close
+        self.new_signal_action, self.new_signal_sl_offset = new_signal_action, new_signal_sl_offset
+        self.opp_confirm_bars = opp_confirm_bars
+
+        self.h1_dir = self.h1_ts = None
+        self.baseline = None         # ทิศ H1 ตอนเริ่ม/หลังปิดปกติ -> รอ cross ไปอีกฝั่ง
+        self.plan = self._idle()
+        self.opp = {"dir": None, "ts": None, "count": 0}
+        self.rearm = False           # ปิดเพราะ H1 สวน -> ใช้ทิศใหม่ต่อทันที
+        self._acts = []
+
+    STATE_KEYS = ("position", "baseline", "plan", "opp", "rearm")
+
+    @staticmethod
+    def _idle():
+        return {"dir": None, "h1_ts": None, "stage": "idle"}
+
+    def _armed(self):
+        return {"dir": self.h1_dir, "h1_ts": self.h1_ts, "stage": "armed" if self.h1_dir else "idle"}
+
+    def adopt(self, side, qty, entry):
+        d = self.max_sl
+        self.position = {"side": side, "qty": qty, "entry": entry,
+                         "sl": entry - d if side == "long" else entry + d, "tp": None, "step": 0}
+
+    def setup(self, ctx):
+        f, s, m = self.periods
+        self.ema_f, self.ema_s = ctx.ind.ema(self.htf, f), ctx.ind.ema(self.htf, s)
+        self.ema_m5, self.macd = ctx.ind.ema(self.ltf, m), ctx.ind.macd(self.ltf)
+
+    # ---------------- H1 ----------------
+    def _h1(self, ctx):
+        f, s = self.ema_f.value, self.ema_s.value
+        self.h1_dir = None if f is None or s is None or f == s else "long" if f > s else "short"
+        self.h1_ts = ctx.ind.last.get(self.htf)
+        pos = self.position
+        if pos is None:
+            return
+        # H1 สวนทางระหว่างถือ: นับแท่งปิดที่สวน
+        opp = "short" if pos["side"] == "long" else "long"
+        if self.h1_dir == opp:
+            self.opp["count"] = self.opp["count"] + 1 if self.opp["dir"] == opp else 1
+            self.opp.update(dir=opp, ts=self.h1_ts)
+        else:
+            self.opp = {"dir": None, "ts": None, "count": 0}
+        if self.opp["count"] >= self.opp_confirm_bars:
+            log.info(f"[EMA] {ctx.label}H1 opposite x{self.opp['count']} while {pos['side'].upper()}")
+            if self.new_signal_action == "close_now":
+                self.rearm = True
+                self._acts.append(self._close("H1_flip", ctx.price()))
+            else:
+                sl = ctx.price() - self.new_signal_sl_offset if pos["side"] == "long" else ctx.price() + self.new_signal_sl_offset
+                pos["sl"] = sl
+                self._acts.append({"type": "move_sl", "sl": sl})
+
+    # ---------------- M5 entry ----------------
+    def _m5(self, ctx):
+        if self.position is not None:
+            return
+        if self.baseline is None:
+            self.baseline = self.h1_dir
+            return
+        bar = ctx.closed(self.ltf, 1)
+        ema, m = self.ema_m5.value, self.macd.value()
+        if not bar or ema is None or m is None:
+            return
+        _, _, high, low, _, _ = bar[-1]
+        dif_p, dif_n, dea_p, dea_n = m
+        cur, plan = self.h1_dir, self.plan
+
+        if plan["stage"] == "idle":
+            if cur is None or cur == self.baseline:
+                return                                  # ยังไม่ cross จาก baseline
+            plan = self.plan = self._armed()
+            self._acts.append({"type": "alert", "msg": f"🧭 H1 CROSS จาก baseline → {cur.upper()} รอ M5 แตะ EMA + MACD"})
+        elif cur is None:
+            self.plan = self._idle()
+            return
+        elif cur != plan["dir"]:
+            plan = self.plan = self._armed()            # เปลี่ยนฝั่งระหว่างรอ -> ใช้สัญญาณใหม่ทันที
+
+        want = plan["dir"]
+        if plan["stage"] == "armed":
+            touched = low <= ema if want == "long" else high >= ema
+            macd_ok = dif_n < dea_n if want == "long" else dif_n > dea_n
+            if touched and macd_ok:
+                plan["stage"] = "wait_macd_cross"
+                plan["touch_ts"] = ctx.now
+                log.info(f"[EMA] {ctx.label}M5 touched EMA{self.periods[2]}, waiting MACD cross for {want.upper()}")
+        elif plan["stage"] == "wait_macd_cross":
+            if macd_up(*m) if want == "long" else macd_down(*m):
+                self._acts.append(self._open(ctx, want, plan.get("touch_ts")))
+                self.plan = dict(self._idle(), dir=want)
+
+    def _open(self, ctx, side, touch_ts=None):
+        px = ctx.price()
+        lo, hi = recent_swing_low_high(list(ctx.candles(self.ltf))[-max(self.swing_lookback, 60):], self.swing_lookback)
+        raw = lo - self.sl_extra if side == "long" else hi + self.sl_extra
+        sl = max(raw, px - self.max_sl) if side == "long" else min(raw, px + self.max_sl)
+        self.position = {"side": side, "qty": 0.0, "entry": px, "sl": sl, "tp": None, "step": 0}
+        self.opp = {"dir": None, "ts": None, "count": 0}
+        return {"type": "open", "side": side, "price": px, "sl": sl, "tp": None,
+                "note": "H1 EMA + M5 MACD", "touch_ts": touch_ts}
+
+    def _reason(self, pos):
+        step = pos.get("step", 0)
+        return "SL" if step == 0 else "BE" if step == 1 else f"TP_step{step}"
+
+    def _close(self, reason, price, type="close"):
+        pos, self.position = self.position, None
+        self._after_close()
+        return {"type": type, "position": pos, "reason": reason, "price": price, "note": None}
+
+    def _after_close(self):
+        if self.rearm:
+            self.plan = self._armed()                   # ใช้ทิศ H1 ปัจจุบันต่อทันที
+            self.rearm = False
+        else:
+            self.baseline, self.plan = self.h1_dir, self._idle()   # ปิดปกติ -> รอ cross ใหม่
+        self.opp = {"dir": None, "ts": None, "count": 0}
+
+    def on_bar(self, ctx, tf):
+        if tf == self.htf:
+            self._h1(ctx)
+        elif tf == self.ltf:
+            self._m5(ctx)
+
+    def on_fill(self, ctx, fill):
+        if self.position is None:
+            return []
+        return [self._close(self._reason(self.position), fill["price"], type="closed")]
+
+    def on_tick(self, ctx):
+        acts, self._acts = self._acts, []
+        pos = self.position
+        if ctx.fill or pos is None or any(a["type"] in ("open", "close", "closed") for a in acts):
+            return acts
+        amt, _ = ctx.position(self)
+        if amt == 0:
+            log.info(f"[EMA] {ctx.label}position gone on exchange, reset")
+            self.position = None
+            self._after_close()
+            return acts
+        return acts
+
+    # ---------------- triggers (ขั้น SL / ladder / alert / auto close / trailing) ----------------
+    def triggers(self, ctx):
+        # เฉพาะขั้นที่ยังไม่ผ่าน (state อยู่ใน position -> restore แล้วไม่ยิงซ้ำ)
+        pos = self.position
+        long = pos["side"] == "long"
+        sign, win, lose = (1, UP, DOWN) if long else (-1, DOWN, UP)
+        at = lambda pts: pos["entry"] + sign * pts
+        out = [{"level": at(t), "dir": win, "kind": "step", "data": i}
+               for i, (t, _) in enumerate(self.steps, 1) if pos.get("step", 0) < i]
+        out += [{"level": at(t), "dir": win, "kind": "ladder", "data": i}
+                for i, (t, _) in enumerate(self.ladder, 1) if pos.get("ladder", 0) < i]
+        if not pos.get("alerted"):
+            out.append({"level": at(self.alert_trigger), "dir": win, "kind": "alert"})
+        out.append({"level": at(self.auto_close), "dir": win, "kind": "auto"})
+        if self.trail:
+            out.append({"level": at(-self.trail), "dir": lose, "kind": "trail", "trail": self.trail})
+        return out
+
+    def on_move_failed(self, ctx, act, sl):
+        # ขั้น SL ย้ายบน exchange ไม่ผ่าน -> step ถอยกลับ; position ใหม่ = engine re-arm trigger ของขั้นนั้นอีกครั้ง
+        super().on_move_failed(ctx, act, sl)
+        if act.get("step"):
+            self.position = dict(self.position, step=act["step"] - 1)
+
+    def on_trigger(self, ctx, trig):
+        pos, kind, px = self.position, trig.kind, ctx.price()
+        side, entry = pos["side"], pos["entry"]
+        if kind == "step":
+            i = trig.data
+            if pos["step"] >= i:
+                return []
+            offset = self.steps[i - 1][1]
+            pos["sl"] = entry + offset if side == "long" else entry - offset
+            pos["step"] = i
+            return [{"type": "move_sl", "sl": pos["sl"], "step": i},
+                    {"type": "alert", "msg": f"🚦 Step{i} → SL {pos['sl']:.2f}"}]
+        if kind == "ladder":
+            i = trig.data
+            if pos.get("ladder", 0) >= i:
+                return []
+            pos["ladder"] = i
+            return [{"type": "reduce", "position": pos, "qty": pos["qty"] * self.ladder[i - 1][1],
+                     "reason": f"TP_ladder{i}", "price": px, "note": None}]
+        if kind == "alert":
+            pos["alerted"] = True
+            return [{"type": "alert", "msg": f"🚨 กำไรเกิน {self.alert_trigger:.0f} pts พิจารณาปิดโพซิชัน"}]
+        if kind == "auto":
+            return [self._close("TP_auto", px)]
+        if kind == "trail":
+            return [self._close("TRAIL", px)]
+        return []
+
+# ============================================================
+# SMC + Fibo + POC
+# ============================================================
+class SMCFiboPlugin(Plugin):
+    name = "smc"
+    client_stops = True            # SL1 (Fibo80/POC) / TP1 / Fibo2 เฝ้าด้วย bot
+
+    def __init__(self, htf="1h", ltf="5m", h1_swing=(3, 3), m5_swing=(1, 1), h1_bars=400, m5_bars=150,
+                 poc_buckets=40, tp1_ratio=0.60, ema_filter=False, ema_period=200, adopt_sl=2000):
+        super().__init__()
+        self.htf, self.ltf = htf, ltf
+        self.timeframes = {htf: h1_bars, ltf: 200}
+        self.h1_swing, self.m5_swing = h1_swing, m5_swing
+        self.h1_bars, self.m5_bars = h1_bars, m5_bars
+        self.poc_buckets, self.tp1_ratio = poc_buckets, tp1_ratio
+        self.ema_filter, self.ema_period = ema_filter, ema_period
+        self.adopt_sl = adopt_sl    # position ที่รับมาโดยไม่มี state: SL ห่างจาก entry เท่านี้
+        self.h1 = []                # แท่ง H1 ที่ปิดแล้ว (ล่าสุด h1_bars)
+        self.h1_st = smc.Structure(*h1_swing, window=h1_bars)
+        self.m5_st = smc.Structure(*m5_swing, window=m5_bars)
+        self.h1_sig = None
+        self.m5_dir = None
+        self.phase = "WAIT_H1"      # WAIT_H1 -> WAIT_M5 -> FIBO_SET -> IN_ZONE -> IN_POSITION
+        self._reset()
+
+    STATE_KEYS = ("position", "phase", "h1_dir", "fibo", "poc", "entered_zone", "waiting_reenter",
+                  "m5_swing_in_zone", "tp1_done", "fibo2")
+
+    def _reset(self):
+        self.phase = "WAIT_H1"
+        self.h1_dir = self.fibo = self.poc = None
+        self.entered_zone = self.waiting_reenter = False
+        self.m5_swing_in_zone = None
+        self.tp1_done, self.fibo2 = False, None
+
+    def setup(self, ctx):
+        self.macd = ctx.ind.macd(self.ltf)
+        self.ema = ctx.ind.ema(self.htf, self.ema_period) if self.ema_filter else None
+
+    def on_bar(self, ctx, tf):
+        if tf == self.htf:
+            self.h1 = ctx.closed(self.htf, self.h1_bars)
+            self.h1_sig = self.h1_st.sync(self.h1).last_signal()
+        elif tf == self.ltf:
+            sig = self.m5_st.sync(ctx.closed(self.ltf, self.m5_bars)).last_signal()
+            self.m5_dir = sig["trend"] if sig else None
+
+    # ---------------- helpers ----------------
+    def _set_fibo(self):
+        lo, hi, _, _ = smc.pick_swing(self.h1, self.h1_dir)
+        self.fibo = f = smc.fibo_levels(self.h1_dir, lo, hi)
+        self.poc = smc.calc_poc(self.h1, min(f["0"], f["100"]), max(f["0"], f["100"]), self.poc_buckets)
+        self.entered_zone = self.waiting_reenter = False
+
+    def _sl1(self):
+        # Fibo80; ถ้า POC อยู่ในโซน 0–78.6 ใช้ POC
+        f, poc = self.fibo, self.poc
+        if poc is not None and smc.in_zone(poc, f, "0", "78.6"):
+            return poc
+        return f["80"]
+
+    def _swing_in_zone(self, ctx, side):
+        # swing M5 ล่าสุดที่อยู่ในโซน Fibo (long = swing low, short = swing high) -> 0 ของ Fibo2
+        kind = "low" if side == "long" else "high"
+        for s in reversed(self.m5_st.sync(ctx.closed(self.ltf, self.m5_bars)).swings()):
+            if s[0] == kind and smc.in_zone(s[3], self.fibo):
+                return s[3]
+        return None
+
+    def _ema_ok(self, ctx, side):
+        if not self.ema:
+            return True
+        c, e = ctx.closed(self.htf, 1), self.ema.value
+        if not c or e is None:
+            return True
+        return c[-1][4] > e if side == "long" else c[-1][4] < e
+
+    def _finish(self, reason, price, type="close"):
+        pos, self.position = self.position, None
+        self._reset()
+        return {"type": type, "position": pos, "reason": reason, "price": price, "note": None}
+
+    def on_reject(self, ctx, act):
+        super().on_reject(ctx, act)
+        self.phase = "IN_ZONE"
+
+    def adopt(self, side, qty, entry):
+        # ไม่มี Fibo / POC ให้อ้าง -> SL ห่าง adopt_sl, ไม่มี TP1 (ดูแลแค่ SL จนปิด)
+        d = self.adopt_sl
+        self.position = {"side": side, "qty": qty, "entry": entry,
+                         "sl": entry - d if side == "long" else entry + d, "tp": None}
+        self.phase = "IN_POSITION"
+
+    def levels(self, ctx):
+        # รอเข้าโซน -> ขอบโซน Fibo; ถือ position -> SL/TP (หลัง TP1 = Fibo2 0 / ext1.33)
+        if self.position is not None:
+            return super().levels(ctx)
+        if self.fibo and self.phase in ("FIBO_SET", "WAIT_M5"):
+            return [self.fibo["33"], self.fibo["78.6"]]
+        return []
+
+    def on_fill(self, ctx, fill):
+        return [self._finish("SL", fill["price"], type="closed")] if self.position else []
+
+    # ---------------- decision ----------------
+    def on_tick(self, ctx):
+        if ctx.fill:
+            return []
+        px = ctx.price()
+
+        # 1) WAIT_H1: หา H1 signal
+        if self.phase == "WAIT_H1" and self.h1_sig:
+            self._reset()
+            self.h1_dir, self.phase = self.h1_sig["trend"], "WAIT_M5"
+
+        # 2) WAIT_M5: M5 CHOCH สวน H1 -> ตี Fibo
+        if self.phase == "WAIT_M5" and self.h1_dir and self.m5_dir:
+            if self.m5_dir != self.h1_dir:
+                self._set_fibo()
+                self.phase = "FIBO_SET"
+            elif self.fibo and not self.entered_zone:
+                self.waiting_reenter = True
+
+        # 3) รอเข้าโซน (H1 BOS ใหม่ทิศเดิม -> ตี Fibo ใหม่)
+        if self.phase in ("FIBO_SET", "WAIT_M5"):
+            if self.waiting_reenter and self.fibo and not self.entered_zone:
+                if self.h1_sig and self.h1_sig["trend"] == self.h1_dir:
+                    self._set_fibo()
+            if self.fibo and smc.in_zone(px, self.fibo):
+                self.entered_zone, self.phase = True, "IN_ZONE"
+                log.info(f"[SMC] {ctx.label}price in Fibo zone, waiting M5 CHOCH back + MACD")
+
+        # 4) IN_ZONE: M5 CHOCH กลับทิศ H1 + MACD -> OPEN
+        amt, _ = ctx.position(self)
+        if self.phase == "IN_ZONE" and amt == 0:
+            want = "short" if self.h1_dir == "down" else "long"
+            m = self.macd.peek(ctx.candles(self.ltf)[-1][4])
+            macd_ok = bool(m) and (macd_down(*m) if want == "short" else macd_up(*m))
+            ok_dir = self.m5_dir == ("down" if want == "short" else "up")
+            if self._ema_ok(ctx, want) and ok_dir and macd_ok:
+                self.m5_swing_in_zone = self._swing_in_zone(ctx, want)
+                sl, tp = self._sl1(), self.fibo["0"]
+                self.position = {"side": want, "qty": 0.0, "entry": px, "sl": sl, "tp": tp}
+                self.tp1_done, self.fibo2, self.phase = False, None, "IN_POSITION"
+                return [{"type": "open", "side": want, "price": px, "sl": sl, "tp": tp,
+                         "note": f"SMC SL1={'POC' if sl == self.poc else 'Fibo80'}", "touch_ts": None}]
+            return []
+
+        # 5) IN_POSITION: SL1 / TP1 (ปิดบางส่วน) -> Fibo2 -> TP2 / SL2
+        pos = self.position
+        if self.phase != "IN_POSITION" or pos is None:
+            return []
+        if amt == 0:
+            log.info(f"[SMC] {ctx.label}position gone on exchange, reset")
+            self.position = None
+            self._reset()
+            return []
+        side = pos["side"]
+        if not self.tp1_done:
+            if _crossed(side, pos["sl"], px):
+                return [self._finish("SL", px)]
+            if pos["tp"] is not None and _crossed(side, px, pos["tp"]):
+                qty = pos["qty"] * self.tp1_ratio
+                self.tp1_done = True
+                zero = self.m5_swing_in_zone if self.m5_swing_in_zone is not None else px
+                self.fibo2 = f2 = smc.fibo2(side, self.fibo["0"], zero)
+                pos["sl"], pos["tp"] = f2["0"], f2["ext133"]
+                return [{"type": "reduce", "position": pos, "qty": qty, "reason": "TP1", "price": px, "note": None},
+                        {"type": "alert", "msg": f"🔁 SL2 → {f2['0']:.2f} | ext1.33={f2['ext133']:.2f}"}]
+            return []
+        f2 = self.fibo2
+        if _crossed(side, px, f2["ext133"]) or _crossed(side, px, f2["ext161.8"]):
+            return [self._finish("TP2", px)]
+        if _crossed(side, f2["0"], px):
+            return [self._finish("SL2", px)]
+        return []
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+# portfolio.py
+# Multi-symbol: process เดียว, ccxt client เดียว, rate limiter เดียว (ratelimit.py)
+# - PortfolioFeed: poll ครั้งเดียวต่อ loop สำหรับทุก symbol
+#     candles  -> fetch_ohlcv ต่อ (symbol, tf) แบบขนาน (thread pool, ผ่าน limiter ตัวเดียวกัน)
+#     position -> fetch_positions(symbols) call เดียว
+#     price    -> fetch_last_prices (/fapi/v2/ticker/price ทุก symbol, weight 2) call เดียว
+#                 (lazy: ดึงเมื่อมี symbol ต้องใช้ราคาเท่านั้น; fetch_tickers = 24hr weight 40)
+#   view(symbol) คืน object ที่หน้าตาเหมือน RestFeed -> SymbolBot ใช้ได้เหมือน single-symbol
+# - Allocator: แบ่ง margin ตาม weight ของแต่ละ symbol จาก wallet balance ก้อนเดียว
+
+import time, logging, threading
+from concurrent.futures import ThreadPoolExecutor
+
+log = logging.getLogger("main")
+
+class PortfolioFeed:
+    def __init__(self, ex, store, symbols, timeframes, loop_sec=10, workers=8):
+        self.ex = ex
+        self.store = store
+        self.symbols = list(symbols)
+        self.timeframes = list(timeframes)
+        self.loop_sec = loop_sec
+        self.pool = ThreadPoolExecutor(max_workers=max(1, min(workers, len(self.symbols) * len(self.timeframes))))
+        self.positions = {}          # symbol -> (amt, side)
+        self._tickers = None
+        self._tick_lock = threading.Lock()
+        self.done = False
+
+    def refresh(self):
+        # 1) candles ทุก (symbol, tf) พร้อมกัน
+        jobs = [self.pool.submit(self.store.update, s, tf) for s in self.symbols for tf in self.timeframes]
+        for j in jobs:
+            try:
+                j.result()
+            except Exception as e:
+                log.warning(f"[PORTFOLIO] candles error: {e}")
+        # 2) positions ทุก symbol ใน call เดียว (error -> ใช้ค่าล่าสุด ไม่ถือว่า position หาย)
+        try:
+            pos = {s: (0.0, None) for s in self.symbols}
+            for p in self.ex.fetch_positions(self.symbols):
+                amt = float(p.get("contracts") or 0)
+                if p.get("symbol") in pos and amt != 0:
+                    pos[p["symbol"]] = (amt, p["side"])
+            self.positions = pos
+        except Exception as e:
+            log.warning(f"[PORTFOLIO] fetch_positions error: {e} (using last known)")
+        # 3) tickers: ดึงใหม่เมื่อมีคนขอ
+        self._tickers = None
+
+    def last_price(self, symbol):
+        with self._tick_lock:
+            if self._tickers is None or symbol not in self._tickers:
+                self._tickers = self.ex.fetch_last_prices(self.symbols)
+        return self._tickers[symbol]["price"]
+
+    def wait(self, sec=None):
+        time.sleep(self.loop_sec if sec is None else sec)
+
+    def view(self, symbol):
+        return SymbolView(self, symbol)
+
+    def close(self):
+        self.pool.shutdown(wait=False)
+
+class SymbolView:
+    # interface เดียวกับ RestFeed (now/candles/position/last_price/wait) สำหรับ symbol เดียว
+    def __init__(self, pf, symbol):
+        self.pf = pf
+        self.symbol = symbol
+
+    @property
+    def done(self):
+        return self.pf.done
+
+    def now(self):
+        return time.time()
+
+    def candles(self, tf):
+        buf = self.pf.store.buf.get((self.symbol, tf))
+        return buf if buf else self.pf.store.update(self.symbol, tf)
+
+    def position(self):
+        return self.pf.positions.get(self.symbol, (0.0, None))
+
+    def last_price(self):
+        return self.pf.last_price(self.symbol)
+
+    def wait(self, sec=None):
+        pass                         # loop หลักเป็นคนรอ
+
+    def close(self):
+        pass
+
+class Allocator:
+    """margin ของ symbol = wallet * fraction * weight (normalize แล้ว), ไม่เกิน free balance"""
+    def __init__(self, symbols, weights=None, fraction=0.7, leverage=10):
+        w = {s: float((weights or {}).get(s, 1.0)) for s in symbols}
+        tot = sum(w.values()) or 1.0
+        self.weights = {s: v / tot for s, v in w.items()}
+        self.fraction = fraction
+        self.leverage = leverage
+
+    def margin(self, ex, symbol):
+        bal = (ex.fetch_balance({"type": "future"}).get("USDT") or {})
+        total = float(bal.get("total") or 0.0)
+        free = float(bal.get("free") or 0.0)
+        return max(0.0, min(free, total * self.fraction * self.weights.get(symbol, 0.0)))
+
+    def qty(self, ex, symbol, price):
+        notional = self.margin(ex, symbol) * self.leverage
+        qty = notional / price if price > 0 else 0
+        try:
+            return float(ex.amount_to_precision(symbol, qty))
+        except Exception:
+            return round(qty, 3)
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+# ratelimit.py
+# Global weight-aware rate limiter สำหรับ Binance USDT-M (REQUEST_WEIGHT ต่อนาที)
+# - RateLimiter: token bucket ตาม weight, thread-safe (ใช้ร่วมกันทุก symbol / thread)
+# - LimitedExchange: ห่อ ccxt client -> ทุก call หัก weight ก่อนส่ง และ sync กับ header X-MBX-USED-WEIGHT-1M
+
+import threading, time, logging
+
+log = logging.getLogger("main")
+
+WEIGHT_LIMIT = 2400        # /fapi REQUEST_WEIGHT ต่อนาที
+SAFETY = 0.8               # ใช้แค่ 80% ของ limit เผื่อ process อื่น / คลาดเคลื่อน
+BACKOFF_SEC = 60           # โดน 429/418 แล้วหยุดส่งนานเท่านี้
+
+def klines_weight(limit):
+    limit = limit or 500
+    return 1 if limit < 100 else 2 if limit < 500 else 5 if limit <= 1000 else 10
+
+def depth_weight(limit):
+    limit = limit or 500
+    return 2 if limit <= 50 else 5 if limit <= 100 else 10 if limit <= 500 else 20
+
+# weight ต่อ method (ตาม endpoint ที่ ccxt ใช้บน binanceusdm)
+WEIGHTS = {
+    "fetch_ohlcv": lambda a, k: klines_weight(k.get("limit", a[3] if len(a) > 3 else None)),
+    "fetch_order_book": lambda a, k: depth_weight(k.get("limit", a[1] if len(a) > 1 else None)),
+    "fetch_ticker": 1,
+    "fetch_tickers": 40,                    # /fapi/v1/ticker/24hr ทุก symbol
+    "fetch_last_prices": 2,                 # /fapi/v2/ticker/price ทุก symbol
+    "fetch_bids_asks": 5,                   # /fapi/v1/ticker/bookTicker ทุก symbol
+    "fetch_positions": 5,
+    "fetch_balance": 5,
+    "fetch_open_orders": lambda a, k: 1 if (a or k.get("symbol")) else 40,
+    "fetch_order": 1,
+    "create_order": 1,
+    "create_market_order": 1,
+    "cancel_order": 1,
+    "set_leverage": 1,
+    "load_markets": 1,
+    "fapiPrivatePostListenKey": 1,
+    "fapiPrivatePutListenKey": 1,
+}
+
+class RateLimiter:
+    def __init__(self, limit=WEIGHT_LIMIT, safety=SAFETY, window=60.0):
+        self.capacity = limit * safety
+        self.rate = self.capacity / window          # weight ที่คืนต่อวินาที
+        self.tokens = self.capacity
+        self.t = time.monotonic()
+        self.lock = threading.Lock()
+        self.used = 0                               # weight รวมที่ใช้ไป
+        self.waited = 0.0                           # เวลารวมที่ต้องรอ (sec)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.t) * self.rate)
+        self.t = now
+
+    def acquire(self, weight=1):
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= weight:
+                    self.tokens -= weight
+                    self.used += weight
+                    return
+                sleep = (weight - self.tokens) / self.rate
+                self.waited += sleep
+            time.sleep(sleep)
+
+    def block(self, sec):
+        # 429 / 418 จาก server -> หยุดส่งทั้ง process อย่างน้อย sec วินาที
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.tokens, -sec * self.rate)
+        log.warning(f"[RATE] throttled by exchange, backing off {sec:.0f}s")
+
+    def observe(self, used_1m):
+        # server บอก weight ที่ใช้ไปในนาทีนี้ (รวม process อื่นบน IP เดียวกัน)
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.tokens, self.capacity - float(used_1m))
+
+class LimitedExchange:
+    """proxy ของ ccxt client: method ที่อยู่ใน WEIGHTS จะผ่าน limiter; attribute อื่นส่งต่อตรง"""
+    def __init__(self, ex, limiter):
+        self._ex = ex
+        self._limiter = limiter
+
+    def __getattr__(self, name):
+        attr = getattr(self._ex, name)
+        w = WEIGHTS.get(name)
+        if w is None or not callable(attr):
+            return attr
+        def call(*a, **k):
+            self._limiter.acquire(w(a, k) if callable(w) else w)
+            try:
+                return attr(*a, **k)
+            except Exception as e:
+                if type(e).__name__ in ("RateLimitExceeded", "DDoSProtection"):   # 429 / 418
+                    self._limiter.block(BACKOFF_SEC)
+                raise
+            finally:
+                used = (getattr(self._ex, "last_response_headers", None) or {}).get("X-MBX-USED-WEIGHT-1M")
+                if used is not None:
+                    self._limiter.observe(used)
+        return call
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+# resample.py
+# สร้าง TF ใหญ่จาก base stream เดียว (เช่น 5m -> 15m/30m/1h/4h)
+# - bucket align ตาม UTC epoch เหมือน Binance (1w เริ่มวันจันทร์)
+# - resample(): batch แบบ vectorized (reduceat) สำหรับ history
+# - Resampler: incremental ต่อแท่ง base (รวมแท่ง base ที่กำลังก่อตัว -> แท่ง TF ใหญ่ที่กำลังก่อตัว)
+
+import numpy as np
+
+from candles import tf_seconds
+
+WEEK_OFFSET_MS = 4 * 86_400_000      # 1970-01-01 เป็นวันพฤหัส -> จันทร์แรกคือ +4 วัน
+
+def _offset(tf):
+    return WEEK_OFFSET_MS if tf.endswith("w") else 0
+
+def align(ts, tf):
+    # ts (ms) -> เวลาเปิดของแท่ง tf ที่ครอบ ts (int หรือ np.ndarray)
+    tf_ms = tf_seconds(tf) * 1000
+    off = _offset(tf)
+    return (ts - off) // tf_ms * tf_ms + off
+
+def ratio(base_tf, tf):
+    b, t = tf_seconds(base_tf), tf_seconds(tf)
+    if t % b or t < b:
+        raise ValueError(f"{tf} is not a multiple of {base_tf}")
+    return t // b
+
+def resample(ohlcv, base_tf, tf, trim=True):
+    """ohlcv (N, 6) ของ base_tf เรียงตาม ts -> (M, 6) ของ tf
+    trim: ตัด bucket แรกทิ้งถ้า base เริ่มกลาง bucket (ข้อมูลไม่ครบ)
+    แท่งสุดท้ายคือแท่งที่กำลังก่อตัวถ้า base ยังไม่ครบ bucket (ดู closed_mask)"""
+    ratio(base_tf, tf)
+    a = np.asarray(ohlcv, dtype=np.float64)
+    if len(a) == 0:
+        return np.zeros((0, 6))
+    ts = a[:, 0].astype(np.int64)
+    b = align(ts, tf)
+    idx = np.flatnonzero(np.r_[True, b[1:] != b[:-1]])
+    last = np.r_[idx[1:] - 1, len(a) - 1]
+    out = np.empty((len(idx), 6))
+    out[:, 0] = b[idx]
+    out[:, 1] = a[idx, 1]
+    out[:, 2] = np.maximum.reduceat(a[:, 2], idx)
+    out[:, 3] = np.minimum.reduceat(a[:, 3], idx)
+    out[:, 4] = a[last, 4]
+    out[:, 5] = np.add.reduceat(a[:, 5], idx)
+    if trim and ts[0] != b[0]:
+        out = out[1:]
+    return out
+
+def closed_mask(out, last_base_ts, base_tf, tf):
+    # True = แท่ง tf ปิดแล้ว (แท่ง base สุดท้ายที่มีปิดถึงปลาย bucket)
+    end = last_base_ts + tf_seconds(base_tf) * 1000
+    return out[:, 0] + tf_seconds(tf) * 1000 <= end
+
+def _merge(agg, row, bucket):
+    if agg is None:
+        return [bucket, row[1], row[2], row[3], row[4], row[5]]
+    return [bucket, agg[1], max(agg[2], row[2]), min(agg[3], row[3]), row[4], agg[5] + row[5]]
+
+class Resampler:
+    """ป้อนแท่ง base ทีละแท่ง (แท่งที่กำลังก่อตัวส่งซ้ำ ts เดิมได้) -> คืนแท่ง tf ปัจจุบัน"""
+    def __init__(self, base_tf, tf):
+        ratio(base_tf, tf)
+        self.base_tf, self.tf = base_tf, tf
+        self.bucket = None
+        self.closed = None        # aggregate ของแท่ง base ที่ปิดแล้วใน bucket ปัจจุบัน
+        self.forming = None       # แท่ง base ล่าสุด (อาจยังไม่ปิด)
+
+    def update(self, row):
+        ts = row[0]
+        f = self.forming
+        if f is not None and ts < f[0]:
+            return None                          # แท่งเก่า (ซ้ำ/ย้อนหลัง)
+        b = align(int(ts), self.tf)
+        if f is not None and ts > f[0]:
+            # แท่ง base ก่อนหน้าปิดแล้ว
+            self.closed = _merge(self.closed, f, self.bucket) if b == self.bucket else None
+        elif b != self.bucket:
+            self.closed = None
+        self.bucket = b
+        self.forming = list(row)
+        return _merge(self.closed, row, b)
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+# scheduler.py
+# Adaptive loop scheduler แทน sleep คงที่ (LOOP_SEC)
+# - candle close: ตื่นหลังแท่งของทุก TF ที่ใช้ปิด close_lag วินาที (+ รอบ NW freeze) -> ไม่ drift ตามเวลาที่ loop ใช้
+# - proximity: ระยะราคาถึง level ใกล้สุด (band / SL / TP / zone) เป็นสัดส่วนของราคา
+#     <= near -> min_sec, >= far -> max_sec, ระหว่างนั้น interpolate แบบ log
+# - budget: weight ต่อรอบ (วัดจาก RateLimiter.used) -> interval ขั้นต่ำที่ไม่เกิน budget weight/นาที
+# - error: backoff x2 ต่อ error ติดกัน (เริ่ม ERROR_SEC, ไม่เกิน max_sec)
+#
+#   sched = Scheduler(["5m", "30m"], extra=[900])
+#   feed.wait(sched.next(now, dist))      # dist = Engine.distance()
+
+import math, time, logging
+
+import metrics
+from candles import tf_seconds
+from resample import _offset
+
+log = logging.getLogger("main")
+
+ERROR_SEC = 2.0
+
+class Scheduler:
+    def __init__(self, timeframes=(), extra=(), min_sec=1.0, max_sec=30.0, near=0.0015, far=0.02,
+                 budget=None, limiter=None, close_lag=1.0):
+        # boundary = (period, offset) วินาที; extra = period (sec) เพิ่มเติม เช่นรอบ NW freeze
+        b = {(tf_seconds(tf), _offset(tf) / 1000) for tf in timeframes}
+        b |= {(float(p), 0.0) for p in extra if p and p > 0}
+        self.boundaries = sorted(b)
+        self.min_sec, self.max_sec = min_sec, max_sec
+        self.near, self.far = near, far
+        self.budget = budget          # weight ต่อนาทีที่ loop ใช้ได้ (None = ไม่จำกัด)
+        self.limiter = limiter
+        self.close_lag = close_lag
+        self.weight = None            # EMA ของ weight ต่อรอบ
+        self._used = limiter.used if limiter else 0
+        self.errors = 0
+        self.last = None              # (sec, reason) ของรอบล่าสุด
+
+    def to_close(self, now):
+        # วินาทีถึงขอบแท่ง (close) ถัดไปของทุก boundary
+        if not self.boundaries:
+            return None
+        return min((math.floor((now - off) / p) + 1) * p + off - now for p, off in self.boundaries)
+
+    def proximity(self, dist):
+        # dist = ระยะถึง level ใกล้สุด / ราคา (None = ไม่มี level)
+        if dist is None or dist >= self.far:
+            return self.max_sec
+        if dist <= self.near:
+            return self.min_sec
+        t = math.log(dist / self.near) / math.log(self.far / self.near)
+        return self.min_sec * (self.max_sec / self.min_sec) ** t
+
+    def _observe(self):
+        if self.limiter is None:
+            return
+        used = self.limiter.used
+        w, self._used = used - self._used, used
+        self.weight = w if self.weight is None else 0.8 * self.weight + 0.2 * w
+
+    def floor(self):
+        # interval ขั้นต่ำตาม budget
+        if not self.budget or not self.weight:
+            return 0.0
+        return 60.0 * self.weight / self.budget
+
+    def next(self, now=None, dist=None):
+        now = time.time() if now is None else now
+        self.errors = 0
+        self._observe()
+        sec, why = self.proximity(dist), "far" if dist is None or dist >= self.far else "near"
+        close = self.to_close(now)
+        if close is not None and close + self.close_lag <= sec:
+            sec, why = close + self.close_lag, "close"
+        low = self.floor()
+        if sec < low:
+            sec, why = low, "budget"
+        self.last = (sec, why)
+        metrics.observe("schedule_seconds", sec, reason=why)
+        return sec
+
+    def error(self):
+        # error ติดกัน -> รอนานขึ้นเรื่อยๆ
+        self.errors += 1
+        sec = min(self.max_sec, ERROR_SEC * 2 ** (self.errors - 1))
+        self.last = (sec, "error")
+        return sec
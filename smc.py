@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+# smc.py
+# Market structure (SMC) จาก "main.py smc fibo✅": swing, BOS / CHOCH, Fibo, POC (volume profile)
+# ohlcv = list ของ [ts, o, h, l, c, v] หรือ np.ndarray (N, 6)
+# - find_swings / detect_structure / last_signal / calc_poc: NumPy (rolling max/min, bincount) ผลเท่ากับ *_reference
+# - structure_batch: สัญญาณ + trend ที่รู้ ณ แต่ละแท่ง (backtest)
+# - Structure: incremental ทีละแท่งปิด (live) ผลเท่ากับ last_signal บน window เดียวกัน
+
+from bisect import bisect_left
+from collections import deque
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+HIGH, LOW = 0, 1
+KINDS = ("high", "low")
+
+def _cols(ohlcv):
+    a = np.asarray(ohlcv, dtype=np.float64)
+    return a if a.ndim == 2 else a.reshape(len(a), 6)
+
+def pivots(high, low, left=2, right=2):
+    # mask ของ swing high / low: ค่าเท่ากับ max/min ของ window [i-left, i+right]
+    n = len(high)
+    ph = np.zeros(n, dtype=bool)
+    pl = np.zeros(n, dtype=bool)
+    w = left + right + 1
+    if n >= w:
+        s = slice(left, n - right)
+        ph[s] = high[s] == sliding_window_view(high, w).max(axis=1)
+        pl[s] = low[s] == sliding_window_view(low, w).min(axis=1)
+    return ph, pl
+
+def _swings(a, left, right):
+    # (kind, i, price) เรียงตาม i; high ก่อน low ใน bar เดียวกัน
+    ph, pl = pivots(a[:, 2], a[:, 3], left, right)
+    ih, il = np.flatnonzero(ph), np.flatnonzero(pl)
+    idx = np.concatenate((ih, il))
+    kind = np.concatenate((np.full(len(ih), HIGH), np.full(len(il), LOW)))
+    order = np.lexsort((kind, idx))
+    idx, kind = idx[order], kind[order]
+    price = np.where(kind == HIGH, a[idx, 2], a[idx, 3])
+    return kind, idx, price
+
+def _events(close, kind, idx, price):
+    """BOS / CHOCH แบบ vectorized
+    event k = close ที่ swing k ทะลุราคา swing k-1; BOS (high ทะลุขึ้น / low ทะลุลง) ยิงเสมอ
+    ก่อน BOS แรก trend = None -> CHOCH ไม่ยิง; หลังจากนั้น trend = ทิศของ event ล่าสุด
+    -> CHOCH ยิงเมื่อทิศต่างจาก event ก่อนหน้า
+    คืน (k, up, bos) ของ event ที่ยิง"""
+    c = close[idx[1:]]
+    pp = price[:-1]
+    up, down = c > pp, c < pp
+    bos = ((kind[1:] == HIGH) & up) | ((kind[1:] == LOW) & down)
+    e = np.flatnonzero(up | down)
+    if not len(e):
+        return e, e.astype(bool), e.astype(bool)
+    d, b = up[e], bos[e]
+    nb = np.flatnonzero(b)
+    if not len(nb):
+        return e[:0], d[:0], b[:0]
+    flip = np.zeros(len(e), dtype=bool)
+    flip[1:] = d[1:] != d[:-1]
+    fire = b | (flip & (np.arange(len(e)) > nb[0]))
+    return e[fire] + 1, d[fire], b[fire]
+
+def _signal(bos, up, price, ts, i):
+    return {"signal": "BOS" if bos else "CHOCH", "trend": "up" if up else "down", "price": price, "ts": ts, "i": i}
+
+def find_swings(ohlcv, left=2, right=2):
+    # [(kind, i, ts, price)] เรียงตาม i; high ก่อน low ใน bar เดียวกัน
+    if not len(ohlcv):
+        return []
+    kind, idx, price = _swings(_cols(ohlcv), left, right)
+    return [(KINDS[k], i, ohlcv[i][0], ohlcv[i][2 + k]) for k, i in zip(kind.tolist(), idx.tolist())]
+
+def detect_structure(ohlcv, swings):
+    # เทียบ close ที่ swing ปัจจุบันกับราคา swing ก่อนหน้า -> BOS (ทิศเดิม/ตั้งต้น) / CHOCH (กลับทิศ)
+    if len(swings) < 2:
+        return []
+    kind = np.array([HIGH if s[0] == "high" else LOW for s in swings])
+    idx = np.array([s[1] for s in swings])
+    price = np.array([s[3] for s in swings], dtype=np.float64)
+    k, up, bos = _events(_cols(ohlcv)[:, 4], kind, idx, price)
+    return [_signal(b, u, swings[j][3], swings[j][2], swings[j][1])
+            for j, u, b in zip(k.tolist(), up.tolist(), bos.tolist())]
+
+def last_signal(ohlcv, left=2, right=2):
+    if not len(ohlcv):
+        return None
+    a = _cols(ohlcv)
+    kind, idx, price = _swings(a, left, right)
+    if len(idx) < 2:
+        return None
+    k, up, bos = _events(a[:, 4], kind, idx, price)
+    if not len(k):
+        return None
+    j = int(k[-1])
+    i = int(idx[j])
+    return _signal(bool(bos[-1]), bool(up[-1]), ohlcv[i][2 + int(kind[j])], ohlcv[i][0], i)
+
+def structure_batch(ohlcv, left=2, right=2):
+    """backtest: (signals, trend) บนทั้งชุด
+    trend[t] = +1 / -1 / 0 ของสัญญาณล่าสุดที่ยืนยันแล้ว ณ แท่ง t (swing i รู้ผลที่แท่ง i+right)"""
+    a = _cols(ohlcv)
+    n = len(a)
+    trend = np.zeros(n, dtype=np.int8)
+    if not n:
+        return [], trend
+    kind, idx, price = _swings(a, left, right)
+    if len(idx) < 2:
+        return [], trend
+    k, up, bos = _events(a[:, 4], kind, idx, price)
+    ii = idx[k]
+    sig = [_signal(b, u, ohlcv[i][2 + kd], ohlcv[i][0], i)
+           for i, kd, u, b in zip(ii.tolist(), kind[k].tolist(), up.tolist(), bos.tolist())]
+    if len(k):
+        at = ii + right                                  # แท่งที่สัญญาณรู้ผล (หลายสัญญาณแท่งเดียวกัน -> อันหลัง)
+        pos = np.searchsorted(at, np.arange(n), side="right") - 1
+        trend = np.where(pos >= 0, np.where(up, 1, -1)[np.maximum(pos, 0)], 0).astype(np.int8)
+    return sig, trend
+
+class Structure:
+    """swing + BOS/CHOCH แบบ incremental: ป้อนแท่งปิดทีละแท่ง (O(1) ต่อแท่ง)
+    window=N -> last_signal()/swings() เท่ากับฟังก์ชัน batch บน N แท่งล่าสุด (i นับจากต้น window)"""
+    TRIM = 4096
+
+    def __init__(self, left=2, right=2, window=None):
+        self.left, self.right, self.window = left, right, window
+        self.bars = deque(maxlen=left + right + 1)
+        self.n = 0                # จำนวนแท่งที่ป้อนแล้ว (index สะสม)
+        self.last_ts = None
+        self.sw = []              # (kind, gi, ts, price)
+        self.sw_i = []
+        self.ev = []              # event (close != ราคา swing ก่อนหน้า): (k ของ swing, up, bos)
+        self.ev_i0 = []           # i ของ swing ก่อนหน้าของแต่ละ event (กรองตาม window)
+        self.bos = []             # ตำแหน่งใน self.ev ที่เป็น BOS
+
+    def sync(self, ohlcv):
+        # ป้อนเฉพาะแท่งที่ใหม่กว่าแท่งล่าสุด; ครั้งแรกใช้แค่ window แท่งท้าย
+        rows = ohlcv if self.last_ts is not None or not self.window else ohlcv[-self.window:]
+        for c in rows:
+            if self.last_ts is None or c[0] > self.last_ts:
+                self.append(c)
+        return self
+
+    def append(self, c):
+        self.bars.append(c)
+        self.last_ts = c[0]
+        gi = self.n
+        self.n += 1
+        if len(self.bars) < self.bars.maxlen:
+            return
+        i = gi - self.right
+        row = self.bars[self.left]
+        if row[2] == max(b[2] for b in self.bars):
+            self._add(HIGH, i, row)
+        if row[3] == min(b[3] for b in self.bars):
+            self._add(LOW, i, row)
+
+    def _add(self, kind, i, row):
+        p = row[2] if kind == HIGH else row[3]
+        self.sw.append((kind, i, row[0], p))
+        self.sw_i.append(i)
+        if len(self.sw) < 2:
+            return
+        _, i0, _, pp = self.sw[-2]
+        close = row[4]
+        if close == pp:
+            return
+        up = close > pp
+        bos = up if kind == HIGH else not up
+        if bos:
+            self.bos.append(len(self.ev))
+        self.ev.append((len(self.sw) - 1, up, bos))
+        self.ev_i0.append(i0)
+
+    def _start(self):
+        return max(0, self.n - self.window) if self.window else 0
+
+    def _first(self, start):
+        # event แรกที่ swing ทั้งคู่อยู่ใน window; trim ของเก่าที่หลุด window
+        lo = bisect_left(self.ev_i0, start + self.left)
+        if self.TRIM < lo < len(self.ev):
+            cut = bisect_left(self.sw_i, start + self.left)
+            del self.sw[:cut]
+            del self.sw_i[:cut]
+            self.ev = [(k - cut, u, b) for k, u, b in self.ev[lo:]]
+            del self.ev_i0[:lo]
+            self.bos = [j - lo for j in self.bos if j >= lo]
+            lo = 0
+        return lo
+
+    def swings(self):
+        start = self._start()
+        lo = bisect_left(self.sw_i, start + self.left)
+        return [(KINDS[k], i - start, ts, p) for k, i, ts, p in self.sw[lo:]]
+
+    def last_signal(self):
+        start = self._start()
+        lo = self._first(start)
+        b = bisect_left(self.bos, lo)
+        if b == len(self.bos):
+            return None               # ยังไม่มี BOS ใน window -> ไม่มีสัญญาณ
+        fb = self.bos[b]
+        e = len(self.ev) - 1
+        while e > fb:
+            _, up, bos = self.ev[e]
+            if bos or up != self.ev[e - 1][1]:
+                break
+            e -= 1
+        k, up, bos = self.ev[e]
+        _, i, ts, p = self.sw[k]
+        return _signal(bos, up, p, ts, i - start)
+
+def pick_swing(ohlcv, direction, k=3, window=10):
+    # swing ของ H1 ที่ทำให้เกิดสัญญาณ -> (low, high, i_low, i_high)
+    n = len(ohlcv)
+    if n < 20:
+        return min(c[3] for c in ohlcv), max(c[2] for c in ohlcv), None, None
+    if direction == "up":
+        i_low = min(range(n - k - window, n - k), key=lambda i: ohlcv[i][3])
+        i_high = max(range(i_low, n - k), key=lambda i: ohlcv[i][2])
+    else:
+        i_high = max(range(n - k - window, n - k), key=lambda i: ohlcv[i][2])
+        i_low = min(range(i_high, n - k), key=lambda i: ohlcv[i][3])
+    return ohlcv[i_low][3], ohlcv[i_high][2], i_low, i_high
+
+def fibo_levels(direction, lo, hi):
+    # up: 0 = high, 100 = low (retrace ลง); down: กลับกัน
+    d = hi - lo
+    if direction == "up":
+        return {"0": hi, "33": hi - 0.33 * d, "61.8": hi - 0.618 * d, "78.6": hi - 0.786 * d, "80": hi - 0.80 * d, "100": lo}
+    return {"0": lo, "33": lo + 0.33 * d, "61.8": lo + 0.618 * d, "78.6": lo + 0.786 * d, "80": lo + 0.80 * d, "100": hi}
+
+def calc_poc(ohlcv, low_bound, high_bound, buckets=40):
+    # ราคากลางของ bucket ที่ volume (ตาม close) สูงสุดในช่วง [low_bound, high_bound]
+    if not len(ohlcv) or high_bound <= low_bound:
+        return None
+    lo, hi = float(low_bound), float(high_bound)
+    step = (hi - lo) / float(buckets)
+    if step <= 0:
+        return None
+    a = _cols(ohlcv)
+    px = np.minimum(hi, np.maximum(lo, a[:, 4]))
+    vol = np.nan_to_num(a[:, 5], nan=0.0) if a.shape[1] > 5 else np.zeros(len(a))
+    idx = np.clip(((px - lo) / step).astype(np.int64), 0, buckets - 1)
+    # bincount บวกตามลำดับแท่ง -> ผลรวม float เท่ากับบวกทีละแท่ง
+    vols = np.bincount(idx, weights=vol, minlength=buckets)
+    first = np.full(buckets, len(idx))
+    np.minimum.at(first, idx, np.arange(len(idx)))
+    seen = first < len(idx)
+    best = np.flatnonzero(seen & (vols == vols[seen].max()))
+    # เสมอกัน -> bucket ที่เจอก่อน (เหมือน max() บน dict)
+    b = best[np.argmin(first[best])]
+    return lo + (b + 0.5) * step
+
+def in_zone(price, fibo, a="33", b="78.6"):
+    lo, hi = min(fibo[a], fibo[b]), max(fibo[a], fibo[b])
+    return lo <= price <= hi
+
+def fibo2(side, h1_fibo0, m5_swing):
+    # หลัง TP1: 100 = Fibo0 ของ H1, 0 = swing M5 ในโซนก่อนเข้า, ext = เป้า TP2
+    if side == "short":
+        top, bot = h1_fibo0, m5_swing
+        d = top - bot
+        return {"100": top, "0": bot, "78.6": top - 0.786 * d, "ext133": bot - 1.33 * d, "ext161.8": bot - 1.618 * d}
+    bot, top = h1_fibo0, m5_swing
+    d = top - bot
+    return {"100": bot, "0": top, "78.6": bot + 0.786 * d, "ext133": top + 1.33 * d, "ext161.8": top + 1.618 * d}
+
+# ---------------- reference (pure-Python เดิม, เก็บไว้เทียบผล) ----------------
+def find_swings_reference(ohlcv, left=2, right=2):
+    out = []
+    highs = [c[2] for c in ohlcv]
+    lows = [c[3] for c in ohlcv]
+    for i in range(left, len(ohlcv) - right):
+        if highs[i] == max(highs[i - left:i + right + 1]):
+            out.append(("high", i, ohlcv[i][0], highs[i]))
+        if lows[i] == min(lows[i - left:i + right + 1]):
+            out.append(("low", i, ohlcv[i][0], lows[i]))
+    return out
+
+def detect_structure_reference(ohlcv, swings):
+    out = []
+    last_trend = None
+    for k in range(1, len(swings)):
+        _, _, _, pp = swings[k - 1]
+        stype, i, ts, p = swings[k]
+        close = ohlcv[i][4]
+        sig, trend = None, last_trend
+        if stype == "high" and close > pp:
+            sig, trend = "BOS", "up"
+        elif stype == "low" and close < pp:
+            sig, trend = "BOS", "down"
+        elif last_trend == "up" and close < pp:
+            sig, trend = "CHOCH", "down"
+        elif last_trend == "down" and close > pp:
+            sig, trend = "CHOCH", "up"
+        if sig:
+            out.append({"signal": sig, "trend": trend, "price": p, "ts": ts, "i": i})
+            last_trend = trend
+    return out
+
+def last_signal_reference(ohlcv, left=2, right=2):
+    st = detect_structure_reference(ohlcv, find_swings_reference(ohlcv, left, right))
+    return st[-1] if st else None
+
+def calc_poc_reference(ohlcv, low_bound, high_bound, buckets=40):
+    if not ohlcv or high_bound <= low_bound:
+        return None
+    lo, hi = float(low_bound), float(high_bound)
+    step = (hi - lo) / float(buckets)
+    if step <= 0:
+        return None
+    bins = {}
+    for c in ohlcv:
+        if len(c) < 5:
+            continue
+        px = min(hi, max(lo, c[4]))
+        vol = c[5] if len(c) > 5 and c[5] is not None else 0.0
+        idx = max(0, min(buckets - 1, int((px - lo) / step)))
+        center = lo + (idx + 0.5) * step
+        bins[center] = bins.get(center, 0.0) + vol
+    if not bins:
+        return None
+    return max(bins.items(), key=lambda kv: kv[1])[0]
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+# strategy.py
+# NW Envelope + MACD confirm + EMA trend: decision logic แบบ pure state machine
+# ไม่มี exchange call / sleep / telegram -> ใช้ร่วมกันระหว่าง live (main.py) และ backtest
+#
+# step() คืน list ของ action (dict):
+#   {"type": "open",    "side", "price", "sl", "tp", "note", "touch_ts"}
+#   {"type": "close",   "position", "reason", "price", "note"}   -> ต้องส่ง market reduceOnly
+#   {"type": "closed",  "position", "reason", "price", "note"}   -> exchange ปิดให้แล้ว (SL/TP fill)
+#   {"type": "move_sl", "sl"}
+
+import logging
+
+log = logging.getLogger("main")
+
+def macd_up(dp,dn,ep,en):   # ตัดขึ้น
+    return dp <= ep and dn > en
+
+def macd_down(dp,dn,ep,en): # ตัดลง
+    return dp >= ep and dn < en
+
+class NWStrategy:
+    def __init__(self, tp_buffer=300, sl_distance=2000, breakeven_offset=250,
+                 use_breakeven=True, use_breakeven_macd=False, ema_enabled=False,
+                 macd_enabled=False, client_stops=True, freeze_sec=900):
+        self.tp_buffer = tp_buffer
+        self.sl_distance = sl_distance
+        self.breakeven_offset = breakeven_offset
+        self.use_breakeven = use_breakeven
+        self.use_breakeven_macd = use_breakeven_macd
+        self.ema_enabled = ema_enabled
+        self.macd_enabled = macd_enabled
+        self.client_stops = client_stops    # False = SL/TP อยู่บน exchange (on_stop_fill)
+        self.freeze_sec = freeze_sec
+
+        self.position = None     # {"side","qty","entry","sl","tp"}
+        self.sl_lock = False
+        self.pending = None      # {"side","touch_price","lower","upper","mid","ts"}
+        self.upper = self.lower = self.mid = None
+        self.last_nw_update = 0
+
+    # ---------------- checkpoint ----------------
+    STATE_KEYS = ("position", "sl_lock", "pending", "upper", "lower", "mid", "last_nw_update")
+
+    def snapshot(self):
+        out = {k: getattr(self, k) for k in self.STATE_KEYS}
+        for k in ("position", "pending"):
+            if out[k] is not None:
+                out[k] = dict(out[k])
+        return out
+
+    def restore(self, state):
+        for k in self.STATE_KEYS:
+            if k in state:
+                setattr(self, k, state[k])
+
+    # ---------------- NW band (freeze) ----------------
+    def band_due(self, now):
+        # รอบ freeze align กับ epoch (เหมือนขอบแท่ง) -> ไม่ drift ตามเวลาที่ loop ตื่น
+        if self.upper is None or self.freeze_sec <= 0:
+            return True
+        return now // self.freeze_sec != self.last_nw_update // self.freeze_sec
+
+    def set_band(self, upper, lower, mid, now):
+        self.upper, self.lower, self.mid = upper, lower, mid
+        self.last_nw_update = now
+
+    def levels(self):
+        # ราคาที่ step() ตัดสินใจเมื่อข้าม -> scheduler poll ถี่ขึ้นเมื่อราคาเข้าใกล้
+        pos = self.position
+        if pos is not None:
+            return [pos["sl"], pos.get("tp"), self.mid]
+        if self.sl_lock or self.pending is not None:
+            return []
+        return [self.lower, self.upper]
+
+    # ---------------- helpers ----------------
+    def _be_level(self, side, entry):
+        return entry + self.breakeven_offset if side == "long" else entry - self.breakeven_offset
+
+    def _close(self, reason, price, note=None, lock=False, type="close"):
+        pos = self.position
+        self.position = None
+        if lock:
+            self.sl_lock = True
+        return {"type": type, "position": pos, "reason": reason, "price": price, "note": note}
+
+    def _open(self, side, price, upper, lower, note, touch_ts=None):
+        if side == "long":
+            tp, sl = upper - self.tp_buffer, price - self.sl_distance
+        else:
+            tp, sl = lower + self.tp_buffer, price + self.sl_distance
+        self.position = {"side": side, "qty": 0.0, "entry": price, "sl": sl, "tp": tp}
+        return {"type": "open", "side": side, "price": price, "sl": sl, "tp": tp, "note": note, "touch_ts": touch_ts}
+
+    def stop_reason(self, kind, sl=None):
+        pos = self.position
+        if kind == "TP":
+            return "TP_upper" if pos["side"] == "long" else "TP_lower"
+        sl = pos["sl"] if sl is None else sl
+        return "BE" if abs(sl - self._be_level(pos["side"], pos["entry"])) < 1e-6 else "SL"
+
+    def on_stop_fill(self, kind, price):
+        # SL/TP บน exchange ถูก fill ("SL" / "TP")
+        if self.position is None:
+            return None
+        reason = self.stop_reason(kind)
+        return self._close(reason, price, lock=not reason.startswith("TP"), type="closed")
+
+    def macd_side_ok(self, trend, macd_entry):
+        if not self.macd_enabled or not macd_entry:
+            return None
+        if self.ema_enabled:
+            return macd_up(*macd_entry) if trend == "BUY" else macd_down(*macd_entry)
+        # without EMA: pending จะเช็คทิศ MACD เทียบกับฝั่งของ pending อีกที
+        return True
+
+    # ---------------- decision ----------------
+    def step(self, now, last_close, amt, price, trend=None, macd_entry=None, macd_be=None):
+        """price: float หรือ callable (ดึงราคาเมื่อจำเป็นเท่านั้น)"""
+        _px = []
+        def last_price():
+            if not _px:
+                _px.append(price() if callable(price) else price)
+            return _px[0]
+
+        if amt == 0 and self.position is not None:
+            log.info("⚠ Position disappeared on exchange, reset local state.")
+            self.position = None
+
+        pos = self.position
+        mid, upper, lower = self.mid, self.upper, self.lower
+
+        # ---------------- MANAGE OPEN POSITION ----------------
+        if pos and amt > 0:
+            side, entry, sl, tp = pos["side"], pos["entry"], pos["sl"], pos.get("tp")
+            be = self._be_level(side, entry)
+            out = []
+
+            # --- Breakeven via MACD experimental ---
+            if self.use_breakeven_macd and macd_be:
+                if side == "long" and macd_down(*macd_be):
+                    if last_close - entry > 0:
+                        if pos["sl"] < be:
+                            pos["sl"] = be
+                            log.info(f"🔁 LONG Move SL to BE {pos['sl']:.2f} (MACD BE)")
+                    else:
+                        return [self._close("SL", last_price(), "MACD close", lock=True)]
+                if side == "short" and macd_up(*macd_be):
+                    if entry - last_close > 0:
+                        if pos["sl"] > be:
+                            pos["sl"] = be
+                            log.info(f"🔁 SHORT Move SL to BE {pos['sl']:.2f} (MACD BE)")
+                    else:
+                        return [self._close("SL", last_price(), "MACD close", lock=True)]
+
+            # --- SL / TP touch (client-side เท่านั้น) ---
+            if self.client_stops:
+                px = last_price()
+                if (side == "long" and px <= sl) or (side == "short" and px >= sl):
+                    return [self._close(self.stop_reason("SL", sl), px, lock=True)]
+                if tp is not None and ((side == "long" and px >= tp) or (side == "short" and px <= tp)):
+                    return [self._close(self.stop_reason("TP"), px)]
+
+            # --- EMA flip -> mid เป็น TP ---
+            if self.ema_enabled and trend is not None:
+                if side == "long" and trend == "SELL" and last_price() <= mid:
+                    return [self._close("TP_mid_trend_flip", last_price())]
+                if side == "short" and trend == "BUY" and last_price() >= mid:
+                    return [self._close("TP_mid_trend_flip", last_price())]
+
+            # --- Breakeven via mid ---
+            if not self.use_breakeven_macd and self.use_breakeven and not self.sl_lock:
+                if side == "long" and last_close > mid and pos["sl"] < be:
+                    pos["sl"] = be
+                    log.info(f"🔁 LONG Move SL to BE {pos['sl']:.2f}")
+                if side == "short" and last_close < mid and pos["sl"] > be:
+                    pos["sl"] = be
+                    log.info(f"🔁 SHORT Move SL to BE {pos['sl']:.2f}")
+
+            if pos["sl"] != sl:
+                out.append({"type": "move_sl", "sl": pos["sl"]})
+            return out
+
+        # ---------------- NO POSITION ----------------
+        if self.sl_lock:
+            # ปลดล็อกเมื่อราคาข้าม mid
+            if (last_close > mid) or (last_close < mid):
+                self.sl_lock = False
+                log.info("🔓 SL Lock released")
+            return []
+
+        # 1) pending from touch -> wait MACD confirm
+        if self.macd_enabled and self.pending is not None:
+            p = self.pending
+            side = p["side"]
+            if self.macd_side_ok(trend, macd_entry):
+                if not self.ema_enabled and macd_entry:
+                    if (side == "long" and not macd_up(*macd_entry)) or (side == "short" and not macd_down(*macd_entry)):
+                        log.info("❌ Pending MACD sign mismatch -> cancel pending")
+                        self.pending = None
+                        return []
+                px = last_price()
+                self.pending = None
+                if side == "long":
+                    if px < p["lower"] or px > p["mid"]:
+                        log.info("❌ MACD up but price out of [lower,mid] → cancel pending")
+                        return []
+                else:
+                    if px > p["upper"] or px < p["mid"]:
+                        log.info("❌ MACD down but price out of [mid,upper] → cancel pending")
+                        return []
+                return [self._open(side, px, p["upper"], p["lower"], "pending MACD confirm", p["ts"])]
+            return []
+
+        # 2) no pending -> detect new NW touch
+        for side, want, touched in (("long", "BUY", last_close <= lower), ("short", "SELL", last_close >= upper)):
+            if (not self.ema_enabled or trend == want) and touched:
+                px = last_price()
+                if self.macd_enabled:
+                    self.pending = {"side": side, "touch_price": px, "lower": lower,
+                                    "upper": upper, "mid": mid, "ts": now}
+                    log.info(f"🟡 {side.upper()} touch, waiting MACD {'up' if side == 'long' else 'down'} (pending created)")
+                    return []
+                return [self._open(side, px, upper, lower, "no MACD", now)]
+        return []
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+# sweep.py
+# Parameter sweep / optimizer บน history (ใช้ backtest.run)
+# - grid / random / refine (สุ่มรอบๆ ชุดที่ดีที่สุด แบบ Bayesian-ish)
+# - ProcessPool ทุก core; candle arrays แชร์ผ่าน shared memory (zero-copy, ไม่ pickle)
+# - cache indicator ต่อ subset ของ param: NW ต่อ (bandwidth, mult, factor), EMA/MACD ครั้งเดียว
+#   -> เปลี่ยนแค่ TP_BUFFER / SL_DISTANCE ไม่ต้องคำนวณ envelope ใหม่
+# - ตาราง: ผลเฉลี่ยทุก segment ของแต่ละชุด (in-sample ทั้งหมด เพราะเลือกจากข้อมูลชุดเดียวกัน)
+# - walk-forward: เลือกชุดที่ดีที่สุดบน segment i (IS) แล้ววัดบน segment i+1 (OOS) -> ตัวเลข OOS จริงมีแค่ส่วนนี้
+#
+# usage:
+#   python sweep.py MAIN.npy SMALL.npy --grid nw_bandwidth=6,8,10 tp_buffer=200,300,400
+#   python sweep.py MAIN.npy SMALL.npy --random 64 --range nw_mult=2:5 sl_distance=1000:3000 --refine 32
+
+import sys, os, time, random, argparse, logging
+from multiprocessing import Pool, shared_memory
+import numpy as np
+
+import backtest
+
+PARAMS = ["nw_bandwidth", "nw_mult", "nw_factor", "update_fraction",
+          "tp_buffer", "sl_distance", "breakeven_offset"]
+NW_KEYS = ("nw_bandwidth", "nw_mult", "nw_factor")
+INT_PARAMS = {"tp_buffer", "sl_distance", "breakeven_offset"}
+
+# ============================================================
+# Shared memory
+# ============================================================
+def share(arr):
+    arr = np.ascontiguousarray(arr, dtype=np.float64)
+    shm = shared_memory.SharedMemory(create=True, size=arr.nbytes)
+    np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[:] = arr
+    return shm, (shm.name, arr.shape)
+
+_w = {}   # worker globals
+
+def _attach(spec):
+    name, shape = spec
+    shm = shared_memory.SharedMemory(name=name)
+    _w.setdefault("shm", []).append(shm)      # เก็บ ref ไว้ไม่ให้ถูก GC
+    return np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+
+def _init(main_spec, small_spec, folds, base):
+    logging.getLogger("main").setLevel(logging.WARNING)
+    _w["main"] = _attach(main_spec)
+    _w["small"] = _attach(small_spec)
+    _w["folds"] = folds
+    _w["base"] = base
+    _w["nw"] = {}
+    _w["ind"] = None
+
+def _indicators(p):
+    if _w["ind"] is None:
+        m, s = _w["main"], _w["small"]
+        ind = {}
+        if p["ema_enabled"]:
+            ind["ema"] = (backtest.ema_closed(m[:, 4].tolist(), p["ema_fast"]),
+                          backtest.ema_closed(m[:, 4].tolist(), p["ema_slow"]))
+        if p["macd_enabled"] or p["use_breakeven_macd"]:
+            ind["macd"] = backtest.macd_closed(s[:, 4].tolist())
+        _w["ind"] = ind
+    return _w["ind"]
+
+def _nw_parts(p):
+    key = tuple(p[k] for k in NW_KEYS)
+    parts = _w["nw"].get(key)
+    if parts is None:
+        parts = _w["nw"][key] = backtest.nw_forming_parts(_w["main"][:, 4], *key)
+    return parts
+
+def _evaluate(overrides):
+    p = dict(_w["base"]); p.update(overrides)
+    nw_parts = _nw_parts(p)
+    ind = _indicators(p)
+    out = []
+    for a, b in _w["folds"]:
+        sl = {"ema": ind["ema"]} if "ema" in ind else {}
+        if "macd" in ind:
+            sl["macd"] = ind["macd"][a:b]
+        res = backtest.run(_w["main"], _w["small"][a:b], p, nw_parts, sl)
+        out.append(res["summary"])
+    return overrides, out
+
+# ============================================================
+# Param generation
+# ============================================================
+def grid(spec):
+    combos = [{}]
+    for k, vals in spec.items():
+        combos = [dict(c, **{k: v}) for c in combos for v in vals]
+    return combos
+
+def _draw(k, lo, hi, rnd):
+    v = rnd.uniform(lo, hi)
+    return int(round(v)) if k in INT_PARAMS else round(v, 3)
+
+def random_samples(ranges, n, rnd):
+    return [{k: _draw(k, lo, hi, rnd) for k, (lo, hi) in ranges.items()} for _ in range(n)]
+
+def refine(top, ranges, n, rnd, scale=0.15):
+    # สุ่มรอบๆ ชุดที่ดี (Gaussian รอบค่าเดิม, กว้าง scale ของช่วง)
+    out = []
+    for i in range(n):
+        base = top[i % len(top)]
+        c = {}
+        for k, (lo, hi) in ranges.items():
+            v = min(hi, max(lo, rnd.gauss(base[k], (hi - lo) * scale)))
+            c[k] = int(round(v)) if k in INT_PARAMS else round(v, 3)
+        out.append(c)
+    return out
+
+def walk_forward_folds(n_small, n_folds):
+    # แบ่งเป็น n_folds+1 segment: fold i -> (IS = seg i, OOS = seg i+1)
+    edges = np.linspace(0, n_small, n_folds + 2).astype(int)
+    segs = list(zip(edges[:-1], edges[1:]))
+    return [(int(a), int(b)) for a, b in segs]
+
+# ============================================================
+# Runner
+# ============================================================
+def score(segs):
+    # segs[i] = summary ของ segment i -> ค่าเฉลี่ย / แย่สุดทุก segment (ใช้จัดอันดับ = in-sample)
+    return {
+        "mean_return": float(np.mean([s["return"] for s in segs])),
+        "worst_return": float(min(s["return"] for s in segs)),
+        "win_rate": float(np.mean([s["win_rate"] for s in segs])),
+        "max_dd": float(max(s["max_drawdown"] for s in segs)),
+        "trades": int(sum(s["trades"] for s in segs)),
+    }
+
+def sweep(main_ohlcv, small_ohlcv, candidates, n_folds=3, processes=None, base=None):
+    base_p = backtest.default_params()
+    base_p.update(base or {})
+    segs = walk_forward_folds(len(small_ohlcv), n_folds)
+    # group ตาม NW subset -> worker เดียวกันได้ใช้ cache เดิม
+    candidates = sorted(candidates, key=lambda c: tuple(c.get(k, base_p[k]) for k in NW_KEYS))
+    shm_m, spec_m = share(main_ohlcv)
+    shm_s, spec_s = share(small_ohlcv)
+    try:
+        procs = processes or os.cpu_count()
+        chunk = max(1, len(candidates) // (procs * 4))
+        with Pool(procs, initializer=_init, initargs=(spec_m, spec_s, segs, base_p)) as pool:
+            results = pool.map(_evaluate, candidates, chunksize=chunk)
+    finally:
+        for shm in (shm_m, shm_s):
+            shm.close(); shm.unlink()
+    rows = []
+    for ov, seg_summaries in results:
+        rows.append({**{k: base_p[k] for k in PARAMS}, **ov, **score(seg_summaries), "_segs": seg_summaries})
+    rows.sort(key=lambda r: r["mean_return"], reverse=True)
+    return rows
+
+def walk_forward(rows, n_folds):
+    # เลือกชุดที่ดีที่สุดบน IS ของแต่ละ fold แล้วดู OOS ของ segment ถัดไป
+    wf = []
+    for i in range(n_folds):
+        best = max(rows, key=lambda r: r["_segs"][i]["return"])
+        wf.append({"fold": i, "params": {k: best[k] for k in best if k in PARAMS},
+                   "is_return": best["_segs"][i]["return"], "oos_return": best["_segs"][i + 1]["return"]})
+    return wf
+
+def print_table(rows, wf, keys, top=20):
+    cols = keys + ["mean_return", "worst_return", "win_rate", "max_dd", "trades"]
+    print("in-sample ranking (all segments):")
+    print(" | ".join(f"{c:>14}" for c in cols))
+    for r in rows[:top]:
+        print(" | ".join(f"{r[c]:>14.4f}" if isinstance(r[c], float) else f"{r[c]:>14}" for c in cols))
+    print("\nwalk-forward selection (out-of-sample):")
+    for f in wf:
+        print(f"  fold {f['fold']}: IS {f['is_return']:+.2%} -> OOS {f['oos_return']:+.2%}  {f['params']}")
+    if wf:
+        print(f"  mean OOS {np.mean([f['oos_return'] for f in wf]):+.2%}")
+
+def _parse_kv(items, conv):
+    out = {}
+    for it in items or []:
+        k, v = it.split("=", 1)
+        out[k] = conv(k, v)
+    return out
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="NW parameter sweep (walk-forward)")
+    ap.add_argument("main_ohlcv")
+    ap.add_argument("small_ohlcv")
+    ap.add_argument("--grid", nargs="*", help="param=v1,v2,...")
+    ap.add_argument("--random", type=int, default=0, help="จำนวนชุดสุ่มจาก --range")
+    ap.add_argument("--range", nargs="*", help="param=lo:hi")
+    ap.add_argument("--refine", type=int, default=0, help="จำนวนชุดสุ่มรอบ top-5 หลังรอบแรก")
+    ap.add_argument("--folds", type=int, default=3)
+    ap.add_argument("--procs", type=int, default=None)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--top", type=int, default=20)
+    a = ap.parse_args(argv)
+
+    num = lambda k, v: int(v) if k in INT_PARAMS else float(v)
+    grid_spec = _parse_kv(a.grid, lambda k, v: [num(k, x) for x in v.split(",")])
+    ranges = _parse_kv(a.range, lambda k, v: tuple(float(x) for x in v.split(":")))
+    for k in list(grid_spec) + list(ranges):
+        if k not in PARAMS:
+            ap.error(f"unknown param {k} (choose from {PARAMS})")
+    rnd = random.Random(a.seed)
+    cands = grid(grid_spec) if grid_spec else []
+    if a.random:
+        cands += random_samples(ranges, a.random, rnd)
+    if not cands:
+        ap.error("ต้องระบุ --grid หรือ --random/--range")
+    m, s = backtest.load_ohlcv(a.main_ohlcv), backtest.load_ohlcv(a.small_ohlcv)
+
+    t0 = time.time()
+    rows = sweep(m, s, cands, a.folds, a.procs)
+    if a.refine and ranges:
+        base_p = backtest.default_params()
+        top = [{k: r.get(k, base_p[k]) for k in ranges} for r in rows[:5]]
+        more = sweep(m, s, refine(top, ranges, a.refine, rnd), a.folds, a.procs)
+        rows = sorted(rows + more, key=lambda r: r["mean_return"], reverse=True)
+    wf = walk_forward(rows, a.folds)
+    keys = sorted({k for c in cands for k in c}, key=PARAMS.index)
+    print_table(rows, wf, keys, a.top)
+    print(f"\n{len(rows)} candidates x {a.folds + 1} segments in {time.time() - t0:.1f}s")
+
+if __name__ == "__main__":
+    main()
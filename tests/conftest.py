@@ -0,0 +1,5 @@
+# -*- coding: utf-8 -*-
+# tests: module ของ repo อยู่ระดับบนสุด (flat) -> เพิ่ม root ลง sys.path
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+# Engine + main.execute + OrderManager บน FakeExchange: action ของ plugin จนถึง order / trade บน exchange
+import pytest
+
+import main
+from candles import CandleStore
+from fake_exchange import FakeExchange
+from feed import RestFeed
+from journal import Journal
+from plugins import EMATrendPlugin, NWPlugin, SMCFiboPlugin
+
+SYM = "BTC/USDT:USDT"
+
+@pytest.fixture
+def ex():
+    ex = FakeExchange(balance=100000, leverage=10)
+    ex.set_price(SYM, 30000)
+    return ex
+
+@pytest.fixture
+def journal(tmp_path):
+    j = Journal(str(tmp_path / "journal.db"))
+    yield j
+    j.close()
+
+def make_bot(ex, journal, plugins):
+    bot = main.SymbolBot(ex, SYM, CandleStore(ex), RestFeed(ex, None, SYM), journal,
+                         plugins=plugins, size=lambda px: 0.1)
+    bot.om.sleep = lambda s: None
+    bot.ctx.begin()
+    return bot
+
+def stops(ex):
+    return {o["type"]: (o["stopPrice"], o["amount"]) for o in ex.fetch_open_orders(SYM)}
+
+def failing(ex, types=("STOP_MARKET",)):
+    # create_order ของ type ใน types ล้มจนกว่าจะ fail[0] = False
+    orig, fail = ex.create_order, [True]
+    def create_order(symbol, type, side, amount, price=None, params=None):
+        if fail[0] and type in types:
+            raise ConnectionError("binance POST timed out")
+        return orig(symbol, type, side, amount, price, params)
+    ex.create_order = create_order
+    return fail
+
+def nw_long(ex, journal):
+    p = NWPlugin(client_stops=False, sl_distance=2000, breakeven_offset=250, tp_buffer=300)
+    bot = make_bot(ex, journal, [p])
+    p.strat.set_band(32000, 29000, 30500, 0)
+    bot.execute(p, p.strat._open("long", 30000, 32000, 29000, "test"))
+    assert stops(ex)["STOP_MARKET"] == (28000, 0.1)
+    return bot, p
+
+def breakeven(bot, p, close=30600):
+    # แท่งปิดเหนือ mid -> strategy ขอย้าย SL ไป BE
+    bot.ex.set_price(SYM, close)
+    acts = p.strat.step(1, close, 0.1, close)
+    for a in acts:
+        bot.execute(p, a)
+    return acts
+
+def test_breakeven_move_failure_keeps_position_in_sync(ex, journal):
+    bot, p = nw_long(ex, journal)
+    fail = failing(ex)
+    assert [(a["type"], a["sl"]) for a in breakeven(bot, p)] == [("move_sl", 30250)]
+    assert stops(ex)["STOP_MARKET"] == (28000, 0.1)
+    assert p.position["sl"] == 28000 and bot.om.sl == 28000
+    # exchange กลับมา -> strategy ขอย้ายใหม่รอบถัดไป
+    fail[0] = False
+    assert [a["type"] for a in breakeven(bot, p)] == ["move_sl"]
+    assert stops(ex)["STOP_MARKET"] == (30250, 0.1)
+    assert p.position["sl"] == 30250
+
+def test_stop_fill_after_failed_move_is_labelled_sl(ex, journal):
+    bot, p = nw_long(ex, journal)
+    failing(ex)
+    breakeven(bot, p)
+    ex.set_price(SYM, 27900)                  # SL เดิม (28000) ถูก fill ไม่ใช่ BE
+    bot.ctx.begin()
+    fill = bot.om.reconcile()
+    acts = p.on_fill(bot.ctx, fill)
+    assert acts[0]["reason"] == "SL"
+
+def test_restore_adopts_unknown_position_with_smc_first(ex, journal):
+    ex.create_order(SYM, "market", "sell", 0.2)          # position ที่ไม่มี state (เปิดมือ / state หาย)
+    smc_p, nw_p = SMCFiboPlugin(adopt_sl=1500), NWPlugin()
+    bot = make_bot(ex, journal, [smc_p, nw_p])
+    bot.restore()
+    pos = smc_p.position
+    assert (pos["side"], pos["qty"], pos["sl"], pos["tp"]) == ("short", 0.2, 31500, None)
+    assert smc_p.phase == "IN_POSITION" and nw_p.position is None
+    bot.ctx.begin()
+    assert smc_p.on_tick(bot.ctx) == []
+    ex.set_price(SYM, 31600)
+    bot.ctx.begin()
+    acts = smc_p.on_tick(bot.ctx)
+    assert [(a["type"], a["reason"]) for a in acts] == [("close", "SL")]
+
+def test_ema_step_retried_after_failed_move(ex, journal, monkeypatch):
+    sent = []
+    monkeypatch.setattr(main, "tg", sent.append)
+    p = EMATrendPlugin()
+    bot = make_bot(ex, journal, [p])
+    ex.create_order(SYM, "market", "buy", 0.1)
+    p.position = {"side": "long", "qty": 0.1, "entry": 30000, "sl": 28766, "tp": None, "step": 0}
+    bot.om.protect("long", 0.1, 28766)
+    bot._arm()
+    fail = failing(ex)
+    ex.set_price(SYM, 30800)                  # ผ่านขั้น 1 (+700 -> SL entry - 250)
+    bot.ctx.begin()
+    bot._fire(bot.ctx)
+    assert (p.position["step"], p.position["sl"]) == (0, 28766)
+    assert stops(ex)["STOP_MARKET"] == (28766, 0.1)
+    assert not any("Step1" in m for m in sent)
+    bot._arm()
+    fail[0] = False
+    bot.ctx.begin()
+    bot._fire(bot.ctx)                        # trigger ขั้น 1 ถูกลงทะเบียนใหม่ -> ยิงอีกครั้ง
+    assert (p.position["step"], p.position["sl"]) == (1, 29750)
+    assert stops(ex)["STOP_MARKET"] == (29750, 0.1)
+    assert any("Step1" in m for m in sent)
+
+def test_partial_close_resizes_exchange_orders(ex, journal, monkeypatch):
+    monkeypatch.setattr(main, "EXEC_ALGO", "twap")
+    monkeypatch.setattr(main, "EXEC_INTERVAL_SEC", 0)
+    bot, p = nw_long(ex, journal)
+    orig, n = ex.create_order, [0]
+    def create_order(symbol, type, side, amount, price=None, params=None):
+        n[0] += 1
+        if n[0] == 3:                         # slice ที่ 3 ของการปิดล้ม -> ปิดได้ครึ่งเดียว
+            raise ConnectionError("binance POST timed out")
+        return orig(symbol, type, side, amount, price, params)
+    ex.create_order = create_order
+    bot.execute(p, {"type": "close", "position": p.position, "price": 30000, "reason": "TP"})
+    assert ex.positions[SYM]["contracts"] == pytest.approx(0.05)
+    assert p.position["qty"] == pytest.approx(0.05)
+    assert {o["type"]: o["amount"] for o in ex.fetch_open_orders(SYM)} == \
+        {"STOP_MARKET": pytest.approx(0.05), "TAKE_PROFIT_MARKET": pytest.approx(0.05)}
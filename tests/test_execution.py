@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+# Executor (execution.py) บน FakeExchange: twap / iceberg / post / auto + child ที่ถูก reject กลางทาง
+import pytest
+
+from execution import Executor
+from fake_exchange import FakeExchange
+
+SYM = "BTC/USDT:USDT"
+
+@pytest.fixture
+def ex():
+    ex = FakeExchange(balance=100000, leverage=10)
+    ex.set_price(SYM, 30000)
+    return ex
+
+def thin_book(ex):
+    # depth ใน 10bps จาก mid (30000.5) ฝั่ง ask = 0.4 -> clip = 0.25 × 0.4 = 0.1
+    ex.set_book(SYM, [[30000, 1.0], [29999, 1.0]], [[30001, 0.2], [30002, 0.2], [30100, 5.0]])
+
+class Clock:
+    def __init__(self, on_sleep=None):
+        self.t, self.on_sleep = 0.0, on_sleep
+
+    def __call__(self):
+        return self.t
+
+    def sleep(self, s):
+        self.t += s
+        if self.on_sleep:
+            self.on_sleep(self.t)
+
+def executor(ex, algo, clock=None, **kw):
+    clock = clock or Clock()
+    return Executor(ex, algo, sleep=clock.sleep, clock=clock, **kw)
+
+def children(e):
+    return sorted(e.children.values(), key=lambda o: int(o["id"]))
+
+def test_twap_slices_within_depth_then_market(ex):
+    thin_book(ex)
+    e = executor(ex, "twap", slices=4, max_bps=10, participation=0.25).run(SYM, "buy", 1.0, ref=30000.5)
+    kids = children(e)
+    assert e.filled == pytest.approx(1.0)
+    assert len(kids) == 4
+    assert [o["timeInForce"] for o in kids[:3]] == ["IOC"] * 3
+    # book ถูกกินไปทีละ slice -> clip เล็กลงตาม depth ที่เหลือ
+    assert [o["amount"] for o in kids[:3]] == [0.1, 0.075, 0.056]
+    assert kids[-1]["type"] == "market" and kids[-1]["amount"] == pytest.approx(0.769)
+    assert ex.positions[SYM]["contracts"] == pytest.approx(1.0)
+    r = e.report()
+    assert r["shortfall"] > 0 and r["error"] is None
+
+def test_twap_without_book_sends_market_slices(ex):
+    e = executor(ex, "twap", slices=3).run(SYM, "sell", 0.3)
+    assert e.filled == pytest.approx(0.3)
+    assert [o["type"] for o in children(e)] == ["market"] * 3
+    assert e.avg == pytest.approx(30000)
+
+def test_iceberg_shows_one_clip_at_a_time(ex):
+    thin_book(ex)
+    # trade ใต้ best bid ทุกรอบ poll -> clip ที่วางอยู่ fill (maker)
+    clock = Clock(lambda t: ex.on_trade(SYM, 29999.5, 10))
+    e = executor(ex, "iceberg", clock, max_bps=10, participation=0.25).run(SYM, "buy", 0.3)
+    kids = children(e)
+    assert e.filled == pytest.approx(0.3)
+    assert len(kids) == 3
+    assert all(o["timeInForce"] == "GTX" and o["price"] == 30000 and o["amount"] == 0.1 for o in kids)
+    assert e.report()["passive"] == 3
+    assert e.fees == pytest.approx(0.3 * 30000 * ex.maker_fee)
+
+def test_post_reprices_when_best_moves_away(ex):
+    thin_book(ex)
+    def move(t):
+        if t == 1.0:
+            ex.set_book(SYM, [[30005, 1.0]], [[30006, 1.0]])
+        elif t == 2.0:
+            ex.on_trade(SYM, 30004, 10)
+    e = executor(ex, "post", Clock(move), poll=1.0).run(SYM, "buy", 0.5)
+    first, second = children(e)
+    assert first["status"] == "canceled" and first["price"] == 30000
+    assert second["status"] == "closed" and second["price"] == 30005
+    assert e.filled == pytest.approx(0.5)
+
+def test_post_timeout_cancels_and_markets_rest(ex):
+    thin_book(ex)
+    e = executor(ex, "post", timeout=5, poll=1.0).run(SYM, "buy", 0.3)
+    first, last = children(e)[0], children(e)[-1]
+    assert first["status"] == "canceled" and first["filled"] == 0
+    assert last["type"] == "market" and last["status"] == "closed"
+    assert e.filled == pytest.approx(0.3)
+
+def test_auto_picks_market_inside_clip_and_twap_above(ex):
+    thin_book(ex)
+    small = executor(ex, "auto", max_bps=10, participation=0.25).run(SYM, "buy", 0.05)
+    assert small.algo == "market"
+    thin_book(ex)
+    big = executor(ex, "auto", max_bps=10, participation=0.25).run(SYM, "buy", 0.5)
+    assert big.algo == "twap"
+
+def test_rejected_child_returns_partial_execution(ex):
+    ex.create_order(SYM, "market", "buy", 0.4)
+    orig, n = ex.create_order, [0]
+    def create_order(symbol, type, side, amount, price=None, params=None):
+        n[0] += 1
+        if n[0] == 3:
+            raise ConnectionError("binance POST timed out")
+        return orig(symbol, type, side, amount, price, params)
+    ex.create_order = create_order
+    e = executor(ex, "twap", slices=4).run(SYM, "sell", 0.4, reduce=True)
+    assert e.filled == pytest.approx(0.2)
+    assert e.remaining() == pytest.approx(0.2)
+    assert "ConnectionError" in e.error
+    assert ex.positions[SYM]["contracts"] == pytest.approx(0.2)
+
+def test_reduce_only_never_flips_position(ex):
+    ex.create_order(SYM, "market", "buy", 0.2)
+    e = executor(ex, "market").run(SYM, "sell", 0.5, reduce=True)
+    assert e.filled == pytest.approx(0.2)
+    assert SYM not in ex.positions
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+# FakeExchange (fake_exchange.py): reduceOnly, margin, stop trigger / reject, fill จาก book
+import pytest
+
+from fake_exchange import FakeExchange, InsufficientFunds, OrderImmediatelyFillable
+
+SYM = "BTC/USDT:USDT"
+
+@pytest.fixture
+def ex():
+    ex = FakeExchange(balance=1000, leverage=10, taker_fee=0, maker_fee=0)
+    ex.set_price(SYM, 30000)
+    return ex
+
+def test_reduce_only_without_position_expires(ex):
+    o = ex.create_order(SYM, "market", "sell", 0.1, None, {"reduceOnly": True})
+    assert o["status"] == "expired" and o["filled"] == 0
+    assert ex.positions == {}
+
+def test_reduce_only_capped_at_position(ex):
+    ex.create_order(SYM, "market", "buy", 0.1)
+    o = ex.create_order(SYM, "market", "sell", 0.3, None, {"reduceOnly": True})
+    assert o["filled"] == pytest.approx(0.1) and o["status"] == "closed"
+    assert ex.positions == {}
+
+def test_reduce_only_same_side_does_nothing(ex):
+    ex.create_order(SYM, "market", "buy", 0.1)
+    o = ex.create_order(SYM, "market", "buy", 0.1, None, {"reduceOnly": True})
+    assert o["filled"] == 0
+    assert ex.positions[SYM]["contracts"] == pytest.approx(0.1)
+
+def test_margin_limits_new_exposure(ex):
+    # 1000 USDT × 10x = 10000 notional -> 0.333 BTC
+    ex.create_order(SYM, "market", "buy", 0.3)
+    assert ex.fetch_balance()["USDT"]["used"] == pytest.approx(900)
+    with pytest.raises(InsufficientFunds):
+        ex.create_order(SYM, "market", "buy", 0.1)
+    assert ex.rejects["margin"] == 1
+
+def test_closing_side_needs_margin_only_for_flip(ex):
+    ex.create_order(SYM, "market", "buy", 0.3)
+    ex.create_order(SYM, "market", "sell", 0.3)              # ปิดเฉยๆ ไม่ต้องใช้ margin
+    assert ex.positions == {}
+    ex.create_order(SYM, "market", "buy", 0.3)
+    ex.create_order(SYM, "market", "sell", 0.6)              # flip: ส่วนเพิ่ม 0.3 ผ่าน
+    assert ex.positions[SYM] == {"side": "short", "contracts": pytest.approx(0.3), "entryPrice": 30000}
+    with pytest.raises(InsufficientFunds):
+        ex.create_order(SYM, "market", "buy", 0.7)           # flip: ส่วนเพิ่ม 0.4 เกิน
+
+def test_realized_pnl_and_fees():
+    ex = FakeExchange(balance=1000, leverage=10, taker_fee=0.001)
+    ex.set_price(SYM, 30000)
+    ex.create_order(SYM, "market", "buy", 0.1)
+    ex.set_price(SYM, 31000)
+    ex.create_order(SYM, "market", "sell", 0.1, None, {"reduceOnly": True})
+    assert ex.balance_usdt == pytest.approx(1000 + 100 - 3 - 3.1)
+
+def test_stop_market_triggers_on_cross(ex):
+    ex.create_order(SYM, "market", "buy", 0.1)
+    sl = ex.create_order(SYM, "STOP_MARKET", "sell", 0.1, None, {"stopPrice": 29500, "reduceOnly": True})
+    ex.set_price(SYM, 29600)
+    assert ex.fetch_order(sl["id"])["status"] == "open"
+    ex.set_price(SYM, 29400)
+    o = ex.fetch_order(sl["id"])
+    assert o["status"] == "closed" and o["average"] == 29400
+    assert ex.positions == {}
+
+def test_stop_already_crossed_is_rejected(ex):
+    ex.create_order(SYM, "market", "buy", 0.1)
+    with pytest.raises(OrderImmediatelyFillable):
+        ex.create_order(SYM, "STOP_MARKET", "sell", 0.1, None, {"stopPrice": 30100, "reduceOnly": True})
+    with pytest.raises(OrderImmediatelyFillable):
+        ex.create_order(SYM, "TAKE_PROFIT_MARKET", "sell", 0.1, None, {"stopPrice": 29900, "reduceOnly": True})
+    assert ex.rejects["would_trigger"] == 2
+
+def test_market_walks_the_book(ex):
+    ex.set_book(SYM, [[29999, 1]], [[30001, 0.1], [30005, 0.1], [30010, 1]])
+    o = ex.create_order(SYM, "market", "buy", 0.25)
+    assert o["average"] == pytest.approx((30001 * 0.1 + 30005 * 0.1 + 30010 * 0.05) / 0.25)
+    assert ex.books[SYM]["asks"] == [[30010, pytest.approx(0.95)]]
+
+def test_post_only_crossing_expires_and_resting_fills_as_maker(ex):
+    ex.set_book(SYM, [[29999, 1]], [[30001, 1]])
+    assert ex.create_order(SYM, "limit", "buy", 0.1, 30001, {"timeInForce": "GTX"})["status"] == "expired"
+    o = ex.create_order(SYM, "limit", "buy", 0.1, 29999, {"timeInForce": "GTX"})
+    assert o["status"] == "open"
+    ex.on_trade(SYM, 29998, 1)
+    assert ex.fetch_order(o["id"])["status"] == "closed"
+    assert ex.trades[-1]["maker"]
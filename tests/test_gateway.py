@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+# Gateway (gateway.py): cache ตาม TTL, coalescing ของ call ที่ค้างอยู่, invalidate หลัง write
+import threading
+
+import pytest
+
+from gateway import Gateway, invalidate
+
+SYM = "BTC/USDT:USDT"
+
+class Backend:
+    def __init__(self):
+        self.calls = []
+        self.gate = None              # threading.Event -> fetch_ticker รอจน set
+        self.entered = threading.Event()
+        self.fail = None
+
+    def fetch_ticker(self, symbol):
+        self.calls.append(("fetch_ticker", symbol))
+        self.entered.set()
+        if self.gate:
+            self.gate.wait(5)
+        if self.fail:
+            raise self.fail
+        return {"symbol": symbol, "last": 30000 + len(self.calls)}
+
+    def fetch_balance(self, params=None):
+        self.calls.append(("fetch_balance",))
+        return {"USDT": {"free": 1000 - len(self.calls)}}
+
+    def create_order(self, *a, **k):
+        self.calls.append(("create_order",))
+        return {"id": "1"}
+
+    def market(self, symbol):
+        return {"id": "BTCUSDT"}
+
+class Clock:
+    t = 0.0
+    def __call__(self):
+        return self.t
+
+@pytest.fixture
+def gw():
+    clock = Clock()
+    g = Gateway(Backend(), clock=clock)
+    g.clock = clock
+    return g
+
+def test_cache_hit_until_ttl(gw):
+    a = gw.fetch_ticker(SYM)
+    assert gw.fetch_ticker(SYM) is a
+    gw.clock.t += 1.5
+    assert gw.fetch_ticker(SYM) is not a
+    assert gw.stats["hit"] == 1 and gw.stats["miss"] == 2
+
+def test_args_are_part_of_key(gw):
+    gw.fetch_ticker(SYM)
+    gw.fetch_ticker("ETH/USDT:USDT")
+    assert len(gw._ex.calls) == 2
+
+def test_write_invalidates_account_reads(gw):
+    b = gw.fetch_balance()
+    assert gw.fetch_balance() is b
+    gw.create_order(SYM, "market", "buy", 0.1)
+    assert gw.fetch_balance() is not b
+    gw.fetch_ticker(SYM)
+    invalidate(gw)                            # ไม่ระบุ = account เท่านั้น
+    gw.fetch_ticker(SYM)
+    assert gw._ex.calls.count(("fetch_ticker", SYM)) == 1
+
+def test_passthrough_for_uncached_methods(gw):
+    assert gw.market(SYM) == {"id": "BTCUSDT"}
+
+def run_followers(gw, n):
+    out, errs = [], []
+    def call():
+        try:
+            out.append(gw.fetch_ticker(SYM))
+        except Exception as e:
+            errs.append(e)
+    leader = threading.Thread(target=call)
+    leader.start()
+    assert gw._ex.entered.wait(5)
+    rest = [threading.Thread(target=call) for _ in range(n)]
+    for t in rest:
+        t.start()
+    while gw.stats["coalesced"] < n:
+        threading.Event().wait(0.001)
+    gw._ex.gate.set()
+    for t in [leader, *rest]:
+        t.join(5)
+    return out, errs
+
+def test_concurrent_calls_coalesce(gw):
+    gw._ex.gate = threading.Event()
+    out, errs = run_followers(gw, 5)
+    assert not errs and len(out) == 6
+    assert len(gw._ex.calls) == 1
+    assert all(r is out[0] for r in out)
+
+def test_leader_error_reaches_followers_and_is_not_cached(gw):
+    gw._ex.gate = threading.Event()
+    gw._ex.fail = ConnectionError("timed out")
+    out, errs = run_followers(gw, 3)
+    assert not out and len(errs) == 4
+    gw._ex.fail, gw._ex.gate = None, None
+    assert gw.fetch_ticker(SYM)["last"] == 30002
+
+def test_invalidate_during_flight_skips_cache(gw):
+    gw._ex.gate = threading.Event()
+    t = threading.Thread(target=gw.fetch_ticker, args=(SYM,))
+    t.start()
+    assert gw._ex.entered.wait(5)
+    gw.invalidate("fetch_ticker")
+    gw._ex.gate.set()
+    t.join(5)
+    gw._ex.gate = None
+    gw.fetch_ticker(SYM)
+    assert len(gw._ex.calls) == 2
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+# Streaming EMA / MACD / MAE (indicators.py) เทียบกับ ema() / macd() เดิมใน main.py ที่คำนวณจาก bar 0
+import math, random
+
+import pytest
+
+import main
+from indicators import EMA, MACD, MAE
+
+REL = 1e-9
+
+def closes(n=400, seed=7):
+    # fixture คงที่: random walk + trend + รอบ sine (ราคาระดับ BTC)
+    rnd = random.Random(seed)
+    px, out = 40000.0, []
+    for i in range(n):
+        px += rnd.gauss(0, 60) + 3 + 150 * math.sin(i / 15)
+        out.append(round(px, 1))
+    return out
+
+FIXTURES = [closes(), closes(seed=11), [100.0] * 120, [float(i) for i in range(1, 200)]]
+
+@pytest.mark.parametrize("series", FIXTURES)
+@pytest.mark.parametrize("period", [1, 9, 50, 100])
+def test_ema_matches_batch(series, period):
+    e = EMA(period)
+    for n, v in enumerate(series, 1):
+        got = e.update(v)
+        want = main.ema(series[:n], period)
+        if want is None:
+            assert got is None
+        else:
+            assert got == pytest.approx(want, rel=REL)
+
+@pytest.mark.parametrize("series", FIXTURES)
+def test_ema_peek_is_next_update(series):
+    e = EMA(20)
+    for v in series:
+        p = e.peek(v)
+        got = e.update(v)
+        assert got is None if p is None else got == pytest.approx(p, rel=REL)
+
+def test_ema_seed_equals_update():
+    s = closes()
+    assert EMA(50).seed(s) == pytest.approx(main.ema(s, 50), rel=REL)
+
+@pytest.mark.parametrize("series", FIXTURES)
+@pytest.mark.parametrize("params", [(12, 26, 9), (5, 13, 4)])
+def test_macd_matches_batch(series, params):
+    m = MACD(*params)
+    for n, v in enumerate(series, 1):
+        got = m.update(v)
+        want = main.macd(series[:n], *params)
+        if want is None:
+            assert got is None
+        else:
+            assert got == pytest.approx(want, rel=1e-7, abs=1e-9)
+
+def test_macd_peek_is_forming_bar():
+    s = closes()
+    m = MACD()
+    m.seed(s[:-1])
+    assert m.peek(s[-1]) == pytest.approx(main.macd(s), rel=1e-7, abs=1e-9)
+    assert m.value() == pytest.approx(main.macd(s[:-1]), rel=1e-7, abs=1e-9)   # peek ไม่เปลี่ยน state
+
+def mae_ref(series, window):
+    d = [abs(b - a) for a, b in zip(series, series[1:])][-window:]
+    return sum(d) / len(d) if d else None
+
+@pytest.mark.parametrize("window", [1, 5, 50])
+def test_mae_matches_brute_force(window):
+    s = closes(200)
+    m = MAE(window)
+    for n, v in enumerate(s, 1):
+        got, want = m.update(v), mae_ref(s[:n], window)
+        assert got == (None if want is None else pytest.approx(want, rel=1e-9))
+        if n < len(s):
+            assert m.peek(s[n]) == pytest.approx(mae_ref(s[:n + 1], window), rel=1e-9)
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+# Notifier (notifier.py) กับ Telegram stub (http.server บน thread): timeout, 429 retry_after, coalesce, queue เต็ม
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from notifier import Notifier
+
+class Stub:
+    """Bot API ปลอม: replies = [(status, body dict, delay sec)] ตามลำดับ request, หมดแล้ว = 200"""
+    def __init__(self):
+        self.requests = []            # (time, json)
+        self.replies = []
+        self.gate = None              # threading.Event -> request แรกรอจน set
+        self.got = threading.Event()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                stub.requests.append((time.time(), body))
+                stub.got.set()
+                status, reply, delay = stub.replies.pop(0) if stub.replies else (200, {"ok": True}, 0)
+                if stub.gate is not None:
+                    stub.gate.wait(5)
+                    stub.gate = None
+                time.sleep(delay)
+                data = json.dumps(reply).encode()
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                except OSError:
+                    pass              # client timeout ไปแล้ว
+
+            def log_message(self, *a):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def texts(self):
+        return [b["text"] for _, b in self.requests]
+
+@pytest.fixture
+def stub():
+    s = Stub()
+    yield s
+    s.server.shutdown()
+    s.server.server_close()
+
+def notifier(stub, **kw):
+    kw = {"coalesce_sec": 0, "min_interval": 0, "retries": 3, "timeout": (1, 0.2), **kw}
+    return Notifier("TOKEN", 42, base_url=stub.url, **kw)
+
+def test_sends_to_bot_api(stub):
+    n = notifier(stub)
+    n.send("hello")
+    assert n.flush(5)
+    assert stub.requests[0][1] == {"chat_id": 42, "text": "hello"}
+    assert n.metrics()["sent"] == 1
+    n.close()
+
+def test_read_timeout_is_retried(stub):
+    stub.replies = [(200, {"ok": True}, 0.6)]          # ตอบช้ากว่า read timeout (0.2s)
+    n = notifier(stub)
+    t0 = time.time()
+    n.send("slow")
+    assert n.flush(5)
+    m = n.metrics()
+    assert m["retries"] == 1 and m["sent"] == 1 and len(stub.requests) == 2
+    assert time.time() - t0 < 0.2 + 1.0 + 0.5         # timeout + backoff 1s ไม่ค้างรอ stub
+    n.close()
+
+def test_gives_up_after_retries(stub):
+    stub.replies = [(500, {"ok": False}, 0)] * 2
+    n = notifier(stub, retries=2)
+    n.send("x")
+    assert n.flush(5)
+    m = n.metrics()
+    assert m["failed"] == 1 and m["sent"] == 0 and m["retries"] == 2 and len(stub.requests) == 2
+    n.close()
+
+def test_429_waits_retry_after(stub):
+    stub.replies = [(429, {"ok": False, "error_code": 429, "parameters": {"retry_after": 0.3}}, 0)]
+    n = notifier(stub)
+    n.send("limited")
+    assert n.flush(5)
+    (t1, _), (t2, body) = stub.requests
+    assert t2 - t1 >= 0.3 and body["text"] == "limited"
+    assert n.metrics()["sent"] == 1
+    n.close()
+
+def test_client_error_is_not_retried(stub):
+    stub.replies = [(400, {"ok": False, "description": "chat not found"}, 0)]
+    n = notifier(stub)
+    n.send("x")
+    assert n.flush(5)
+    assert len(stub.requests) == 1 and n.metrics()["failed"] == 1
+    n.close()
+
+def test_messages_within_coalesce_window_are_merged(stub):
+    n = notifier(stub, coalesce_sec=0.3)
+    for m in ("a", "b", "c"):
+        n.send(m)
+    assert n.flush(5)
+    assert stub.texts() == ["a\nb\nc"]
+    m = n.metrics()
+    assert m["sent"] == 3 and m["batches"] == 1
+    n.close()
+
+def test_coalesced_batch_split_at_max_len(stub):
+    n = notifier(stub, coalesce_sec=0.3)
+    n.send("x" * 3000)
+    n.send("y" * 3000)
+    assert n.flush(5)
+    assert stub.texts() == ["x" * 3000, "y" * 3000]
+    n.close()
+
+def test_full_queue_drops_oldest(stub):
+    stub.gate = threading.Event()
+    n = notifier(stub, maxsize=2)
+    n.send("m0")
+    assert stub.got.wait(5)                           # worker ค้างอยู่ใน POST ของ m0
+    for m in ("m1", "m2", "m3"):
+        n.send(m)
+    assert n.metrics()["dropped"] == 1 and n.metrics()["queue_depth"] == 2
+    stub.gate.set()
+    assert n.flush(5)
+    assert stub.texts() == ["m0", "m2", "m3"]
+    n.close()
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+# NWEngine (nwe.py): envelope / batch / incremental / forming เทียบกับสูตรเดิม (nwe_reference)
+import numpy as np
+import pytest
+
+import backtest
+import nwe
+from plugins import NWPlugin
+
+H, MULT, FACTOR = 8.0, 4, 1.5
+
+def walk(n, seed=1):
+    rng = np.random.default_rng(seed)
+    return (30000 + np.cumsum(rng.normal(0, 50, n))).tolist()
+
+def ref(closes):
+    return nwe.nwe_reference(closes, H, MULT, FACTOR)
+
+def close(a, b):
+    return a == b == (None, None, None) or a == pytest.approx(b, rel=0, abs=1e-8)
+
+def test_envelope_matches_reference():
+    c = walk(700)
+    eng = nwe.NWEngine(H, MULT, FACTOR)
+    for n in (nwe.MIN_BARS - 1, nwe.MIN_BARS, 350, nwe.MAX_WIN + 1, 700):
+        assert close(eng.envelope(c[:n]), ref(c[:n]))
+
+def test_batch_matches_reference():
+    c = walk(650, seed=2)
+    u, l, m = nwe.NWEngine(H, MULT, FACTOR).batch(c)
+    assert np.isnan(m[nwe.MIN_BARS - 2])
+    for t in range(nwe.MIN_BARS - 1, len(c), 7):
+        assert close((u[t], l[t], m[t]), ref(c[:t + 1]))
+
+def test_incremental_matches_reference():
+    c = walk(1300, seed=3)                    # เกิน capacity ของ buffer -> compact
+    eng = nwe.NWEngine(H, MULT, FACTOR)
+    eng.seed(c[:150])
+    for t in range(150, len(c)):
+        eng.update(c[t] + 40)                 # แท่งใหม่ยังไม่ปิด
+        got = eng.update(c[t], new_bar=False)
+        if t % 5 == 0 or t < nwe.MIN_BARS + 2:
+            assert close(got, ref(c[:t + 1]))
+
+def test_forming_parts_match_reference():
+    c = walk(800, seed=4)
+    S, mae, coef0, den, warm = backtest.nw_forming_parts(np.array(c), H, MULT, FACTOR, buffer=600)
+    for j in range(warm + 1, len(c), 11):
+        x = c[j] - 25                         # ราคาระหว่างแท่ง
+        mid = (x * coef0 + S[j]) / den
+        want = ref(c[max(0, j - 599):j] + [x])
+        assert close((mid + mae[j], mid - mae[j], mid), want)
+
+def test_plugin_follows_candle_stream():
+    c = walk(900, seed=5)
+    p = NWPlugin(nw=(H, MULT, FACTOR))
+    rows = [[i * 60000, 0, 0, 0, v, 0] for i, v in enumerate(c)]
+    window = 600
+    for t in range(650, 720):
+        candles = [r[:] for r in rows[max(0, t - window + 1):t + 1]]
+        candles[-1][4] = c[t] + 10            # tick ระหว่างแท่ง
+        closes = [r[4] for r in candles]
+        assert close(p._envelope(candles, closes), ref(closes))
+        candles[-1][4] = c[t]
+        closes[-1] = c[t]
+        assert close(p._envelope(candles, closes), ref(closes))
+    # แท่งหาย (ข้ามไป 3 แท่ง) -> seed ใหม่
+    candles = rows[800 - window + 1:801]
+    closes = [r[4] for r in candles]
+    assert close(p._envelope(candles, closes), ref(closes))
+
+def test_plugin_short_store_keeps_window():
+    c = walk(400, seed=6)
+    p = NWPlugin(nw=(H, MULT, FACTOR))
+    rows = [[i * 60000, 0, 0, 0, v, 0] for i, v in enumerate(c)]
+    for t in range(300, 330):                 # store เก็บแค่ 250 แท่ง -> window = 249
+        candles = rows[t - 249:t + 1]
+        closes = [r[4] for r in candles]
+        assert close(p._envelope(candles, closes), ref(closes))
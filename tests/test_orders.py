@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+# OrderManager (orders.py) บน FakeExchange: วาง SL ไม่ได้ / stop ทะลุ mark / วาง SL-TP ที่หายใหม่
+import pytest
+
+from fake_exchange import FakeExchange
+from orders import OrderManager
+
+SYM = "BTC/USDT:USDT"
+
+@pytest.fixture
+def ex():
+    ex = FakeExchange(balance=10000, leverage=10)
+    ex.set_price(SYM, 30000)
+    ex.create_order(SYM, "market", "buy", 0.1)
+    return ex
+
+def manager(ex):
+    om = OrderManager(ex, SYM)
+    om.sleep = lambda s: None
+    return om
+
+def open_stops(ex):
+    return {o["type"]: o["stopPrice"] for o in ex.fetch_open_orders(SYM)}
+
+def failing(ex, n, types=("STOP_MARKET",)):
+    # create_order ของ type ใน types ล้ม n ครั้งแรก
+    orig, left = ex.create_order, [n]
+    def create_order(symbol, type, side, amount, price=None, params=None):
+        if type in types and left[0] > 0:
+            left[0] -= 1
+            raise ConnectionError("binance GET timed out")
+        return orig(symbol, type, side, amount, price, params)
+    ex.create_order = create_order
+
+def test_protect_places_sl_tp(ex):
+    om = manager(ex)
+    assert om.protect("long", 0.1, 29000, 32000)
+    assert open_stops(ex) == {"STOP_MARKET": 29000, "TAKE_PROFIT_MARKET": 32000}
+
+def test_protect_retries_transient_error(ex):
+    failing(ex, 2)
+    om = manager(ex)
+    assert om.protect("long", 0.1, 29000)
+    assert om.sl_id is not None and om.pending is None
+
+def test_protect_flattens_when_sl_cannot_be_placed(ex):
+    failing(ex, 99)
+    om = manager(ex)
+    assert not om.protect("long", 0.1, 29000, 32000)
+    assert SYM not in ex.positions
+    assert open_stops(ex) == {}
+    fill = om.reconcile()
+    assert fill["kind"] == "SL" and fill["qty"] == pytest.approx(0.1) and fill["price"] == 30000
+    assert not om.active()
+
+def test_protect_sl_through_mark_flattens(ex):
+    om = manager(ex)
+    assert not om.protect("long", 0.1, 30500)        # stop ของ long เหนือราคา -> trigger ทันที
+    assert ex.rejects["would_trigger"] == 1
+    assert SYM not in ex.positions and om.reconcile()["kind"] == "SL"
+
+def test_move_sl_through_mark_closes_at_market(ex):
+    om = manager(ex)
+    om.protect("long", 0.1, 29000, 32000)
+    ex.set_price(SYM, 29900)
+    om.move_sl(30000)                                 # breakeven แต่ราคาหลุดลงไปแล้ว
+    assert SYM not in ex.positions
+    assert open_stops(ex) == {}
+    fill = om.reconcile()
+    assert fill == {"kind": "SL", "price": 29900, "qty": pytest.approx(0.1)}
+
+def test_move_sl_failure_keeps_old_stop(ex):
+    om = manager(ex)
+    om.protect("long", 0.1, 29000)
+    failing(ex, 99)
+    om.move_sl(29500)
+    assert om.sl == 29000 and open_stops(ex) == {"STOP_MARKET": 29000}
+
+def test_reconcile_replaces_missing_orders(ex):
+    failing(ex, 99, types=("TAKE_PROFIT_MARKET",))
+    om = manager(ex)
+    assert om.protect("long", 0.1, 29000, 32000)
+    assert om.tp_id is None
+    ex.create_order = FakeExchange.create_order.__get__(ex)
+    assert om.reconcile() is None
+    assert open_stops(ex) == {"STOP_MARKET": 29000, "TAKE_PROFIT_MARKET": 32000}
+
+def test_reconcile_replaces_canceled_sl(ex):
+    om = manager(ex)
+    om.protect("long", 0.1, 29000)
+    ex.cancel_order(om.sl_id, SYM)
+    assert om.reconcile() is None
+    assert open_stops(ex) == {"STOP_MARKET": 29000}
+
+def test_sl_fill(ex):
+    om = manager(ex)
+    om.protect("long", 0.1, 29000, 32000)
+    ex.set_price(SYM, 28990)
+    fill = om.reconcile()
+    assert fill["kind"] == "SL" and fill["price"] == 28990
+    assert open_stops(ex) == {}
+
+def test_resize_replaces_sl_tp_at_residual_qty(ex):
+    om = manager(ex)
+    om.protect("long", 0.1, 29000, 32000)
+    old = (om.sl_id, om.tp_id)
+    ex.create_order(SYM, "market", "sell", 0.04, None, {"reduceOnly": True})
+    assert om.resize(0.06)
+    assert {o["type"]: o["amount"] for o in ex.fetch_open_orders(SYM)} == \
+        {"STOP_MARKET": pytest.approx(0.06), "TAKE_PROFIT_MARKET": pytest.approx(0.06)}
+    assert om.qty == 0.06 and (om.sl_id, om.tp_id) != old
+
+def test_resize_failure_keeps_old_order(ex):
+    om = manager(ex)
+    om.protect("long", 0.1, 29000, 32000)
+    sl_id = om.sl_id
+    failing(ex, 99)
+    assert om.resize(0.06)
+    assert om.sl_id == sl_id and open_stops(ex) == {"STOP_MARKET": 29000, "TAKE_PROFIT_MARKET": 32000}
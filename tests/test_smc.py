@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+# smc.py: เวอร์ชัน NumPy / incremental เทียบกับ *_reference (pure-Python เดิม) บนข้อมูลสุ่ม
+import random
+
+import pytest
+
+import smc
+
+def bars(rng, n, tick=5.0):
+    # ราคาเป็นจำนวนเต็มของ tick -> high/low ซ้ำกัน, close = ราคา swing ก่อนหน้า เกิดได้
+    out, px = [], 30000.0
+    for i in range(n):
+        o = px
+        c = o + tick * rng.randint(-6, 6)
+        h = max(o, c) + tick * rng.randint(0, 3)
+        l = min(o, c) - tick * rng.randint(0, 3)
+        v = float(rng.randint(0, 9)) if rng.random() < 0.7 else rng.random() * 10
+        out.append([1700000000000 + i * 60000, o, h, l, c, v])
+        px = c
+    return out
+
+SEEDS = range(40)
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_swings_and_structure_match_reference(seed):
+    rng = random.Random(seed)
+    data = bars(rng, rng.randint(0, 300))
+    left, right = rng.randint(1, 4), rng.randint(1, 4)
+    sw = smc.find_swings(data, left, right)
+    assert sw == smc.find_swings_reference(data, left, right)
+    assert smc.detect_structure(data, sw) == smc.detect_structure_reference(data, sw)
+    assert smc.last_signal(data, left, right) == smc.last_signal_reference(data, left, right)
+    sig, _ = smc.structure_batch(data, left, right)
+    assert sig == smc.detect_structure_reference(data, sw)
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_incremental_structure_matches_reference(seed):
+    rng = random.Random(1000 + seed)
+    data = bars(rng, 400)
+    window = rng.randint(20, 120)
+    st = smc.Structure(window=window)
+    for n in range(1, len(data) + 1, rng.randint(1, 5)):
+        st.sync(data[:n])
+        w = data[max(0, n - window):n]
+        assert st.last_signal() == smc.last_signal_reference(w)
+        assert st.swings() == smc.find_swings_reference(w)
+
+def test_incremental_structure_trims_old_events():
+    rng = random.Random(7)
+    data = bars(rng, 3000)
+    st = smc.Structure(window=50)
+    st.TRIM = 16
+    for n in range(1, len(data) + 1):
+        st.sync(data[:n])
+        if n % 97 == 0:
+            assert st.last_signal() == smc.last_signal_reference(data[n - 50:n])
+    assert len(st.sw) < len(smc.find_swings_reference(data)) / 2   # ของเก่าที่หลุด window ถูกตัดทิ้ง
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_calc_poc_matches_reference(seed):
+    rng = random.Random(2000 + seed)
+    data = bars(rng, rng.randint(1, 200))
+    lows, highs = [c[3] for c in data], [c[2] for c in data]
+    lo = min(lows) + rng.choice([0, -50, 40])
+    hi = max(highs) + rng.choice([0, 50, -40])
+    buckets = rng.choice([10, 40, 7])
+    assert smc.calc_poc(data, lo, hi, buckets) == smc.calc_poc_reference(data, lo, hi, buckets)
+
+def test_calc_poc_degenerate_bounds():
+    data = bars(random.Random(3), 20)
+    assert smc.calc_poc(data, 100, 100) is smc.calc_poc_reference(data, 100, 100) is None
+    assert smc.calc_poc([], 1, 2) is smc.calc_poc_reference([], 1, 2) is None
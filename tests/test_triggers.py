@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+# TriggerBook (triggers.py): ยิงครั้งเดียว, ลำดับตามราคาที่วิ่งผ่าน, trailing, หลาย thread
+import threading
+
+import pytest
+
+from triggers import DOWN, UP, TriggerBook
+
+SYM = "BTC/USDT:USDT"
+
+def test_fires_crossed_levels_in_price_order():
+    book = TriggerBook()
+    for lvl in (30100, 30300, 30200):
+        book.add(SYM, lvl, UP, "tp")
+    book.add(SYM, 29900, DOWN, "sl")
+    fired = book.update(SYM, 30250)
+    assert [t.level for t in fired] == [30100, 30200]
+    assert [t.level for t in book.levels(SYM)] == [29900, 30300]
+    assert book.nearest(SYM, 30250) == pytest.approx(50)
+
+def test_each_trigger_drained_exactly_once():
+    book = TriggerBook()
+    a = book.add(SYM, 29900, DOWN, "sl", owner="nw")
+    book.update(SYM, 29800)
+    book.update(SYM, 29700)
+    assert book.drain(SYM) == [a]
+    assert book.drain(SYM) == []
+    assert book.update(SYM, 29600) == []
+    assert book.count() == 0
+
+def test_cancel_and_replace_by_id():
+    book = TriggerBook()
+    book.add(SYM, 30500, UP, "tp", owner="ema", id="tp")
+    book.add(SYM, 30600, UP, "tp", owner="ema", id="tp")
+    assert [t.level for t in book.levels(SYM)] == [30600]
+    assert book.cancel_owner(SYM, "ema") == 1
+    assert book.update(SYM, 31000) == []
+
+def test_concurrent_updates_fire_once():
+    book = TriggerBook()
+    for i in range(500):
+        book.add(SYM, 30000 + i, UP, "alert")
+    out, lock = [], threading.Lock()
+    def run():
+        for px in range(30000, 30600, 7):
+            fired = book.update(SYM, px)
+            with lock:
+                out.extend(t.id for t in fired)
+    threads = [threading.Thread(target=run) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(out) == sorted(set(out)) and len(out) == 500
+    assert len(book.drain(SYM)) == 500
+
+def test_trailing_long_stop_only_ratchets_up():
+    book = TriggerBook()
+    t = book.add(SYM, 29900, DOWN, "sl", trail=100)
+    assert book.update(SYM, 30200) == []
+    assert t.level == pytest.approx(30100)
+    book.update(SYM, 30150)                   # ถอยลง -> level ไม่ลดตาม
+    assert t.level == pytest.approx(30100)
+    assert book.update(SYM, 30100) == [t]
+
+def test_trailing_short_stop_follows_down():
+    book = TriggerBook()
+    t = book.add(SYM, 30100, UP, "sl", trail=100)
+    book.update(SYM, 29800)
+    assert t.level == pytest.approx(29900)
+    assert book.update(SYM, 29850) == []
+    assert book.update(SYM, 29950) == [t]
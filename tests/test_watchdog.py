@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+# Watchdog / Lease (watchdog.py): ต่อ lease เฉพาะตอน loop มี heartbeat, restart เมื่อค้าง, fencing ด้วย epoch
+import threading
+import time
+
+import pytest
+
+from gateway import Gateway
+from watchdog import Lease, Watchdog
+
+class Clock:
+    def __init__(self, t=1000.0):
+        self.t = t
+
+    def __call__(self):
+        return self.t
+
+@pytest.fixture
+def leases(tmp_path):
+    clock = Clock()
+    path = str(tmp_path / "lease.db")
+    a = Lease(path, ttl=10, guard=2, owner="A", clock=clock)
+    b = Lease(path, ttl=10, guard=2, owner="B", clock=clock)
+    return a, b, clock
+
+def watchdog(lease=None, **kw):
+    restarts = []
+    wd = Watchdog(default=60, iteration=600, beat=5, lease=lease, renew_sec=2, on_restart=lambda: restarts.append(1), **kw)
+    return wd, restarts
+
+def test_lease_takeover_bumps_epoch_and_fences_old_primary(leases):
+    a, b, clock = leases
+    assert a.acquire() and a.epoch == 1
+    assert not b.acquire()
+    clock.t += 9                              # เหลือ 1s < guard -> ไม่ส่ง order แล้ว
+    assert not a.held() and a.epoch is None
+    clock.t += 2
+    assert b.acquire() and b.epoch == 2
+    assert not a.renew() and not a.acquire()
+
+def test_renews_only_while_stage_has_heartbeat(leases):
+    a, b, clock = leases
+    a.acquire()
+    wd, _ = watchdog(a)
+    t0 = time.monotonic()
+    with wd.stage("position"):
+        clock.t += 3
+        wd.check(t0 + 3)                      # 3s < beat -> ต่อ
+        renewed = clock.t + a.ttl
+        clock.t += 3
+        wd.check(t0 + 6)                      # 6s > beat -> ไม่ต่อ
+        assert wd.paused
+        clock.t += 8                          # primary ค้าง ~ beat + ttl -> standby รับได้
+        assert clock.t >= renewed and b.acquire()
+    assert not a.held()
+
+def test_wait_budget_keeps_renewing(leases):
+    a, _, clock = leases
+    a.acquire()
+    wd, _ = watchdog(a)
+    t0 = time.monotonic()
+    with wd.stage("wait", 30 + wd.beat):
+        for s in range(3, 34, 3):
+            clock.t += 3
+            wd.check(t0 + s)
+            assert not wd.paused
+    assert a.held()
+
+def test_execute_has_longer_budget_than_beat():
+    wd, _ = watchdog()
+    with wd.stage("execute"):
+        assert wd.fresh(time.monotonic() + 20)
+        assert not wd.fresh(time.monotonic() + 61)
+
+def test_nested_stage_heartbeats_parent():
+    wd, restarts = watchdog()
+    t0 = time.monotonic()
+    with wd.stage("plugins"):
+        wd.stack[-1][1] = t0 - 100            # parent เริ่มนานแล้ว
+        with wd.stage("execute"):
+            pass
+        assert wd.fresh()
+        wd.check()
+    assert not restarts
+
+def test_stuck_stage_restarts_and_releases_lease(leases):
+    a, b, _ = leases
+    a.acquire()
+    wd, restarts = watchdog(a)
+    with wd.stage("position"):
+        wd.check(time.monotonic() + 61)
+    assert restarts and a.epoch is None
+    assert b.acquire()
+
+def test_no_iteration_restarts():
+    wd, restarts = watchdog()
+    wd.check(time.monotonic() + 601)
+    assert restarts
+
+def test_gateway_follower_times_out_when_leader_hangs():
+    gate = threading.Event()
+    class Slow:
+        def fetch_ticker(self, symbol):
+            gate.wait(5)
+            return {"last": 1}
+    gw = Gateway(Slow(), follow_timeout=0.05)
+    leader = threading.Thread(target=gw.fetch_ticker, args=("X",))
+    leader.start()
+    while not gw._inflight:
+        time.sleep(0.001)
+    with pytest.raises(TimeoutError):
+        gw.fetch_ticker("X")
+    gate.set()
+    leader.join(5)
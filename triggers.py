@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+# triggers.py
+# Indexed price triggers: stop / target / ladder / alert หลายระดับ หลาย symbol
+# - ต่อ symbol ต่อทิศ: keys เรียง (bisect) + triggers ขนานกัน
+#     up   (ยิงเมื่อราคา >= level): key = -level -> level ที่ต่ำสุดอยู่ท้าย list
+#     down (ยิงเมื่อราคา <= level): key = level  -> level ที่สูงสุดอยู่ท้าย list
+#   level ที่ราคาข้ามแล้วอยู่ท้ายเสมอ -> update() = bisect + ตัดท้าย O(log n + k), nearest() = O(1)
+# - trailing: level ขยับตามราคาที่ดีที่สุด (peak) ระยะ trail แล้ว re-index
+# - exactly-once: ถอดออกจาก index ภายใต้ lock ก่อนส่งต่อ, drain() คืนแต่ละ trigger ครั้งเดียว
+#   (update จาก stream thread + decision loop พร้อมกันได้)
+#
+#   book.add("BTC/USDT:USDT", 43000, UP, "tp", owner="ema", data=1)
+#   book.update(symbol, price); for t in book.drain(symbol): ...
+
+import bisect, itertools, threading
+from collections import deque
+
+import metrics
+
+UP, DOWN = "up", "down"
+
+class Trigger:
+    __slots__ = ("id", "symbol", "level", "dir", "kind", "owner", "data", "trail", "peak")
+
+    def __init__(self, id, symbol, level, dir, kind, owner=None, data=None, trail=None):
+        if dir not in (UP, DOWN):
+            raise ValueError(f"bad trigger direction: {dir}")
+        self.id, self.symbol, self.level, self.dir = id, symbol, float(level), dir
+        self.kind, self.owner, self.data = kind, owner, data
+        self.trail = trail        # trailing distance (None = level คงที่)
+        self.peak = None          # ราคาที่ดีที่สุดตั้งแต่ตั้ง (trailing)
+
+    @property
+    def key(self):
+        return -self.level if self.dir == UP else self.level
+
+    def __repr__(self):
+        return f"Trigger({self.id} {self.symbol} {self.kind} {self.dir} {self.level:.2f})"
+
+class TriggerBook:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.index = {}           # symbol -> {UP: (keys, triggers), DOWN: (keys, triggers)}
+        self.by_id = {}
+        self.trailing = {}        # symbol -> {id: trigger}
+        self.ready = {}           # symbol -> deque ของ trigger ที่ยิงแล้ว รอ drain
+        self._seq = itertools.count(1)
+
+    def _side(self, symbol, dir):
+        d = self.index.get(symbol)
+        if d is None:
+            d = self.index[symbol] = {UP: ([], []), DOWN: ([], [])}
+        return d[dir]
+
+    def _insert(self, t):
+        keys, trigs = self._side(t.symbol, t.dir)
+        i = bisect.bisect_right(keys, t.key)
+        keys.insert(i, t.key)
+        trigs.insert(i, t)
+
+    def _remove(self, t):
+        keys, trigs = self._side(t.symbol, t.dir)
+        i = bisect.bisect_left(keys, t.key)
+        while i < len(keys) and keys[i] == t.key:
+            if trigs[i] is t:
+                del keys[i], trigs[i]
+                return True
+            i += 1
+        return False
+
+    # ---------------- register ----------------
+    def add(self, symbol, level, dir, kind, owner=None, data=None, trail=None, id=None):
+        with self.lock:
+            if id is not None and id in self.by_id:
+                self.cancel(id)
+            t = Trigger(id if id is not None else next(self._seq), symbol, level, dir, kind, owner, data, trail)
+            if trail:
+                # long stop (down): peak = level + trail; short stop (up): peak = level - trail
+                t.peak = t.level + trail if dir == DOWN else t.level - trail
+                self.trailing.setdefault(symbol, {})[t.id] = t
+            self._insert(t)
+            self.by_id[t.id] = t
+            return t
+
+    def cancel(self, id):
+        with self.lock:
+            t = self.by_id.pop(id, None)
+            if t is None:
+                return False
+            self._remove(t)
+            self.trailing.get(t.symbol, {}).pop(t.id, None)
+            return True
+
+    def cancel_owner(self, symbol, owner):
+        with self.lock:
+            ids = [t.id for t in self.by_id.values() if t.symbol == symbol and t.owner == owner]
+            for id in ids:
+                self.cancel(id)
+            return len(ids)
+
+    # ---------------- price ----------------
+    def update(self, symbol, price):
+        # ราคาใหม่ -> trigger ที่ถูกข้าม (เรียงตามลำดับที่ราคาวิ่งผ่าน) และเข้าคิว ready
+        with self.lock:
+            if symbol not in self.index:
+                return []
+            for t in list(self.trailing.get(symbol, {}).values()):
+                if (t.dir == DOWN and price > t.peak) or (t.dir == UP and price < t.peak):
+                    t.peak = price
+                    level = price - t.trail if t.dir == DOWN else price + t.trail
+                    if (level > t.level) if t.dir == DOWN else (level < t.level):
+                        self._remove(t)
+                        t.level = level
+                        self._insert(t)
+            fired = []
+            for dir, key in ((UP, -price), (DOWN, price)):
+                keys, trigs = self._side(symbol, dir)
+                i = bisect.bisect_left(keys, key)
+                if i < len(keys):
+                    fired.extend(reversed(trigs[i:]))
+                    del keys[i:], trigs[i:]
+            for t in fired:
+                del self.by_id[t.id]
+                self.trailing.get(symbol, {}).pop(t.id, None)
+                metrics.inc("triggers_fired_total", kind=t.kind)
+            if fired:
+                self.ready.setdefault(symbol, deque()).extend(fired)
+            return fired
+
+    def drain(self, symbol):
+        # trigger ที่ยิงแล้วของ symbol (แต่ละตัวคืนครั้งเดียว)
+        with self.lock:
+            q = self.ready.get(symbol)
+            out = list(q) if q else []
+            if q:
+                q.clear()
+            return out
+
+    # ---------------- query ----------------
+    def count(self, symbol=None):
+        with self.lock:
+            if symbol is None:
+                return len(self.by_id)
+            d = self.index.get(symbol)
+            return len(d[UP][0]) + len(d[DOWN][0]) if d else 0
+
+    def nearest(self, symbol, price):
+        # ระยะถึง level ที่ใกล้ที่สุด (ทั้งสองทิศ), None = ไม่มี
+        with self.lock:
+            d = self.index.get(symbol)
+            if not d:
+                return None
+            out = [abs(trigs[-1].level - price) for _, trigs in d.values() if trigs]
+            return min(out) if out else None
+
+    def levels(self, symbol):
+        with self.lock:
+            d = self.index.get(symbol) or {}
+            return sorted((t for _, trigs in d.values() for t in trigs), key=lambda t: t.level)
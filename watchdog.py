@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+# watchdog.py
+# Loop-stall watchdog + hot standby (process ที่สองรอรับช่วงต่อ)
+# - Watchdog: stage ที่กำลังทำ (stack + เวลาตั้งแต่ heartbeat ล่าสุด) + เวลารอบที่จบล่าสุด, thread แยกตรวจทุก check_sec
+#     fresh    stage ในสุดมี heartbeat ภายใน budget (default beat วินาที; wait / execute ที่นานโดยตั้งใจมี budget เอง)
+#              -> ต่อ lease เฉพาะตอน fresh: primary ที่ค้าง (fetch_positions, tg, ...) หยุดต่อภายใน beat วินาที
+#                 standby รับช่วงภายใน ~beat + ttl
+#     stage ค้างเกิน limit / ไม่มีรอบไหนจบเกิน iteration
+#              -> restart: ปล่อย lease แล้ว os._exit (supervisor / standby รับต่อ)
+#     ไม่ cancel stage จากอีก thread (exception อาจลงระหว่าง create_order กับ state / กลาง SQLite transaction)
+#     -> call ที่ช้าหยุดเองด้วย timeout ของ ccxt / HTTP แล้วเข้า error path ปกติ, ที่ค้างจริงจบด้วย restart
+# - Lease: lease ใน SQLite (ใช้ไฟล์ journal ร่วมกัน) = owner + epoch (fencing token) + expires
+#     ต่ออายุจาก watchdog thread เฉพาะตอน loop fresh -> loop ค้าง = lease หมดอายุ -> standby รับ (epoch + 1)
+#     ก่อนส่ง order / เขียน checkpoint ต้องเช็ค held() (เหลืออายุอย่างน้อย guard วินาที) -> primary เดิมที่ฟื้นมาไม่เทรดซ้ำ
+
+import logging, os, socket, sqlite3, threading, time, uuid
+from contextlib import contextmanager
+
+import metrics
+
+log = logging.getLogger("main")
+
+# limit (sec) ต่อ stage ก่อน restart; ไม่ระบุ = default ของ Watchdog
+STAGE_LIMITS = {"wait": 300.0, "execute": 120.0, "report": 60.0}
+# heartbeat budget (sec) ของ stage ที่ทำงานนานกว่า beat ได้ตามปกติ (twap / post รอ slice / fill)
+BEAT_LIMITS = {"execute": 60.0}
+RESTART_EXIT_CODE = 70
+
+class LeaseLost(Exception):
+    pass
+
+class Watchdog:
+    def __init__(self, default=60.0, limits=None, iteration=600.0, beat=5.0, budgets=None, check_sec=1.0,
+                 lease=None, renew_sec=2.0, on_restart=None):
+        self.default = default
+        self.limits = dict(STAGE_LIMITS, **(limits or {}))
+        self.iteration_limit = iteration
+        self.beat = beat
+        self.budgets = dict(BEAT_LIMITS, **(budgets or {}))
+        self.check_sec = check_sec
+        self.lease = lease
+        self.renew_sec = renew_sec
+        self.on_restart = on_restart or self._exit
+        self.lock = threading.Lock()
+        self.stack = []               # [name, t0, heartbeat budget]
+        self.beats = {}               # stage -> เวลาที่จบล่าสุด (epoch)
+        self.last_iter = time.monotonic()
+        self.stalls = 0
+        self.paused = False           # หยุดต่อ lease อยู่ (loop ไม่ fresh)
+        self._renewed = 0.0
+        self._stop = threading.Event()
+        self.thread = None
+
+    # ---------------- heartbeat (thread ของ loop) ----------------
+    @contextmanager
+    def stage(self, name, budget=None):
+        # budget: heartbeat budget ของรอบนี้ (เช่น wait ที่รู้ว่าจะรอกี่วินาที)
+        entry = [name, time.monotonic(), budget or self.budgets.get(name, self.beat)]
+        with self.lock:
+            self.stack.append(entry)
+        try:
+            with metrics.span("stage", stage=name):
+                yield
+        finally:
+            with self.lock:
+                if entry in self.stack:
+                    self.stack.remove(entry)
+                if self.stack:
+                    self.stack[-1][1] = time.monotonic()      # heartbeat: stage ที่ครอบอยู่นับเวลาใหม่
+            self.beats[name] = time.time()
+
+    def iteration(self):
+        self.last_iter = time.monotonic()
+
+    def fresh(self, now=None):
+        # stage ในสุดยังมี heartbeat ภายใน budget และมีรอบที่จบภายใน iteration limit
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            top = self.stack[-1] if self.stack else None
+        late = top is not None and now - top[1] > top[2]
+        return not late and now - self.last_iter <= self.iteration_limit
+
+    # ---------------- monitor thread ----------------
+    def check(self, now=None):
+        now = time.monotonic() if now is None else now
+        restart = None
+        with self.lock:
+            # ดูเฉพาะ stage ในสุด (stage ที่ครอบอยู่รอ stage ข้างในตามปกติ)
+            top = self.stack[-1] if self.stack else None
+        if top is not None:
+            name, t0, _ = top
+            limit = self.limits.get(name, self.default)
+            if now - t0 > limit:
+                self.stalls += 1
+                metrics.inc("watchdog_stalls_total", stage=name)
+                restart = f"stage '{name}' stuck {now - t0:.0f}s (limit {limit:.0f}s)"
+        if restart is None and now - self.last_iter > self.iteration_limit:
+            restart = f"no completed iteration for {now - self.last_iter:.0f}s"
+        if restart:
+            log.critical(f"[WATCHDOG] {restart} -> restart")
+            metrics.inc("watchdog_restarts_total")
+            if self.lease:
+                self.lease.release()
+            self.on_restart()
+            return
+        if self.lease and self.lease.epoch is not None and now - self._renewed >= self.renew_sec:
+            if not self.fresh(now):
+                if not self.paused:
+                    self.paused = True
+                    log.error(f"[WATCHDOG] stage '{top[0] if top else '-'}' no heartbeat for "
+                              f"{now - (top[1] if top else self.last_iter):.1f}s -> lease not renewed")
+                    metrics.inc("watchdog_late_total", stage=top[0] if top else "-")
+            elif self.lease.renew():
+                self._renewed, self.paused = now, False
+
+    def _run(self):
+        while not self._stop.wait(self.check_sec):
+            try:
+                self.check()
+            except Exception as e:
+                log.warning(f"[WATCHDOG] check error: {e}")
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="watchdog", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    @staticmethod
+    def _exit():
+        logging.shutdown()
+        os._exit(RESTART_EXIT_CODE)
+
+class Lease:
+    """lease ชื่อ name ใน SQLite: ถือได้ทีละ process, epoch เพิ่มทุกครั้งที่เปลี่ยนเจ้าของ"""
+    def __init__(self, path, name="trader", ttl=10.0, guard=2.0, owner=None, clock=time.time):
+        self.name, self.ttl, self.guard, self.clock = name, ttl, guard, clock
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.epoch = None             # epoch ที่ถืออยู่ (None = standby)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS lease (name TEXT PRIMARY KEY, owner TEXT, epoch INTEGER, expires REAL)")
+
+    def _tx(self, fn):
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                out = fn(self.db)
+                self.db.execute("COMMIT")
+                return out
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+
+    def acquire(self):
+        # standby: ได้ lease เมื่อว่าง / หมดอายุ; primary: ต่ออายุ
+        def fn(db):
+            now = self.clock()
+            row = db.execute("SELECT owner, epoch, expires FROM lease WHERE name = ?", (self.name,)).fetchone()
+            if row is None:
+                epoch = 1
+                db.execute("INSERT INTO lease VALUES (?,?,?,?)", (self.name, self.owner, epoch, now + self.ttl))
+            elif row[0] == self.owner and row[1] == self.epoch and row[2] > now:
+                epoch = row[1]
+                db.execute("UPDATE lease SET expires = ? WHERE name = ?", (now + self.ttl, self.name))
+            elif row[2] <= now:
+                epoch = row[1] + 1
+                db.execute("UPDATE lease SET owner = ?, epoch = ?, expires = ? WHERE name = ?",
+                           (self.owner, epoch, now + self.ttl, self.name))
+            else:
+                return None
+            return epoch
+        prev, self.epoch = self.epoch, self._tx(fn)
+        if self.epoch is not None and self.epoch != prev:
+            log.warning(f"[LEASE] {self.owner} is primary (epoch {self.epoch})")
+            metrics.inc("lease_acquired_total")
+        elif self.epoch is None and prev is not None:
+            log.error(f"[LEASE] {self.owner} lost lease (epoch {prev})")
+        return self.epoch is not None
+
+    def renew(self):
+        return self.epoch is not None and self.acquire()
+
+    def held(self):
+        # fencing: ยังเป็นเจ้าของ epoch เดิม และเหลืออายุอย่างน้อย guard วินาที
+        # ไม่ผ่าน -> ถือว่าหลุด (ไม่ต่ออายุอีก, caller กลับไปเป็น standby แล้ว restore ใหม่)
+        if self.epoch is None:
+            return False
+        with self.lock:
+            row = self.db.execute("SELECT owner, epoch, expires FROM lease WHERE name = ?", (self.name,)).fetchone()
+        if row and row[0] == self.owner and row[1] == self.epoch and row[2] - self.clock() > self.guard:
+            return True
+        log.error(f"[LEASE] {self.owner} no longer primary (epoch {self.epoch})")
+        metrics.inc("lease_lost_total")
+        self.epoch = None
+        return False
+
+    def check(self):
+        if not self.held():
+            raise LeaseLost(f"lease '{self.name}' epoch {self.epoch} not held by {self.owner}")
+
+    def release(self):
+        if self.epoch is None:
+            return
+        try:
+            self._tx(lambda db: db.execute("UPDATE lease SET expires = 0 WHERE name = ? AND owner = ? AND epoch = ?",
+                                           (self.name, self.owner, self.epoch)))
+        except Exception as e:
+            log.warning(f"[LEASE] release error: {e}")
+        self.epoch = None
+